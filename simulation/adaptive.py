@@ -0,0 +1,199 @@
+import os
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from multiprocessing.pool import Pool
+from typing import Any, Dict, List, Optional, Sequence, TextIO
+
+from simulation.batch import output_path, run_tasks
+from simulation.cache import ResultCache, add_cache_arguments, open_cache
+from simulation.cli import add_command, add_engine_arguments, engine_options
+from simulation.config import Config
+from simulation.confidence import DEFAULT_CONFIDENCE, RunningStat
+from simulation.random import new_seed
+from simulation.simulation import Simulation
+from simulation.stats import DEFAULT_CSV_SEPARATOR, Stats
+
+DEFAULT_TARGET = 0.05
+DEFAULT_MIN_REPLICATIONS = 10
+DEFAULT_MAX_REPLICATIONS = 1000
+INTERVAL_EXTENSION = 'ci.csv'
+INTERVAL_COLUMNS = ('metric', 'replications', 'mean', 'half_width',
+                    'relative_half_width', 'lower', 'upper', 'converged')
+
+
+def metric_columns(metrics: Sequence[str]) -> List[str]:
+    """Resolve csv columns (mean_waiting_time-5) and Stats fields, which
+    stand for all their columns (mean_waiting_time_by_queue).
+    """
+    columns = Stats.get_columns()
+    result = []
+    for metric in metrics:
+        if metric in Stats.CSV_COLUMNS:
+            result.extend(Stats.expand_column(metric))
+        elif metric in columns:
+            result.append(metric)
+        else:
+            raise ValueError(f'unknown metric {metric}')
+    return result
+
+
+def converged(intervals: Dict[str, RunningStat], target: float,
+              confidence: float) -> bool:
+    return all(s.relative_half_width(confidence) <= target
+               for s in intervals.values())
+
+
+def run_adaptive(data: Dict[str, List[str]], metrics: Sequence[str],
+                 target: float = DEFAULT_TARGET,
+                 confidence: float = DEFAULT_CONFIDENCE,
+                 min_replications: int = DEFAULT_MIN_REPLICATIONS,
+                 max_replications: int = DEFAULT_MAX_REPLICATIONS,
+                 batch_size: int = None, seed: int = None,
+                 options: Dict[str, Any] = None, cache: ResultCache = None,
+                 pool: Pool = None,
+                 out: Optional[TextIO] = None) -> Dict[str, RunningStat]:
+    """Run replications in batches until the confidence interval of every
+    metric column has a relative half width of at most `target`, or until
+    `max_replications` have run.
+
+    Each replication's csv row is written to `out` as it arrives.
+    """
+    if seed is None:
+        seed = new_seed()
+    if options is None:
+        options = {}
+    if batch_size is None:
+        batch_size = os.cpu_count() or 1
+    Config().load(data)
+    intervals = {c: RunningStat() for c in metric_columns(metrics)}
+
+    replications = 0
+    size = max(min_replications, batch_size)
+    while replications < max_replications:
+        size = min(size, max_replications - replications)
+        tasks = ((0, data, seed, r, options, Simulation)
+                 for r in range(replications, replications + size))
+        for _, stats, _ in run_tasks(tasks, 1 if pool is None else None,
+                                     cache, pool):
+            row = stats.get_row()
+            for column, interval in intervals.items():
+                interval.add(row[column])
+            if out is not None:
+                out.write(stats.get_csv() + '\n')
+                out.flush()
+        replications += size
+        if converged(intervals, target, confidence):
+            break
+        size = batch_size
+    return intervals
+
+
+def get_interval_csv(intervals: Dict[str, RunningStat], target: float,
+                     confidence: float,
+                     separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+    lines = [separator.join(INTERVAL_COLUMNS)]
+    for column, interval in intervals.items():
+        half_width = interval.half_width(confidence)
+        relative = interval.relative_half_width(confidence)
+        lines.append(separator.join((
+            column, str(interval.count), format(interval.mean, '.4f'),
+            format(half_width, '.4f'), format(relative, '.4f'),
+            format(interval.mean - half_width, '.4f'),
+            format(interval.mean + half_width, '.4f'),
+            str(int(relative <= target)))))
+    return '\n'.join(lines)
+
+
+def run_adaptive_batch(scenarios: Sequence[str], metrics: Sequence[str],
+                       output_dir: str, target: float = DEFAULT_TARGET,
+                       confidence: float = DEFAULT_CONFIDENCE,
+                       min_replications: int = DEFAULT_MIN_REPLICATIONS,
+                       max_replications: int = DEFAULT_MAX_REPLICATIONS,
+                       batch_size: int = None, processes: int = None,
+                       seed: int = None, options: Dict[str, Any] = None,
+                       cache: ResultCache = None) -> Dict[str, str]:
+    """Run each scenario adaptively, writing its rows and the achieved
+    intervals next to each other, and return the interval tables.
+    """
+    if seed is None:
+        seed = new_seed()
+    if batch_size is None:
+        batch_size = processes or os.cpu_count() or 1
+    metric_columns(metrics)
+    os.makedirs(output_dir, exist_ok=True)
+    data = []
+    for scenario in scenarios:
+        with open(scenario, 'r') as file:
+            data.append(Config.read(file))
+
+    pool = None if processes == 1 else Pool(processes)
+    tables = {}
+    try:
+        for scenario, scenario_data in zip(scenarios, data):
+            with open(output_path(scenario, output_dir), 'w') as out:
+                out.write(Stats.get_csv_header() + '\n')
+                intervals = run_adaptive(
+                    scenario_data, metrics, target, confidence,
+                    min_replications, max_replications, batch_size, seed,
+                    options, cache, pool, out)
+            tables[scenario] = get_interval_csv(intervals, target,
+                                                confidence)
+            path = output_path(scenario, output_dir, INTERVAL_EXTENSION)
+            with open(path, 'w') as file:
+                file.write(tables[scenario] + '\n')
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return tables
+
+
+def add_adaptive_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'adaptive', adaptive_command,
+                         'Run replications of each scenario in batches '
+                         'until the confidence intervals of the chosen '
+                         'metrics are narrow enough.')
+    parser.add_argument('scenarios', nargs='+', metavar='SCENARIO')
+    parser.add_argument('-m', '--metric', action='append', required=True,
+                        help='csv column (mean_waiting_time-5) or stats '
+                        'field standing for all its columns '
+                        '(mean_waiting_time_by_queue)')
+    parser.add_argument('--target', type=float, default=DEFAULT_TARGET,
+                        help='relative half width at which to stop')
+    parser.add_argument('--confidence', type=float,
+                        default=DEFAULT_CONFIDENCE)
+    parser.add_argument('--min', type=int, default=DEFAULT_MIN_REPLICATIONS,
+                        dest='min_replications',
+                        help='replications run before checking the target')
+    parser.add_argument('--max', type=int, default=DEFAULT_MAX_REPLICATIONS,
+                        dest='max_replications',
+                        help='replication budget of each scenario')
+    parser.add_argument('--batch', type=int, default=None,
+                        dest='batch_size',
+                        help='replications run between checks (default: '
+                        'number of processes)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', default='output',
+                        help='directory for the per-scenario csv files and '
+                        'confidence intervals')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed shared by every replication '
+                        '(default: random)')
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+
+
+def adaptive_command(parser: ArgumentParser, args: Namespace):
+    result_cache = open_cache(args)
+    try:
+        tables = run_adaptive_batch(
+            args.scenarios, args.metric, args.output, args.target,
+            args.confidence, args.min_replications, args.max_replications,
+            args.batch_size, args.processes, args.seed,
+            engine_options(args), result_cache)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if result_cache is not None:
+            result_cache.close()
+    for scenario, table in tables.items():
+        print(f'{scenario}\n{table}\n')
@@ -0,0 +1,179 @@
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from math import inf, sqrt
+from typing import Dict, NamedTuple, Sequence, Tuple
+
+from simulation.cli import add_command
+from simulation.config import Config
+from simulation.stats import DEFAULT_CSV_SEPARATOR
+
+# Passes over the feedback between the nurses and the doctors when
+# propagating the arrival variability.
+ITERATIONS = 10
+ANALYSIS_COLUMNS = ('queue', 'workers', 'arrival_rate', 'utilization',
+                    'wait_probability', 'mean_waiting_time',
+                    'mean_queue_len')
+
+
+class Station(NamedTuple):
+    servers: int
+    arrival_rate: float
+    service_mean: float
+    service_scv: float  # Squared coefficient of variation
+    arrival_scv: float
+
+    @property
+    def utilization(self) -> float:
+        if not self.arrival_rate:
+            return 0.0
+        if not self.servers:
+            return inf
+        return self.arrival_rate * self.service_mean / self.servers
+
+    def wait_probability(self) -> float:
+        """Erlang C probability that an arrival waits, for Poisson arrivals
+        and exponential services.
+        """
+        load = self.arrival_rate * self.service_mean
+        if self.utilization >= 1:
+            return 1.0
+        blocking = 1.0
+        for k in range(1, self.servers + 1):
+            blocking = load * blocking / (k + load * blocking)
+        return blocking / (1 - self.utilization * (1 - blocking))
+
+    def mean_wait(self) -> float:
+        """Mean time in queue by the Allen-Cunneen approximation, which
+        scales the M/M/c time by the variability of arrivals and services.
+        """
+        if not self.arrival_rate:
+            return 0.0
+        if self.utilization >= 1:
+            return inf
+        load = self.arrival_rate * self.service_mean
+        return (self.wait_probability() * self.service_mean
+                / (self.servers - load)
+                * (self.arrival_scv + self.service_scv) / 2)
+
+    def departure_scv(self) -> float:
+        """Variability of the departures, as in Whitt's QNA."""
+        utilization = min(self.utilization, 1.0)
+        return (1 + (1 - utilization ** 2) * (self.arrival_scv - 1)
+                + utilization ** 2 * (self.service_scv - 1)
+                / sqrt(max(self.servers, 1)))
+
+
+class Estimate(NamedTuple):
+    workers: str
+    arrival_rate: float
+    utilization: float  # Of the workers serving the queue
+    wait_probability: float
+    mean_waiting_time: float
+    mean_queue_len: float
+
+
+def _split(scv: float, probability: float) -> float:
+    return probability * scv + 1 - probability
+
+
+def _merge(flows: Sequence[Tuple[float, float]]) -> float:
+    total = sum(rate for rate, _ in flows)
+    if not total:
+        return 1.0
+    return sum(rate * scv for rate, scv in flows) / total
+
+
+def _scv(moments: Tuple[float, float]) -> float:
+    mean, variance = moments
+    return variance / mean ** 2 if mean else 1.0
+
+
+def analyze(config: Config) -> Dict[str, Estimate]:
+    """Approximate the utilization and waiting times of every queue without
+    simulating, treating each group of workers as a G/G/c station.
+
+    The arrival variability is propagated through the routing: EMERGENCY
+    patients skip screening and a fraction P PRO goes on to the exams. The
+    nurses are a single station serving the mix of screenings and exams,
+    so both of their queues get the same waiting time.
+    """
+    arrival_mean, arrival_variance = config.t_che.moments()
+    rate = 1 / arrival_mean
+    emergency = config.p_pri[-1]
+    screening_rate = rate * (1 - emergency)
+    exams_rate = rate * config.p_pro
+    nurse_rate = screening_rate + exams_rate
+
+    register = Station(config.q_atd, rate, config.t_cad.moments()[0],
+                       _scv(config.t_cad.moments()),
+                       arrival_variance / arrival_mean ** 2)
+    register_scv = register.departure_scv()
+    screening_mean, screening_variance = config.t_tri.moments()
+    exams_mean, exams_variance = config.t_exa.moments()
+    nurse_mean = nurse_second = 0.0
+    if nurse_rate:
+        nurse_mean = (screening_rate * screening_mean
+                      + exams_rate * exams_mean) / nurse_rate
+        nurse_second = (
+            screening_rate * (screening_variance + screening_mean ** 2)
+            + exams_rate * (exams_variance + exams_mean ** 2)) / nurse_rate
+    nurse_moments = (nurse_mean, nurse_second - nurse_mean ** 2)
+
+    consultation_scv = 1.0
+    for _ in range(ITERATIONS):
+        nurses = Station(config.q_enf, nurse_rate, nurse_mean,
+                         _scv(nurse_moments), _merge((
+                             (screening_rate,
+                              _split(register_scv, 1 - emergency)),
+                             (exams_rate,
+                              _split(consultation_scv, config.p_pro)))))
+        doctors = Station(config.q_med, rate, config.t_ate.moments()[0],
+                          _scv(config.t_ate.moments()), _merge((
+                              (rate * emergency,
+                               _split(register_scv, emergency)),
+                              (screening_rate, nurses.departure_scv()))))
+        consultation_scv = doctors.departure_scv()
+
+    estimates = {}
+    for queue, workers, station, queue_rate in (
+            ('register_queue', 'Attendant', register, rate),
+            ('screening_queue', 'Nurse', nurses, screening_rate),
+            ('consultation_queue', 'Doctor', doctors, rate),
+            ('exams_queue', 'Nurse', nurses, exams_rate)):
+        wait = station.mean_wait()
+        estimates[queue] = Estimate(
+            workers, queue_rate, station.utilization,
+            station.wait_probability(), wait,
+            queue_rate * wait if queue_rate else 0.0)
+    return estimates
+
+
+def max_utilization(estimates: Dict[str, Estimate]) -> float:
+    return max(e.utilization for e in estimates.values())
+
+
+def get_analysis_csv(estimates: Dict[str, Estimate],
+                     separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+    lines = [separator.join(ANALYSIS_COLUMNS)]
+    for queue, estimate in estimates.items():
+        lines.append(separator.join((
+            queue, estimate.workers,
+            *(format(v, '.4f') for v in estimate[1:]))))
+    return '\n'.join(lines)
+
+
+def add_analyze_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'analyze', analyze_command,
+                         'Estimate the utilization and the waiting times of '
+                         'every queue with queueing formulas, without '
+                         'simulating.')
+    parser.add_argument('configs', nargs='+', metavar='CONFIG')
+
+
+def analyze_command(parser: ArgumentParser, args: Namespace):
+    for path in args.configs:
+        config = Config()
+        with open(path, 'r') as file:
+            config.parse(file)
+        if len(args.configs) > 1:
+            print(f'# {path}')
+        print(get_analysis_csv(analyze(config)))
@@ -0,0 +1,320 @@
+import json
+import os
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from multiprocessing.pool import Pool
+from typing import (Any, Dict, Iterable, Iterator, List, Optional, Sequence,
+                    TextIO, Tuple, Type)
+
+from simulation.cache import (ResultCache, add_cache_arguments, cache_key,
+                              open_cache)
+from simulation.cli import (add_command, add_engine_arguments,
+                            engine_options, numpy_choice)
+from simulation.columnar import (COLUMNAR_EXTENSION, OUTPUT_FORMATS,
+                                 SUMMARY_EXTENSION, ColumnarWriter, Summary)
+from simulation.config import Config
+from simulation.gradient import (GradientSimulation, check_gradients,
+                                 gradient_options)
+from simulation.random import new_seed
+from simulation.simulation import Simulation
+from simulation.snapshot import warm_start
+from simulation.stats import DEFAULT_CSV_SEPARATOR, Stats
+from simulation.vectorized import DEFAULT_LANES, run_vector_replications
+
+OUTPUT_EXTENSION = 'csv'
+PROFILE_EXTENSION = 'profile.jsonl'
+
+# (scenario index, config data, seed, replication, simulation options,
+#  simulation class)
+Task = Tuple[int, Dict[str, List[str]], int, int, Dict[str, Any],
+             Type[Simulation]]
+# (scenario index, replication stats, profile or simulation report or None)
+TaskResult = Tuple[int, Stats, Optional[Dict[str, Any]]]
+# (scenario index, config data, seed, first replication, lanes)
+VectorTask = Tuple[int, Dict[str, List[str]], int, int, int]
+ENGINES = ('object', 'vector')
+
+
+def simulate(config: Config, seed: int = None, replication: int = 0,
+             type_: Type[Simulation] = Simulation, **options) -> Simulation:
+    simulation = type_(config, seed, replication, **options)
+    simulation.reset()
+    simulation.run()
+    return simulation
+
+
+def run_replication(config: Config, seed: int = None, replication: int = 0,
+                    **options) -> Stats:
+    return Stats.calculate(simulate(config, seed, replication, **options))
+
+
+def run_task(task: Task) -> TaskResult:
+    index, data, seed, replication, options, type_ = task
+    if 'warm_start' in options:
+        simulation = warm_start(options['warm_start'], seed, replication)
+        simulation.run()
+    else:
+        config = Config()
+        config.load(data)
+        simulation = simulate(config, seed, replication, type_, **options)
+    stats = Stats.calculate(simulation)
+    if simulation.profiler is not None:
+        report = simulation.profiler.report(simulation)
+        report.update(seed=simulation.seed, replication=replication)
+    else:
+        report = simulation.report(stats)
+    return index, stats, report
+
+
+def run_tasks(tasks: Iterable[Task], processes: int = None,
+              cache: ResultCache = None,
+              pool: Pool = None) -> Iterator[TaskResult]:
+    """Run the tasks in a pool and yield their results in order.
+
+    With a cache, replications already stored are not run again and new
+    results are stored. Profiled and warm-started tasks, and those of
+    Simulation subclasses, always run. A pool passed in is reused instead
+    of starting a new one.
+    """
+    if cache is None:
+        yield from _run_tasks(tasks, processes, pool)
+        return
+    tasks = list(tasks)
+    keys = [None if t[5] is not Simulation or t[4].get('profile')
+            or 'warm_start' in t[4]
+            else cache_key(*t[1:5]) for t in tasks]
+    cached = [None if k is None else cache.get(k) for k in keys]
+    results = _run_tasks((t for t, s in zip(tasks, cached) if s is None),
+                         processes, pool)
+    for task, key, stats in zip(tasks, keys, cached):
+        if stats is not None:
+            yield task[0], stats, None
+            continue
+        result = next(results)
+        if key is not None:
+            cache.put(key, result[1])
+        yield result
+
+
+def _run_tasks(tasks: Iterable[Task], processes: int = None,
+               pool: Pool = None) -> Iterator[TaskResult]:
+    yield from _map(run_task, tasks, processes, pool)
+
+
+def run_vector_task(task: VectorTask) -> Tuple[int, List[Stats]]:
+    index, data, seed, first_replication, lanes = task
+    config = Config()
+    config.load(data)
+    return index, run_vector_replications(config, lanes, seed,
+                                          first_replication)
+
+
+def run_vector_tasks(inputs: Sequence[Dict[str, List[str]]],
+                     replications: int, seed: int, lanes: int = DEFAULT_LANES,
+                     processes: int = None) -> Iterator[TaskResult]:
+    """Run the replications of each config with the vector engine, `lanes`
+    replications per task, and yield their results in order.
+    """
+    tasks = ((i, data, seed, first, min(lanes, replications - first))
+             for i, data in enumerate(inputs)
+             for first in range(0, replications, lanes))
+    for index, results in _map(run_vector_task, tasks, processes):
+        for stats in results:
+            yield index, stats, None
+
+
+def _map(function, items: Iterable, processes: int = None,
+         pool: Pool = None) -> Iterator:
+    if pool is not None:
+        yield from pool.imap(function, items)
+        return
+    if processes == 1:
+        yield from map(function, items)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(function, items)
+
+
+def output_path(scenario: str, output_dir: str,
+                extension: str = OUTPUT_EXTENSION) -> str:
+    name = os.path.splitext(os.path.basename(scenario))[0]
+    return os.path.join(output_dir, f'{name}.{extension}')
+
+
+def run_batch(scenarios: Sequence[str], replications: int, output_dir: str,
+              processes: int = None, seed: int = None,
+              options: Dict[str, Any] = None, cache: ResultCache = None,
+              warm: bool = False, engine: str = 'object',
+              lanes: int = DEFAULT_LANES, output_format: str = 'csv',
+              summary: bool = False, type_: Type[Simulation] = Simulation):
+    """Run the replications of each scenario and write their rows to one
+    csv file per scenario, or to one .npy file of full precision records.
+    With `summary`, the statistics of every column across the replications
+    are also written next to it. With `warm`, the scenarios are snapshots
+    every replication starts from, with the statistics of the warm-up
+    discarded. The replications are run by `type_`; when it has a
+    report_extension, the report of every replication is written as a row
+    of that file.
+
+    The vector engine runs `lanes` replications at a time and ignores the
+    options and the cache.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine}')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format {output_format}')
+    if engine == 'vector' and warm:
+        raise ValueError('The vector engine cannot start from snapshots')
+    if type_ is not Simulation and (engine == 'vector' or warm):
+        raise ValueError(f'{type_.__name__} can neither run on the vector '
+                         'engine nor start from snapshots')
+    if seed is None:
+        seed = new_seed()
+    if options is None:
+        options = {}
+    os.makedirs(output_dir, exist_ok=True)
+    inputs = []
+    for scenario in scenarios:
+        if warm:
+            inputs.append(({}, dict(options, warm_start=scenario)))
+        else:
+            with open(scenario, 'r') as file:
+                inputs.append((Config.read(file), options))
+    if engine == 'vector':
+        results = run_vector_tasks([d for d, _ in inputs], replications,
+                                   seed, lanes, processes)
+    else:
+        tasks = ((i, d, seed, r, o, type_)
+                 for i, (d, o) in enumerate(inputs)
+                 for r in range(replications))
+        results = run_tasks(tasks, processes, cache)
+
+    report_extension = type_.report_extension
+    current, out, report_out, totals = None, None, None, None
+    try:
+        for index, stats, report in results:
+            if index != current:
+                _close(out, report_out)
+                if totals is not None:
+                    _write_summary(totals, scenarios[current], output_dir)
+                current, report_out = index, None
+                scenario = scenarios[index]
+                if output_format == 'npy':
+                    out = ColumnarWriter(output_path(scenario, output_dir,
+                                                     COLUMNAR_EXTENSION))
+                else:
+                    out = _open_output(output_path(scenario, output_dir))
+                totals = Summary() if summary else None
+                if report_extension is not None:
+                    report_out = open(output_path(
+                        scenario, output_dir, report_extension), 'w')
+                    report_out.write(DEFAULT_CSV_SEPARATOR.join(
+                        ('replication', *report)) + '\n')
+                elif options.get('profile'):
+                    report_out = open(output_path(
+                        scenario, output_dir, PROFILE_EXTENSION), 'w')
+            if output_format == 'npy':
+                out.write(stats)
+            else:
+                out.write(stats.get_csv() + '\n')
+                out.flush()
+            if totals is not None:
+                totals.add_stats(stats)
+            if report_extension is not None:
+                values = (format(v, '.6g') for v in report.values())
+                report_out.write(DEFAULT_CSV_SEPARATOR.join(
+                    (str(stats.replication), *values)) + '\n')
+            elif report_out is not None:
+                report_out.write(json.dumps(report) + '\n')
+    finally:
+        _close(out, report_out)
+    if totals is not None:
+        _write_summary(totals, scenarios[current], output_dir)
+
+
+def _write_summary(totals: Summary, scenario: str, output_dir: str):
+    with open(output_path(scenario, output_dir, SUMMARY_EXTENSION),
+              'w') as file:
+        file.write(totals.get_csv() + '\n')
+
+
+def _close(*files: Optional[TextIO]):
+    for file in files:
+        if file is not None:
+            file.close()
+
+
+def _open_output(path: str) -> TextIO:
+    out = open(path, 'w')
+    out.write(Stats.get_csv_header() + '\n')
+    return out
+
+
+def add_batch_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'batch', batch_command,
+                         'Run many replications of each scenario in a pool '
+                         'of worker processes.')
+    parser.add_argument('scenarios', nargs='+', metavar='SCENARIO')
+    parser.add_argument('-n', '--replications', type=int, default=100)
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', default='output',
+                        help='directory for the per-scenario csv files')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed shared by every replication '
+                        '(default: random)')
+    parser.add_argument('--profile', action='store_true',
+                        help='also write a json profile of every '
+                        'replication next to each csv file')
+    parser.add_argument('--gradient', action='append', default=[],
+                        metavar='PARAM',
+                        help='also write the derivatives of the mean idle '
+                        'times of every replication with respect to a '
+                        'distribution parameter, e.g. t_ate[1] (repeatable; '
+                        'the waits and queue lengths have none, as their '
+                        'perturbation analysis is biased)')
+    parser.add_argument('--warm', action='store_true',
+                        help='the scenarios are snapshots saved after a '
+                        'warm-up; every replication starts from one with '
+                        'fresh statistics and its own random streams')
+    parser.add_argument('--engine', choices=ENGINES,
+                        type=numpy_choice('vector'), default='object',
+                        help='run each replication on its own (object) or '
+                        'many in lockstep on numpy arrays (vector), which '
+                        'draws other variates and ignores the other engine '
+                        'options and the cache')
+    parser.add_argument('--lanes', type=int, default=DEFAULT_LANES,
+                        help='replications per task of the vector engine')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS,
+                        type=numpy_choice('npy'), default='csv',
+                        dest='output_format',
+                        help='rows rounded in a csv file or full precision '
+                        'records in a memory-mappable .npy file')
+    parser.add_argument('--summary', action='store_true',
+                        help='also write the mean, deviation, confidence '
+                        'interval, range and percentiles of every column')
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+
+
+def batch_command(parser: ArgumentParser, args: Namespace):
+    if args.engine == 'vector' and (args.profile or args.warm
+                                    or args.gradient):
+        parser.error('--profile, --warm and --gradient need the object '
+                     'engine')
+    if args.gradient and (args.profile or args.warm):
+        parser.error('--gradient cannot be used with --profile or --warm')
+    check_gradients(parser, args)
+    options = engine_options(args)
+    if args.profile:
+        options['profile'] = True
+    options.update(gradient_options(args))
+    result_cache = open_cache(args)
+    try:
+        run_batch(args.scenarios, args.replications, args.output,
+                  args.processes, args.seed, options, result_cache,
+                  args.warm, args.engine, args.lanes, args.output_format,
+                  args.summary,
+                  GradientSimulation if args.gradient else Simulation)
+    finally:
+        if result_cache is not None:
+            result_cache.close()
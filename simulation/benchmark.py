@@ -0,0 +1,234 @@
+import json
+import os
+import platform
+import resource
+import sys
+import tracemalloc
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from copy import deepcopy
+from glob import glob
+from multiprocessing import get_context
+from random import Random
+from time import perf_counter
+from timeit import Timer
+from typing import Any, Callable, Dict, List, Tuple
+
+from simulation.cli import add_command, add_engine_arguments, engine_options
+from simulation.config import Config
+from simulation.distribution import numpy
+from simulation.eventlist import EVENT_LISTS
+from simulation.random import make_generators
+from simulation.simulation import Simulation
+from simulation.worker import Nurse
+
+FORMAT_VERSION = 1
+MINUTES_PER_DAY = 1440
+SEED = 1
+
+# Config overrides applied to the base config to stress the engine.
+STRESS_CASES: Dict[str, Dict[str, List[str]]] = {
+    'stress-overloaded': {'t_che': ['EXP', '0.3', '0', '0']},
+    'stress-staff': {'t_tts': ['1440'], 't_che': ['EXP', '3', '0', '0'],
+                     'q_med': ['40'], 'q_enf': ['60'], 'q_atd': ['20']},
+    'stress-month': {'t_tts': ['43200']},
+}
+
+# Metrics compared against a baseline and whether higher values are better.
+CASE_METRICS = (('events_per_second', True), ('peak_traced_bytes', False))
+HOT_PATH_PENDING = 1000
+
+Case = Tuple[str, Dict[str, List[str]]]
+
+
+def load_cases(scenario_dir: str,
+               base_data: Dict[str, List[str]]) -> List[Case]:
+    cases = []
+    for path in sorted(glob(os.path.join(scenario_dir, '*.txt'))):
+        with open(path, 'r') as file:
+            cases.append((os.path.basename(path), Config.read(file)))
+    for name, overrides in STRESS_CASES.items():
+        data = deepcopy(base_data)
+        data.update(overrides)
+        cases.append((name, data))
+    return cases
+
+
+def run_case(data: Dict[str, List[str]], replications: int,
+             options: Dict[str, Any]) -> Dict[str, Any]:
+    config = Config()
+    config.load(data)
+    wall_time = 0.0
+    events = 0
+    for replication in range(replications):
+        simulation = Simulation(config, SEED, replication, **options)
+        simulation.reset()
+        start = perf_counter()
+        simulation.run()
+        wall_time += perf_counter() - start
+        events += simulation.processed_events
+
+    simulation = Simulation(config, SEED, 0, **options)
+    tracemalloc.start()
+    try:
+        simulation.reset()
+        simulation.run()
+        peak_traced = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    with get_context('spawn').Pool(1) as pool:
+        peak_rss = pool.apply(_peak_rss, (data, options))
+
+    days = replications * config.t_tts / MINUTES_PER_DAY
+    return {
+        'replications': replications,
+        'events': events,
+        'wall_time': wall_time,
+        'events_per_second': events / wall_time,
+        'wall_time_per_day': wall_time / days,
+        'peak_traced_bytes': peak_traced,
+        'peak_rss_bytes': peak_rss
+    }
+
+
+def _peak_rss(data: Dict[str, List[str]], options: Dict[str, Any]) -> int:
+    config = Config()
+    config.load(data)
+    simulation = Simulation(config, SEED, 0, **options)
+    simulation.reset()
+    simulation.run()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def hot_paths(data: Dict[str, List[str]],
+              number: int) -> Dict[str, float]:
+    config = Config()
+    config.load(data)
+    simulation = Simulation(config, SEED)
+    simulation.reset()
+    rng = Random(SEED)
+
+    queue = simulation.register_queue
+    for _ in range(HOT_PATH_PENDING):
+        queue.push(simulation.new_patient(), 0.0)
+
+    benchmarks: Dict[str, Callable[[], Any]] = {
+        'PatientQueue.pop+push':
+            lambda: queue.push(queue.pop(1.0), 1.0),
+        'Simulation.acquire_worker+release_worker':
+            lambda: simulation.release_worker(
+                simulation.acquire_worker(Nurse)),
+        'Distribution.get_value':
+            simulation.distributions['t_ate'].get_value
+    }
+    for type_ in EVENT_LISTS.values():
+        event_list = type_()
+        for item in range(HOT_PATH_PENDING):
+            event_list.push(item, rng.random() * HOT_PATH_PENDING)
+        benchmarks[f'{type_.__name__}.pop+push'] = _hold(event_list, rng)
+    if numpy is not None:
+        generator = make_generators(SEED, 0, ('t_ate',))['t_ate']
+        benchmarks['BlockDistribution.get_value'] = \
+            config.t_ate.bind_block(generator, 1024).get_value
+
+    return {name: min(Timer(function).repeat(5, number)) / number * 1e9
+            for name, function in benchmarks.items()}
+
+
+def _hold(event_list: Any, rng: Random) -> Callable[[], None]:
+    def hold():
+        item, time = event_list.pop()
+        event_list.push(item, time + rng.random() * HOT_PATH_PENDING)
+    return hold
+
+
+def run_benchmarks(cases: List[Case], base_data: Dict[str, List[str]],
+                   replications: int, options: Dict[str, Any],
+                   number: int) -> Dict[str, Any]:
+    return {
+        'format': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'options': options,
+        'cases': {name: run_case(data, replications, options)
+                  for name, data in cases},
+        'hot_paths_ns': hot_paths(base_data, number)
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float) -> List[str]:
+    """Return a message for each metric that regressed beyond threshold."""
+    regressions = []
+    for name, case in result['cases'].items():
+        old = baseline['cases'].get(name)
+        if old is None:
+            continue
+        for metric, higher_is_better in CASE_METRICS:
+            ratio = case[metric] / old[metric]
+            if higher_is_better:
+                ratio = 1 / ratio
+            if ratio > 1 + threshold:
+                regressions.append(f'{name} {metric}: {old[metric]:.6g} -> '
+                                   f'{case[metric]:.6g}')
+    for name, value in result['hot_paths_ns'].items():
+        old = baseline['hot_paths_ns'].get(name)
+        if old is not None and value > old * (1 + threshold):
+            regressions.append(f'{name}: {old:.1f} -> {value:.1f} ns/op')
+    return regressions
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    lines = [f'{"case":<24}{"events/s":>12}{"s/day":>10}'
+             f'{"traced MiB":>12}{"rss MiB":>10}']
+    for name, case in result['cases'].items():
+        lines.append(f'{name:<24}{case["events_per_second"]:>12,.0f}'
+                     f'{case["wall_time_per_day"]:>10.4f}'
+                     f'{case["peak_traced_bytes"] / 2 ** 20:>12.2f}'
+                     f'{case["peak_rss_bytes"] / 2 ** 20:>10.2f}')
+    lines.append('')
+    lines.append(f'{"hot path":<48}{"ns/op":>10}')
+    for name, value in result['hot_paths_ns'].items():
+        lines.append(f'{name:<48}{value:>10.1f}')
+    return '\n'.join(lines)
+
+
+def add_bench_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'bench', bench_command,
+                         'Benchmark the engine in-process on the scenarios '
+                         'and on synthetic stress configs.')
+    parser.add_argument('--scenarios', default='scenarios',
+                        help='directory with the scenario files')
+    parser.add_argument('--base', default='config.txt',
+                        help='config the stress cases are derived from')
+    parser.add_argument('-n', '--replications', type=int, default=3)
+    parser.add_argument('--number', type=int, default=20000,
+                        help='calls per timing of each hot path')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='file the json results are written to')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='json results of a previous run to compare to')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression')
+    add_engine_arguments(parser)
+
+
+def bench_command(parser: ArgumentParser, args: Namespace):
+    with open(args.base, 'r') as file:
+        base_data = Config.read(file)
+    result = run_benchmarks(load_cases(args.scenarios, base_data), base_data,
+                            args.replications, engine_options(args),
+                            args.number)
+    print(format_report(result))
+    with open(args.output, 'w') as file:
+        json.dump(result, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(result, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import sqlite3
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from time import time
+from typing import Any, Dict, List, Optional
+
+from simulation.cli import add_command
+from simulation.config import Config
+from simulation.simulation import ENGINE_VERSION
+from simulation.stats import Stats
+
+# Per user, following the XDG base directory spec.
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'),
+    'simulation', 'results.sqlite3')
+DEFAULT_MAX_SIZE = 256 * 2 ** 20
+# Simulation options that change the results of a replication.
+RESULT_OPTIONS = ('sampling', 'block_size', 'synchronize', 'antithetic')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    stats TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+'''
+
+
+def cache_key(data: Dict[str, List[str]], seed: int, replication: int,
+              options: Dict[str, Any]) -> str:
+    config = Config()
+    config.load(data)
+    key = {
+        'engine': ENGINE_VERSION,
+        'config': config.to_dict(),
+        'seed': seed,
+        'replication': replication,
+        'options': {o: options[o] for o in RESULT_OPTIONS if o in options}
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Stats of finished replications in a SQLite file.
+
+    Entries are evicted least recently used first once their total size
+    goes over `max_size` bytes.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(SCHEMA)
+        self._db.execute('CREATE INDEX IF NOT EXISTS results_last_used '
+                         'ON results (last_used)')
+        self._size = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def get(self, key: str) -> Optional[Stats]:
+        row = self._db.execute('SELECT stats FROM results WHERE key = ?',
+                               (key,)).fetchone()
+        if row is None:
+            return None
+        with self._db:
+            self._db.execute('UPDATE results SET last_used = ? '
+                             'WHERE key = ?', (time(), key))
+        return Stats.from_dict(json.loads(row[0]))
+
+    def put(self, key: str, stats: Stats):
+        value = json.dumps(stats.to_dict())
+        with self._db:
+            old = self._db.execute('SELECT size FROM results WHERE key = ?',
+                                   (key,)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO results '
+                             'VALUES (?, ?, ?, ?)',
+                             (key, value, len(value), time()))
+        self._size += len(value) - (old[0] if old else 0)
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        with self._db:
+            rows = self._db.execute('SELECT key, size FROM results '
+                                    'ORDER BY last_used').fetchall()
+            keys = []
+            for key, size in rows:
+                if self._size <= self.max_size:
+                    break
+                keys.append((key,))
+                self._size -= size
+            self._db.executemany('DELETE FROM results WHERE key = ?', keys)
+
+    def clear(self):
+        with self._db:
+            self._db.execute('DELETE FROM results')
+        self._db.execute('VACUUM')
+        self._size = 0
+
+    def info(self) -> Dict[str, Any]:
+        entries = self._db.execute('SELECT COUNT(*) FROM results').fetchone()
+        return {'path': self.path, 'entries': entries[0], 'size': self._size,
+                'max_size': self.max_size}
+
+    def close(self):
+        self._db.close()
+
+
+def add_cache_arguments(parser: ArgumentParser):
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH,
+                        metavar='PATH',
+                        help='file storing the results of finished '
+                        'replications, which are reused by later runs')
+    parser.add_argument('--cache-size', type=float,
+                        default=DEFAULT_MAX_SIZE / 2 ** 20, metavar='MIB',
+                        help='size above which the least recently used '
+                        'results are evicted')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='neither read nor write cached results')
+
+
+def open_cache(args: Namespace) -> Optional[ResultCache]:
+    if args.no_cache:
+        return None
+    return ResultCache(args.cache, int(args.cache_size * 2 ** 20))
+
+
+def add_cache_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'cache', cache_command,
+                         'Inspect or clear the cache of replication '
+                         'results.')
+    parser.add_argument('command', choices=('info', 'clear'))
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH,
+                        metavar='PATH', help='cache file')
+
+
+def cache_command(parser: ArgumentParser, args: Namespace):
+    result_cache = ResultCache(args.cache)
+    try:
+        if args.command == 'clear':
+            result_cache.clear()
+        info = result_cache.info()
+    finally:
+        result_cache.close()
+    print(f'{info["path"]}: {info["entries"]} results, '
+          f'{info["size"] / 2 ** 20:.2f} MiB')
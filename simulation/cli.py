@@ -0,0 +1,65 @@
+from argparse import (ArgumentParser, ArgumentTypeError, Namespace,
+                      _SubParsersAction)
+from functools import partial
+from typing import Any, Callable, Dict
+
+from simulation.distribution import numpy
+from simulation.eventlist import EVENT_LISTS
+from simulation.simulation import DEFAULT_BLOCK_SIZE, SAMPLING_MODES
+
+# Runs a command, given its parser (for errors) and the parsed arguments.
+Handler = Callable[[ArgumentParser, Namespace], None]
+
+
+def add_command(subparsers: _SubParsersAction, name: str, handler: Handler,
+                description: str) -> ArgumentParser:
+    """Add a command of python -m simulation, run by `handler`. Each module
+    adds its own commands to the parser of main.
+    """
+    parser = subparsers.add_parser(name, help=description,
+                                   description=description)
+    parser.set_defaults(handler=partial(handler, parser))
+    return parser
+
+
+def numpy_choice(*needing_numpy: str) -> Callable[[str], str]:
+    """Argument type rejecting the choices that need numpy when it is not
+    installed, as it is an optional dependency.
+    """
+    def check(value: str) -> str:
+        if value in needing_numpy and numpy is None:
+            raise ArgumentTypeError(f'{value} needs numpy, which is not '
+                                    'installed')
+        return value
+
+    return check
+
+
+def add_engine_arguments(parser: ArgumentParser):
+    parser.add_argument('--sampling', choices=SAMPLING_MODES,
+                        type=numpy_choice('block'), default='scalar',
+                        help='draw variates one at a time with the random '
+                        'module (scalar) or in numpy blocks (block)')
+    parser.add_argument('--block-size', type=int,
+                        default=DEFAULT_BLOCK_SIZE,
+                        help='variates drawn per block in block sampling')
+    parser.add_argument('--event-list', choices=tuple(EVENT_LISTS),
+                        default='heap',
+                        help='future event list backend')
+    parser.add_argument('--synchronize', action='store_true',
+                        help='draw all activity times of a patient on '
+                        'arrival, keeping common random numbers in step '
+                        'across configs')
+
+
+def engine_options(args: Namespace) -> Dict[str, Any]:
+    return {'sampling': args.sampling, 'block_size': args.block_size,
+            'event_list': args.event_list, 'synchronize': args.synchronize}
+
+
+def write_table(table: str, path: str = None):
+    """Print a table and also write it to `path`, if given."""
+    print(table)
+    if path:
+        with open(path, 'w') as file:
+            file.write(table + '\n')
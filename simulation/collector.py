@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from math import ceil, log
+from typing import Dict
+
+from simulation.patient import Patient
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error.
+
+    Values are counted in logarithmic buckets, so any quantile is reported
+    within `relative_accuracy` of the true value using memory proportional
+    to the logarithm of the value range. Values at or below `min_value` are
+    counted as zero.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01,
+                 min_value: float = 1e-6):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = log(self._gamma)
+        self._buckets: Dict[int, int] = defaultdict(int)
+        self._zero_count = 0
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def log_gamma(self) -> float:
+        return self._log_gamma
+
+    def add(self, value: float):
+        self._count += 1
+        if value <= self.min_value:
+            self._zero_count += 1
+        else:
+            self._buckets[ceil(log(value) / self._log_gamma)] += 1
+
+    def add_counts(self, zero_count: int, buckets: Dict[int, int]):
+        """Add values counted elsewhere, by bucket index, where the bucket of
+        a value is ceil(log(value) / log_gamma).
+        """
+        self._zero_count += zero_count
+        self._count += zero_count
+        for index, count in buckets.items():
+            self._buckets[index] += count
+            self._count += count
+
+    def merge(self, other: QuantileSketch):
+        if other._gamma != self._gamma:
+            raise ValueError('Sketches with different accuracy')
+        self._count += other._count
+        self._zero_count += other._zero_count
+        for index, count in other._buckets.items():
+            self._buckets[index] += count
+
+    def quantile(self, q: float) -> float:
+        if not self._count:
+            return 0.0
+        rank = q * (self._count - 1)
+        seen = self._zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                break
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+
+class PatientCollector:
+    """Running waiting time aggregates of the patients, by priority."""
+
+    def __init__(self):
+        self.count: Dict[int, int] = defaultdict(int)
+        self.total_waiting_time: Dict[int, float] = defaultdict(float)
+        self.max_waiting_time: Dict[int, float] = defaultdict(float)
+        self.waiting_time = QuantileSketch()
+
+    @property
+    def total_count(self) -> int:
+        return sum(self.count.values())
+
+    def add(self, patient: Patient):
+        priority = patient.priority.value
+        self.count[priority] += 1
+        self.total_waiting_time[priority] += patient.total_waiting_time
+        if self.max_waiting_time[priority] < patient.max_waiting_time:
+            self.max_waiting_time[priority] = patient.max_waiting_time
+        self.waiting_time.add(patient.total_waiting_time)
+
+    def merge(self, other: PatientCollector):
+        for priority, count in other.count.items():
+            self.count[priority] += count
+            self.total_waiting_time[priority] += \
+                other.total_waiting_time[priority]
+            self.max_waiting_time[priority] = max(
+                self.max_waiting_time[priority],
+                other.max_waiting_time[priority])
+        self.waiting_time.merge(other.waiting_time)
+
+    def copy(self) -> PatientCollector:
+        collector = PatientCollector()
+        collector.merge(self)
+        return collector
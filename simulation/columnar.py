@@ -0,0 +1,170 @@
+import os
+import shutil
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from math import floor
+from typing import Dict, List, Sequence, Union
+
+from simulation.cli import add_command
+from simulation.confidence import DEFAULT_CONFIDENCE, RunningStat
+from simulation.distribution import numpy
+from simulation.stats import DEFAULT_CSV_SEPARATOR, Stats
+
+COLUMNAR_EXTENSION = 'npy'
+SUMMARY_EXTENSION = 'summary.csv'
+OUTPUT_FORMATS = ('csv', 'npy')
+# Columns identifying the replication, which are not summarized.
+IDENTIFIER_COLUMNS = ('seed', 'replication')
+# Columns holding counts rather than times or ratios.
+INTEGER_COLUMNS = ('max_queue_len', *IDENTIFIER_COLUMNS)
+SUMMARY_PERCENTILES = (5, 50, 95)
+SUMMARY_COLUMNS = ('metric', 'count', 'mean', 'std', 'half_width', 'lower',
+                   'upper', 'min', 'max',
+                   *(f'p{p}' for p in SUMMARY_PERCENTILES))
+
+
+def record_dtype() -> 'numpy.dtype':
+    """One field per csv column, at full precision."""
+    if numpy is None:
+        raise RuntimeError('numpy is required for columnar output')
+    return numpy.dtype([
+        (c, numpy.int64 if c.startswith(INTEGER_COLUMNS) else numpy.float64)
+        for c in Stats.get_columns()])
+
+
+class ColumnarWriter:
+    """Writes stats as the records of a .npy file, one per replication.
+
+    Records are appended to a scratch file while the count is unknown and
+    the array header is written in front of them on close. The result
+    loads with numpy.load(path, mmap_mode='r') and slices by column name
+    without parsing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dtype = record_dtype()
+        self.count = 0
+        self._records = open(f'{path}.tmp', 'wb')
+
+    def write(self, stats: Stats):
+        record = numpy.array(tuple(stats.get_values()), dtype=self.dtype)
+        self._records.write(record.tobytes())
+        self.count += 1
+
+    def close(self):
+        if self._records.closed:
+            return
+        self._records.close()
+        with open(self.path, 'wb') as file:
+            numpy.lib.format.write_array_header_1_0(file, {
+                'descr': numpy.lib.format.dtype_to_descr(self.dtype),
+                'fortran_order': False,
+                'shape': (self.count,)})
+            with open(self._records.name, 'rb') as records:
+                shutil.copyfileobj(records, file)
+        os.remove(self._records.name)
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_columnar(path: str) -> 'numpy.ndarray':
+    if numpy is None:
+        raise RuntimeError('numpy is required for columnar output')
+    return numpy.load(path, mmap_mode='r')
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Quantile `q` of sorted values, interpolated between the closest
+    order statistics.
+    """
+    if not values:
+        return float('nan')
+    rank = q * (len(values) - 1)
+    low = floor(rank)
+    if low + 1 >= len(values):
+        return values[low]
+    return values[low] + (rank - low) * (values[low + 1] - values[low])
+
+
+class Summary:
+    """Cross-replication summary of every column but the identifiers.
+
+    The values are kept, as there is one per replication, so the
+    percentiles are exact order statistics, whatever their sign.
+    """
+
+    def __init__(self, columns: Sequence[str] = None):
+        columns = Stats.get_columns() if columns is None else list(columns)
+        # Positions of the summarized columns among the values added.
+        self.indices = [i for i, c in enumerate(columns)
+                        if c not in IDENTIFIER_COLUMNS]
+        self.columns = [columns[i] for i in self.indices]
+        self.stats = [RunningStat() for _ in self.columns]
+        self.values: List[List[Union[int, float]]] = [
+            [] for _ in self.columns]
+
+    def add(self, values: Sequence[Union[int, float]]):
+        """Add the values of one replication, in the order of the columns
+        given, identifiers included.
+        """
+        for i, index in enumerate(self.indices):
+            value = values[index]
+            self.stats[i].add(value)
+            self.values[i].append(value)
+
+    def add_stats(self, stats: Stats):
+        self.add(stats.get_values())
+
+    def add_records(self, records: 'numpy.ndarray'):
+        for record in records.tolist():
+            self.add(record)
+
+    def get_rows(self, confidence: float = DEFAULT_CONFIDENCE
+                 ) -> List[Dict[str, Union[str, int, float]]]:
+        rows = []
+        for column, stat, values in zip(self.columns, self.stats,
+                                        self.values):
+            values = sorted(values)
+            half_width = stat.half_width(confidence)
+            row = {'metric': column, 'count': stat.count, 'mean': stat.mean,
+                   'std': stat.variance ** 0.5, 'half_width': half_width,
+                   'lower': stat.mean - half_width,
+                   'upper': stat.mean + half_width,
+                   'min': values[0] if values else float('nan'),
+                   'max': values[-1] if values else float('nan')}
+            for p in SUMMARY_PERCENTILES:
+                row[f'p{p}'] = percentile(values, p / 100)
+            rows.append(row)
+        return rows
+
+    def get_csv(self, confidence: float = DEFAULT_CONFIDENCE,
+                separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+        lines = [separator.join(SUMMARY_COLUMNS)]
+        for row in self.get_rows(confidence):
+            lines.append(separator.join(
+                v if isinstance(v, str) else
+                str(v) if isinstance(v, int) else format(v, '.6g')
+                for v in row.values()))
+        return '\n'.join(lines)
+
+
+def add_summary_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'summary', summary_command,
+                         'Summarize every column of the records of .npy '
+                         'batch outputs.')
+    parser.add_argument('files', nargs='+', metavar='FILE')
+    parser.add_argument('--confidence', type=float,
+                        default=DEFAULT_CONFIDENCE)
+
+
+def summary_command(parser: ArgumentParser, args: Namespace):
+    if numpy is None:
+        parser.error('numpy is required to read .npy outputs')
+    totals = Summary()
+    for path in args.files:
+        totals.add_records(read_columnar(path))
+    print(totals.get_csv(args.confidence))
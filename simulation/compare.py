@@ -0,0 +1,154 @@
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from multiprocessing.pool import Pool
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+from simulation.adaptive import DEFAULT_CONFIDENCE, metric_columns
+from simulation.batch import run_tasks
+from simulation.cache import ResultCache, add_cache_arguments, open_cache
+from simulation.cli import (add_command, add_engine_arguments,
+                            engine_options, write_table)
+from simulation.confidence import RunningStat
+from simulation.config import Config
+from simulation.random import new_seed
+from simulation.simulation import Simulation
+from simulation.stats import DEFAULT_CSV_SEPARATOR
+
+COMPARISON_COLUMNS = ('metric', 'observations', 'mean_a', 'mean_b',
+                      'difference', 'half_width', 'lower', 'upper', 'vrf')
+
+
+class Comparison(NamedTuple):
+    observations: int
+    runs_per_observation: int
+    a: RunningStat  # Single runs of config a
+    b: RunningStat  # Single runs of config b
+    difference: RunningStat  # Observations of a minus observations of b
+
+    def variance_reduction(self) -> float:
+        """Variance of the difference of means of independent runs over the
+        variance achieved by the paired observations, at the same cost.
+        """
+        independent = self.a.variance + self.b.variance
+        paired = self.runs_per_observation * self.difference.variance
+        return independent / paired if paired else float('inf')
+
+
+def run_comparison(data_a: Dict[str, List[str]],
+                   data_b: Dict[str, List[str]], metrics: Sequence[str],
+                   observations: int, seed: int = None, common: bool = True,
+                   antithetic: bool = False, processes: int = None,
+                   options: Dict[str, Any] = None,
+                   cache: ResultCache = None) -> Dict[str, Comparison]:
+    """Run paired replications of two configs and collect, for each metric
+    column, the statistics of their differences.
+
+    With `common` random numbers both configs of an observation share the
+    seed and replication index, so every stochastic input comes from the
+    same streams; otherwise config b runs under another master seed. With
+    `antithetic` pairs each observation averages a replication and its
+    antithetic twin.
+    """
+    if seed is None:
+        seed = new_seed()
+    if options is None:
+        options = {}
+    Config().load(data_a)
+    Config().load(data_b)
+    columns = metric_columns(metrics)
+    seeds = (seed, seed if common else seed + 1)
+    variants = ([dict(options), dict(options, antithetic=True)] if antithetic
+                else [options])
+
+    tasks = [(config, data, seeds[config], replication, variant,
+              Simulation)
+             for replication in range(observations)
+             for config, data in enumerate((data_a, data_b))
+             for variant in variants]
+    runs = len(variants)
+    stats = {c: (RunningStat(), RunningStat(), RunningStat())
+             for c in columns}
+    sums = {c: [0.0, 0.0] for c in columns}
+    pool = None if processes == 1 else Pool(processes)
+    try:
+        for i, (config, result, _) in enumerate(
+                run_tasks(tasks, processes, cache, pool)):
+            row = result.get_row()
+            for column in columns:
+                stats[column][config].add(row[column])
+                sums[column][config] += row[column] / runs
+            if (i + 1) % (2 * runs) == 0:
+                for column in columns:
+                    a, b = sums[column]
+                    stats[column][2].add(a - b)
+                    sums[column] = [0.0, 0.0]
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return {c: Comparison(observations, runs, *stats[c]) for c in columns}
+
+
+def get_comparison_csv(comparisons: Dict[str, Comparison],
+                       confidence: float = DEFAULT_CONFIDENCE,
+                       separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+    lines = [separator.join(COMPARISON_COLUMNS)]
+    for column, comparison in comparisons.items():
+        difference = comparison.difference
+        half_width = difference.half_width(confidence)
+        lines.append(separator.join((
+            column, str(comparison.observations),
+            *(format(v, '.4f') for v in (
+                comparison.a.mean, comparison.b.mean, difference.mean,
+                half_width, difference.mean - half_width,
+                difference.mean + half_width,
+                comparison.variance_reduction())))))
+    return '\n'.join(lines)
+
+
+def add_compare_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'compare', compare_command,
+                         'Compare two configs on paired replications and '
+                         'report the differences of the chosen metrics.')
+    parser.add_argument('config_a')
+    parser.add_argument('config_b')
+    parser.add_argument('-m', '--metric', action='append', required=True,
+                        help='csv column or stats field, as in adaptive')
+    parser.add_argument('-n', '--observations', type=int, default=30,
+                        help='paired observations (each one antithetic '
+                        'pair of replications with --antithetic)')
+    parser.add_argument('--independent', action='store_true',
+                        help='run config b on other random numbers instead '
+                        'of the common ones')
+    parser.add_argument('--antithetic', action='store_true',
+                        help='average each replication with its antithetic '
+                        'twin')
+    parser.add_argument('--confidence', type=float,
+                        default=DEFAULT_CONFIDENCE)
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='file the comparison table is also written to')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed (default: random)')
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+
+
+def compare_command(parser: ArgumentParser, args: Namespace):
+    with open(args.config_a, 'r') as file:
+        data_a = Config.read(file)
+    with open(args.config_b, 'r') as file:
+        data_b = Config.read(file)
+    result_cache = open_cache(args)
+    try:
+        comparisons = run_comparison(data_a, data_b, args.metric,
+                                     args.observations, args.seed,
+                                     not args.independent, args.antithetic,
+                                     args.processes, engine_options(args),
+                                     result_cache)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if result_cache is not None:
+            result_cache.close()
+    write_table(get_comparison_csv(comparisons, args.confidence),
+                args.output)
@@ -0,0 +1,106 @@
+from math import expm1, inf, log, pi, sqrt, tan
+from typing import Tuple
+
+DEFAULT_CONFIDENCE = 0.95
+
+# Coefficients of Acklam's rational approximation of the normal quantile,
+# accurate to a relative error of 1.15e-9.
+NORMAL_A = (-3.969683028665376e+01, 2.209460984245205e+02,
+            -2.759285104469687e+02, 1.383577518672690e+02,
+            -3.066479806614716e+01, 2.506628277459239e+00)
+NORMAL_B = (-5.447609879822406e+01, 1.615858368580409e+02,
+            -1.556989798598866e+02, 6.680131188771972e+01,
+            -1.328068155288572e+01)
+NORMAL_C = (-7.784894002430293e-03, -3.223964580411365e-01,
+            -2.400758277161838e+00, -2.549732539343734e+00,
+            4.374664141464968e+00, 2.938163982698783e+00)
+NORMAL_D = (7.784695709041462e-03, 3.224671290700398e-01,
+            2.445134137142996e+00, 3.754408661907416e+00)
+NORMAL_LOW = 0.02425
+
+
+def _polynomial(coefficients: Tuple[float, ...], x: float) -> float:
+    result = 0.0
+    for coefficient in coefficients:
+        result = result * x + coefficient
+    return result
+
+
+def normal_quantile(p: float) -> float:
+    if not 0 < p < 1:
+        raise ValueError(f'probability {p} is not in (0, 1)')
+    if p < NORMAL_LOW or p > 1 - NORMAL_LOW:
+        q = sqrt(-2 * log(min(p, 1 - p)))
+        x = (_polynomial(NORMAL_C, q)
+             / (_polynomial(NORMAL_D, q) * q + 1))
+        return x if p < NORMAL_LOW else -x
+    q = p - 0.5
+    r = q * q
+    return (_polynomial(NORMAL_A, r) * q
+            / (_polynomial(NORMAL_B, r) * r + 1))
+
+
+def t_quantile(p: float, df: int) -> float:
+    """Quantile of Student's t distribution, by Hill's algorithm 396."""
+    if not 0 < p < 1:
+        raise ValueError(f'probability {p} is not in (0, 1)')
+    if df < 1:
+        raise ValueError(f'degrees of freedom {df} is less than 1')
+    if df == 1:
+        return tan(pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / sqrt(2 * p * (1 - p))
+
+    two_tailed = 2 * min(p, 1 - p)
+    a = 1 / (df - 0.5)
+    b = 48 / (a * a)
+    c = ((20700 * a / b - 98) * a - 16) * a + 96.36
+    d = ((94.5 / (b + c) - 3) / b + 1) * sqrt(a * pi / 2) * df
+    y = (d * two_tailed) ** (2 / df)
+    if y > 0.05 + a:
+        x = normal_quantile(two_tailed / 2)
+        y = x * x
+        if df < 5:
+            c += 0.3 * (df - 4.5) * (x + 0.6)
+        c = (((0.05 * d * x - 5) * x - 7) * x - 2) * x + b + c
+        y = (((((0.4 * y + 6.3) * y + 36) * y + 94.5) / c - y - 3) / b
+             + 1) * x
+        y = expm1(a * y * y)
+    else:
+        y = (((1 / (((df + 6) / (df * y) - 0.089 * d - 0.822)
+                    * (df + 2) * 3) + 0.5 / (df + 4)) * y - 1)
+             * (df + 1) / (df + 2) + 1 / y)
+    q = sqrt(df * y)
+    return q if p > 0.5 else -q
+
+
+class RunningStat:
+    """Mean and variance of a stream of observations (Welford)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else inf
+
+    def half_width(self, confidence: float = 0.95) -> float:
+        """Half width of the t confidence interval of the mean."""
+        if self.count < 2:
+            return inf
+        return (t_quantile((1 + confidence) / 2, self.count - 1)
+                * sqrt(self.variance / self.count))
+
+    def relative_half_width(self, confidence: float = 0.95) -> float:
+        half_width = self.half_width(confidence)
+        if half_width == 0:
+            return 0.0
+        return half_width / abs(self.mean) if self.mean else inf
@@ -1,4 +1,4 @@
-from typing import Dict, List, TextIO, Tuple
+from typing import Any, Dict, List, TextIO, Tuple
 
 from simulation.distribution import Distribution, distribution_factory
 
@@ -18,12 +18,19 @@ class Config:
     t_ate: Distribution  # Consultation time
     t_exa: Distribution  # Exams time
 
-    def parse(self, file: TextIO):
+    @staticmethod
+    def read(file: TextIO) -> Dict[str, List[str]]:
         data: Dict[str, List[str]] = {}
         for line in file:
             line = line.split('#')[0].split()
             if len(line) >= 3:
                 data['_'.join(s.lower() for s in line[:2])] = line[2:]
+        return data
+
+    def parse(self, file: TextIO):
+        self.load(Config.read(file))
+
+    def load(self, data: Dict[str, List[str]]):
         for key in ('t_tts', 'p_pro'):
             self.__dict__[key] = float(data[key][0])
         for key in ('p_pri', 'p_que'):
@@ -35,5 +42,12 @@ class Config:
             self.__dict__[key] = distribution_factory(
                 data[key][0], *(float(s) for s in data[key][1:4]))
 
-
-INSTANCE = Config()
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        for key in ('t_tts', 'p_pro', 'p_pri', 'p_que', 'q_med', 'q_enf',
+                    'q_atd'):
+            data[key] = self.__dict__[key]
+        for key in ('t_che', 't_cad', 't_tri', 't_ate', 't_exa'):
+            distribution = self.__dict__[key]
+            data[key] = [distribution.name, *distribution.params]
+        return data
@@ -1,30 +1,166 @@
-from random import (betavariate, expovariate, gammavariate, lognormvariate,
-                    normalvariate, paretovariate, triangular, uniform,
-                    weibullvariate)
-from typing import Callable
+from __future__ import annotations
+
+import random
+from math import exp, gamma, inf, lgamma, log, pi
+from typing import Callable, Dict, Iterator, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 FUNCTIONS = {
-    'BET': (betavariate, 2),
-    'EXP': (expovariate, 1),
-    'GAM': (gammavariate, 2),
-    'LOG': (lognormvariate, 2),
-    'NOR': (normalvariate, 2),
-    'PAR': (paretovariate, 1),
-    'TRI': (triangular, 3),
-    'UNI': (uniform, 2),
-    'WEI': (weibullvariate, 2)
+    'BET': ('betavariate', 2),
+    'EXP': ('expovariate', 1),
+    'GAM': ('gammavariate', 2),
+    'LOG': ('lognormvariate', 2),
+    'NOR': ('normalvariate', 2),
+    'PAR': ('paretovariate', 1),
+    'TRI': ('triangular', 3),
+    'UNI': ('uniform', 2),
+    'WEI': ('weibullvariate', 2)
+}
+
+# Block samplers taking the parameters in the same order and meaning as the
+# random module functions above.
+BLOCK_FUNCTIONS: Dict[str, Callable[..., 'numpy.ndarray']] = {
+    'BET': lambda g, n, alpha, beta: g.beta(alpha, beta, n),
+    'EXP': lambda g, n, lambd: g.exponential(1 / lambd, n),
+    'GAM': lambda g, n, alpha, beta: g.gamma(alpha, beta, n),
+    'LOG': lambda g, n, mu, sigma: g.lognormal(mu, sigma, n),
+    'NOR': lambda g, n, mu, sigma: g.normal(mu, sigma, n),
+    'PAR': lambda g, n, alpha: g.pareto(alpha, n) + 1.0,
+    'TRI': lambda g, n, low, high, mode: (
+        g.triangular(low, mode, high, n) if low != high
+        else numpy.full(n, low)),
+    'UNI': lambda g, n, a, b: g.uniform(a, b, n),
+    'WEI': lambda g, n, alpha, beta: alpha * g.weibull(beta, n)
+}
+
+# Mean and variance of the distributions above, for the same parameters.
+MOMENTS: Dict[str, Callable[..., Tuple[float, float]]] = {
+    'BET': lambda alpha, beta: (
+        alpha / (alpha + beta),
+        alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1))),
+    'EXP': lambda lambd: (1 / lambd, 1 / lambd ** 2),
+    'GAM': lambda alpha, beta: (alpha * beta, alpha * beta ** 2),
+    'LOG': lambda mu, sigma: (
+        exp(mu + sigma ** 2 / 2),
+        (exp(sigma ** 2) - 1) * exp(2 * mu + sigma ** 2)),
+    'NOR': lambda mu, sigma: (mu, sigma ** 2),
+    'PAR': lambda alpha: (
+        alpha / (alpha - 1) if alpha > 1 else inf,
+        alpha / ((alpha - 1) ** 2 * (alpha - 2)) if alpha > 2 else inf),
+    'TRI': lambda low, high, mode: (
+        (low + high + mode) / 3,
+        (low ** 2 + high ** 2 + mode ** 2 - low * high - low * mode
+         - high * mode) / 18),
+    'UNI': lambda a, b: ((a + b) / 2, (b - a) ** 2 / 12),
+    'WEI': lambda alpha, beta: (
+        alpha * gamma(1 + 1 / beta),
+        alpha ** 2 * (gamma(1 + 2 / beta) - gamma(1 + 1 / beta) ** 2))
+}
+
+
+# Parameters of the distribution of factor * X for the families closed under
+# scaling, which are the ones importance sampling can tilt.
+SCALED: Dict[str, Callable[..., Tuple[float, ...]]] = {
+    'EXP': lambda factor, lambd: (lambd / factor,),
+    'GAM': lambda factor, alpha, beta: (alpha, beta * factor),
+    'LOG': lambda factor, mu, sigma: (mu + log(factor), sigma),
+    'NOR': lambda factor, mu, sigma: (mu * factor, sigma * factor),
+    'TRI': lambda factor, low, high, mode: (
+        low * factor, high * factor, mode * factor),
+    'UNI': lambda factor, a, b: (a * factor, b * factor),
+    'WEI': lambda factor, alpha, beta: (alpha * factor, beta)
+}
+# Families above whose support moves when scaled.
+BOUNDED = ('TRI', 'UNI')
+
+
+def _triangular_log_density(x: float, low: float, high: float,
+                            mode: float) -> float:
+    if x <= low or x >= high:
+        return -inf
+    if x < mode:
+        return log(2 * (x - low) / ((high - low) * (mode - low)))
+    if x > mode:
+        return log(2 * (high - x) / ((high - low) * (high - mode)))
+    return log(2 / (high - low))
+
+
+# Log of the density at x of the distributions in SCALED.
+LOG_DENSITIES: Dict[str, Callable[..., float]] = {
+    'EXP': lambda x, lambd: log(lambd) - lambd * x if x >= 0 else -inf,
+    'GAM': lambda x, alpha, beta: (
+        (alpha - 1) * log(x) - x / beta - lgamma(alpha) - alpha * log(beta)
+        if x > 0 else -inf),
+    'LOG': lambda x, mu, sigma: (
+        -log(x * sigma) - 0.5 * log(2 * pi)
+        - (log(x) - mu) ** 2 / (2 * sigma ** 2) if x > 0 else -inf),
+    'NOR': lambda x, mu, sigma: (
+        -log(sigma) - 0.5 * log(2 * pi) - (x - mu) ** 2 / (2 * sigma ** 2)),
+    'TRI': _triangular_log_density,
+    'UNI': lambda x, a, b: -log(b - a) if a <= x <= b else -inf,
+    'WEI': lambda x, alpha, beta: (
+        log(beta / alpha) + (beta - 1) * log(x / alpha) - (x / alpha) ** beta
+        if x > 0 else -inf)
 }
 
 
 class Distribution:
-    def __init__(self, function: Callable[..., float], *args):
-        self.function = function
-        self.params = args
+    def __init__(self, name: str, *args, rng: random.Random = None):
+        self.name = name
+        self.params: Tuple[float, ...] = args
+        self.rng = rng
+        self.function = getattr(random if rng is None else rng,
+                                FUNCTIONS[name][0])
+
+    def bind(self, rng: random.Random) -> Distribution:
+        return Distribution(self.name, *self.params, rng=rng)
+
+    def bind_block(self, generator: 'numpy.random.Generator',
+                   block_size: int) -> BlockDistribution:
+        return BlockDistribution(self.name, *self.params,
+                                 generator=generator, block_size=block_size)
 
     def get_value(self) -> float:
         return self.function(*self.params)
 
+    def moments(self) -> Tuple[float, float]:
+        """Mean and variance of the values."""
+        return MOMENTS[self.name](*self.params)
+
+    def scaled(self, factor: float) -> Distribution:
+        """Distribution of the values multiplied by factor."""
+        if self.name not in SCALED:
+            raise ValueError(f'{self.name} cannot be scaled')
+        return Distribution(self.name,
+                            *SCALED[self.name](factor, *self.params))
+
+    def log_density(self, x: float) -> float:
+        return LOG_DENSITIES[self.name](x, *self.params)
+
+
+class BlockDistribution(Distribution):
+    """Distribution handing out variates pre-drawn in blocks with numpy."""
+
+    def __init__(self, name: str, *args,
+                 generator: 'numpy.random.Generator', block_size: int):
+        super().__init__(name, *args)
+        self.generator = generator
+        self.block_size = block_size
+        self._block: Iterator[float] = iter(())
+
+    def get_value(self) -> float:
+        try:
+            return next(self._block)
+        except StopIteration:
+            self._block = iter(BLOCK_FUNCTIONS[self.name](
+                self.generator, self.block_size, *self.params).tolist())
+            return next(self._block)
+
 
 def distribution_factory(name: str, *args) -> Distribution:
-    function, num_args = FUNCTIONS[name]
-    return Distribution(function, *(args[:num_args]))
+    _, num_args = FUNCTIONS[name]
+    return Distribution(name, *(args[:num_args]))
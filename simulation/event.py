@@ -1,32 +1,51 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
 from datetime import timedelta
-from typing import ClassVar
+from typing import ClassVar, TYPE_CHECKING
 
-from simulation.config import INSTANCE as CONFIG
-from simulation.distribution import Distribution
-from simulation.id import generate_id
 from simulation.patient import Patient, Priority
-from simulation.simulation import INSTANCE as SIMULATION
-from simulation.worker import Attendant, Doctor, Nurse
+from simulation.worker import Attendant, Doctor, Nurse, Worker
 
+if TYPE_CHECKING:
+    from simulation.simulation import Simulation
 
-@dataclass(eq=False)
-class Event:
-    distribution: ClassVar[Distribution] = None
-
-    id: int = field(default_factory=generate_id)
-    time: float = None
-    init_time: float = None
-    patient: Patient = None
 
-    def __post_init__(self):
-        if self.time is None:
-            self.time = self.get_random_duration() + SIMULATION.time
-            self.init_time = SIMULATION.time
-        if self.patient is not None:
-            self.patient.current_event = self
+class Event:
+    __slots__ = ('simulation', 'id', 'time', 'init_time', 'patient',
+                 'worker')
+
+    distribution: ClassVar[str] = None
+
+    simulation: Simulation
+    id: int
+    time: float
+    init_time: float
+    patient: Patient
+    worker: Worker
+
+    def __init__(self, simulation: Simulation, patient: Patient = None,
+                 worker: Worker = None, time: float = None):
+        self.simulation = simulation
+        self.id = simulation.next_event_id
+        simulation.next_event_id += 1
+        self.patient = patient
+        self.worker = worker
+        if time is None:
+            self.init_time = simulation.time
+            if patient is not None and patient.times is not None:
+                self.time = self.init_time + patient.times[self.distribution]
+            else:
+                self.time = (self.init_time + simulation.distributions[
+                    self.distribution].get_value())
+        else:
+            self.init_time = None
+            self.time = time
+        if patient is not None:
+            if patient.current_event is not None:
+                patient.last_event = patient.current_event
+            patient.current_event = self
+        if worker is not None:
+            worker.current_event = self
 
     @property
     def time_str(self):
@@ -34,177 +53,151 @@ class Event:
             str(timedelta(minutes=t)).split('.')[0].replace('days, ', '')
             for t in (self.init_time, self.time))
 
-    @classmethod
-    def get_random_duration(cls) -> float:
-        return cls.distribution.get_value()
-
     def process(self):
         raise NotImplementedError()
 
     def __str__(self):
+        worker = '' if self.worker is None else f', {self.worker}'
         return (f'{type(self).__name__}({self.id}, '
-                f'{self.time_str}, {str(self.patient)})')
+                f'{self.time_str}, {str(self.patient)}{worker})')
 
 
-@dataclass(eq=False)
 class ArrivalEndEvent(Event):
-    distribution: ClassVar[Distribution] = CONFIG.t_che
+    __slots__ = ()
+
+    distribution: ClassVar[str] = 't_che'
 
     def process(self):
-        attendant = SIMULATION.get_idle_worker(Attendant)
+        simulation = self.simulation
+        attendant = simulation.acquire_worker(Attendant)
         if attendant is not None:
-            event = RegisterEndEvent(patient=self.patient, attendant=attendant)
-            SIMULATION.push_event(event)
-            SIMULATION.register_queue.skip()
+            event = RegisterEndEvent(simulation, self.patient, attendant)
+            simulation.push_event(event)
+            simulation.register_queue.skip()
         else:
-            SIMULATION.register_queue.push(self.patient, SIMULATION.time)
+            simulation.register_queue.push(self.patient, simulation.time)
 
-        event = ArrivalEndEvent(patient=SIMULATION.new_patient())
-        SIMULATION.push_event(event)
+        event = ArrivalEndEvent(simulation, simulation.new_patient())
+        simulation.push_event(event)
 
 
-@dataclass(eq=False)
 class RegisterEndEvent(Event):
-    distribution: ClassVar[Distribution] = CONFIG.t_cad
+    __slots__ = ()
 
-    attendant: Attendant = None
+    distribution: ClassVar[str] = 't_cad'
 
-    def __post_init__(self):
-        super().__post_init__()
-        if self.attendant is not None:
-            self.attendant.current_event = self
+    @property
+    def attendant(self) -> Attendant:
+        return self.worker
 
     def process(self):
-        if SIMULATION.register_queue:
-            patient = SIMULATION.register_queue.pop(SIMULATION.time)
-            event = RegisterEndEvent(patient=patient, attendant=self.attendant)
-            SIMULATION.push_event(event)
+        simulation = self.simulation
+        if simulation.register_queue:
+            patient = simulation.register_queue.pop(simulation.time)
+            event = RegisterEndEvent(simulation, patient, self.worker)
+            simulation.push_event(event)
         else:
-            self.attendant.current_event = None
+            simulation.release_worker(self.worker)
 
-        if self.patient.priority == Priority.EMERGENCY:
-            doctor = SIMULATION.get_idle_worker(Doctor)
+        if self.patient.priority is Priority.EMERGENCY:
+            doctor = simulation.acquire_worker(Doctor)
             if doctor is not None:
-                event = ConsultationEndEvent(patient=self.patient,
-                                             doctor=doctor)
-                SIMULATION.push_event(event)
-                SIMULATION.consultation_queue.skip()
+                event = ConsultationEndEvent(simulation, self.patient, doctor)
+                simulation.push_event(event)
+                simulation.consultation_queue.skip()
             else:
-                SIMULATION.consultation_queue.push(self.patient,
-                                                   SIMULATION.time)
+                simulation.consultation_queue.push(self.patient,
+                                                   simulation.time)
         else:
-            nurse = SIMULATION.get_idle_worker(Nurse)
+            nurse = simulation.acquire_worker(Nurse)
             if nurse is not None:
-                event = ScreeningEndEvent(patient=self.patient, nurse=nurse)
-                SIMULATION.push_event(event)
-                SIMULATION.screening_queue.skip()
+                event = ScreeningEndEvent(simulation, self.patient, nurse)
+                simulation.push_event(event)
+                simulation.screening_queue.skip()
             else:
-                SIMULATION.screening_queue.push(self.patient, SIMULATION.time)
-
-    def __str__(self):
-        return (f'{type(self).__name__}({self.id}, '
-                f'{self.time_str}, {str(self.patient)}, '
-                f'{self.attendant})')
+                simulation.screening_queue.push(self.patient, simulation.time)
 
 
-@dataclass(eq=False)
 class ScreeningEndEvent(Event):
-    distribution: ClassVar[Distribution] = CONFIG.t_tri
+    __slots__ = ()
 
-    nurse: Nurse = None
+    distribution: ClassVar[str] = 't_tri'
 
-    def __post_init__(self):
-        super().__post_init__()
-        if self.nurse is not None:
-            self.nurse.current_event = self
+    @property
+    def nurse(self) -> Nurse:
+        return self.worker
 
     def process(self):
-        if SIMULATION.screening_queue:
-            patient = SIMULATION.screening_queue.pop(SIMULATION.time)
-            event = ScreeningEndEvent(patient=patient, nurse=self.nurse)
-            SIMULATION.push_event(event)
-        elif SIMULATION.exams_queue:
-            patient = SIMULATION.exams_queue.pop(SIMULATION.time)
-            event = ExamsEndEvent(patient=patient, nurse=self.nurse)
-            SIMULATION.push_event(event)
+        simulation = self.simulation
+        if simulation.screening_queue:
+            patient = simulation.screening_queue.pop(simulation.time)
+            event = ScreeningEndEvent(simulation, patient, self.worker)
+            simulation.push_event(event)
+        elif simulation.exams_queue:
+            patient = simulation.exams_queue.pop(simulation.time)
+            event = ExamsEndEvent(simulation, patient, self.worker)
+            simulation.push_event(event)
         else:
-            self.nurse.current_event = None
+            simulation.release_worker(self.worker)
 
-        doctor = SIMULATION.get_idle_worker(Doctor)
+        doctor = simulation.acquire_worker(Doctor)
         if doctor is not None:
-            event = ConsultationEndEvent(patient=self.patient, doctor=doctor)
-            SIMULATION.push_event(event)
-            SIMULATION.consultation_queue.skip()
+            event = ConsultationEndEvent(simulation, self.patient, doctor)
+            simulation.push_event(event)
+            simulation.consultation_queue.skip()
         else:
-            SIMULATION.consultation_queue.push(self.patient, SIMULATION.time)
-
-    def __str__(self):
-        return (f'{type(self).__name__}({self.id}, '
-                f'{self.time_str}, {str(self.patient)}, '
-                f'{self.nurse})')
+            simulation.consultation_queue.push(self.patient, simulation.time)
 
 
-@dataclass(eq=False)
 class ConsultationEndEvent(Event):
-    distribution: ClassVar[Distribution] = CONFIG.t_ate
+    __slots__ = ()
 
-    doctor: Doctor = None
+    distribution: ClassVar[str] = 't_ate'
 
-    def __post_init__(self):
-        super().__post_init__()
-        if self.doctor is not None:
-            self.doctor.current_event = self
+    @property
+    def doctor(self) -> Doctor:
+        return self.worker
 
     def process(self):
-        if SIMULATION.consultation_queue:
-            patient = SIMULATION.consultation_queue.pop(SIMULATION.time)
-            event = ConsultationEndEvent(patient=patient, doctor=self.doctor)
-            SIMULATION.push_event(event)
+        simulation = self.simulation
+        if simulation.consultation_queue:
+            patient = simulation.consultation_queue.pop(simulation.time)
+            event = ConsultationEndEvent(simulation, patient, self.worker)
+            simulation.push_event(event)
         else:
-            self.doctor.current_event = None
+            simulation.release_worker(self.worker)
 
         if self.patient.need_exams:
-            nurse = SIMULATION.get_idle_worker(Nurse)
+            nurse = simulation.acquire_worker(Nurse)
             if nurse is not None:
-                event = ExamsEndEvent(patient=self.patient, nurse=nurse)
-                SIMULATION.push_event(event)
-                SIMULATION.exams_queue.skip()
+                event = ExamsEndEvent(simulation, self.patient, nurse)
+                simulation.push_event(event)
+                simulation.exams_queue.skip()
             else:
-                SIMULATION.exams_queue.push(self.patient, SIMULATION.time)
+                simulation.exams_queue.push(self.patient, simulation.time)
         else:
-            self.patient.current_event = None
+            simulation.release_patient(self.patient)
 
-    def __str__(self):
-        return (f'{type(self).__name__}({self.id}, '
-                f'{self.time_str}, {str(self.patient)}, '
-                f'{self.doctor})')
 
-
-@dataclass(eq=False)
 class ExamsEndEvent(Event):
-    distribution: ClassVar[Distribution] = CONFIG.t_exa
+    __slots__ = ()
 
-    nurse: Nurse = None
+    distribution: ClassVar[str] = 't_exa'
 
-    def __post_init__(self):
-        super().__post_init__()
-        if self.nurse is not None:
-            self.nurse.current_event = self
+    @property
+    def nurse(self) -> Nurse:
+        return self.worker
 
     def process(self):
-        if SIMULATION.exams_queue:
-            patient = SIMULATION.exams_queue.pop(SIMULATION.time)
-            event = ExamsEndEvent(patient=patient, nurse=self.nurse)
-            SIMULATION.push_event(event)
-        elif SIMULATION.screening_queue:
-            patient = SIMULATION.screening_queue.pop(SIMULATION.time)
-            event = ScreeningEndEvent(patient=patient, nurse=self.nurse)
-            SIMULATION.push_event(event)
+        simulation = self.simulation
+        if simulation.exams_queue:
+            patient = simulation.exams_queue.pop(simulation.time)
+            event = ExamsEndEvent(simulation, patient, self.worker)
+            simulation.push_event(event)
+        elif simulation.screening_queue:
+            patient = simulation.screening_queue.pop(simulation.time)
+            event = ScreeningEndEvent(simulation, patient, self.worker)
+            simulation.push_event(event)
         else:
-            self.nurse.current_event = None
-        self.patient.current_event = None
-
-    def __str__(self):
-        return (f'{type(self).__name__}({self.id}, '
-                f'{self.time_str}, {str(self.patient)}, '
-                f'{self.nurse})')
+            simulation.release_worker(self.worker)
+        simulation.release_patient(self.patient)
@@ -0,0 +1,142 @@
+from bisect import insort
+from heapq import heappop, heappush, nsmallest
+from itertools import chain, count
+from math import floor
+from numbers import Number
+from typing import Dict, Generic, List, Tuple, Type, TypeVar
+
+from simulation.pqueue import PQueue
+
+T = TypeVar('T')
+
+# (time, sequence, item); the sequence number breaks ties in FIFO order and
+# keeps items from ever being compared.
+Entry = Tuple[Number, int, T]
+
+
+class HeapEventList(Generic[T]):
+    """Future event list on a binary heap of (time, sequence) keys."""
+
+    def __init__(self):
+        self._heap: List[Entry] = []
+        self._count = count()
+
+    def push(self, item: T, time: Number):
+        """Schedule an item at the given time."""
+        heappush(self._heap, (time, next(self._count), item))
+
+    def pop(self) -> Tuple[T, Number]:
+        """Remove the earliest item and return it with its time."""
+        time, _, item = heappop(self._heap)
+        return item, time
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            time, _, item = heappop(self._heap)
+        except IndexError:
+            raise StopIteration()
+        return item, time
+
+
+class CalendarQueue(Generic[T]):
+    """Future event list using Brown's calendar queue.
+
+    Items are spread over a ring of buckets, each covering `width` units of
+    time, kept sorted by (time, sequence). Enqueue and dequeue take O(1)
+    expected time when the bucket width matches the spacing of the pending
+    items, which is re-estimated every time the number of buckets doubles or
+    halves.
+    """
+
+    MIN_BUCKETS = 2
+    SAMPLE_SIZE = 25
+
+    def __init__(self, width: float = 1.0):
+        self._count = count()
+        self._size = 0
+        self._rebuild([], self.MIN_BUCKETS, width)
+
+    def push(self, item: T, time: Number):
+        """Schedule an item at the given time."""
+        self._insert((time, next(self._count), item))
+        self._size += 1
+        if self._size > 2 * self._num_buckets:
+            self._resize(2 * self._num_buckets)
+
+    def pop(self) -> Tuple[T, Number]:
+        """Remove the earliest item and return it with its time."""
+        if not self._size:
+            raise IndexError('pop from empty calendar queue')
+        buckets, num_buckets, width = \
+            self._buckets, self._num_buckets, self._width
+        current = self._current
+        for offset in range(num_buckets):
+            bucket = buckets[(current + offset) % num_buckets]
+            if bucket and bucket[0][0] < (current + offset + 1) * width:
+                self._current = current + offset
+                break
+        else:
+            bucket = min((b for b in buckets if b), key=lambda b: b[0])
+            self._current = floor(bucket[0][0] / width)
+        time, _, item = bucket.pop(0)
+        self._size -= 1
+        if (self._size < self._num_buckets // 2
+                and self._num_buckets > self.MIN_BUCKETS):
+            self._resize(self._num_buckets // 2)
+        return item, time
+
+    def _insert(self, entry: Entry):
+        position = floor(entry[0] / self._width)
+        if position < self._current:
+            self._current = position
+        insort(self._buckets[position % self._num_buckets], entry)
+
+    def _resize(self, num_buckets: int):
+        entries = list(chain.from_iterable(self._buckets))
+        self._rebuild(entries, num_buckets, self._estimate_width(entries))
+
+    def _rebuild(self, entries: List[Entry], num_buckets: int,
+                 width: float):
+        self._num_buckets = num_buckets
+        self._width = width
+        self._buckets: List[List[Entry]] = [[] for _ in range(num_buckets)]
+        self._current = (floor(min(entries)[0] / width) if entries else 0)
+        for entry in entries:
+            self._buckets[floor(entry[0] / width) % num_buckets].append(entry)
+        for bucket in self._buckets:
+            bucket.sort()
+
+    def _estimate_width(self, entries: List[Entry]) -> float:
+        times = [e[0] for e in nsmallest(self.SAMPLE_SIZE, entries)]
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        if not gaps:
+            return self._width
+        mean = sum(gaps) / len(gaps)
+        gaps = [g for g in gaps if g <= 2 * mean]
+        mean = sum(gaps) / len(gaps) if gaps else mean
+        return 3 * mean if mean > 0 else self._width
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self.pop()
+        except IndexError:
+            raise StopIteration()
+
+
+EVENT_LISTS: Dict[str, Type] = {
+    'heap': HeapEventList,
+    'calendar': CalendarQueue,
+    'pqueue': PQueue
+}
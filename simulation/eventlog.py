@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from struct import Struct
+from typing import BinaryIO, Iterator, NamedTuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from simulation.event import Event
+
+EVENT_TYPES = ('ArrivalEndEvent', 'RegisterEndEvent', 'ScreeningEndEvent',
+               'ConsultationEndEvent', 'ExamsEndEvent')
+
+# event type, event id, init_time, time, patient id, worker id
+RECORD = Struct('<BIddII')
+READ_SIZE = RECORD.size * 4096
+
+
+class Record(NamedTuple):
+    type: str
+    id: int
+    init_time: float
+    time: float
+    patient: int
+    worker: int
+
+    def __str__(self):
+        return '\t'.join(str(v) for v in self)
+
+
+class StreamEventLog:
+    """Event log writing fixed size binary records to a file."""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self._codes = {name: i for i, name in enumerate(EVENT_TYPES)}
+
+    def append(self, event: Event):
+        patient, worker = event.patient, event.worker
+        self.file.write(RECORD.pack(
+            self._codes[type(event).__name__], event.id, event.init_time,
+            event.time, 0 if patient is None else patient.id,
+            0 if worker is None else worker.id))
+
+    def close(self):
+        self.file.close()
+
+
+def read_event_log(file: BinaryIO) -> Iterator[Record]:
+    """Read the records written by a StreamEventLog."""
+    while True:
+        data = file.read(READ_SIZE)
+        if not data:
+            return
+        for code, *fields in RECORD.iter_unpack(data):
+            yield Record(EVENT_TYPES[code], *fields)
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import re
+from argparse import ArgumentParser, Namespace
+from math import log
+from typing import (Any, Callable, Dict, List, Optional, Sequence, Tuple,
+                    TYPE_CHECKING, Type)
+
+from simulation.config import Config
+from simulation.simulation import DISTRIBUTIONS, Simulation
+from simulation.stats import Stats
+from simulation.worker import Worker
+
+if TYPE_CHECKING:
+    from simulation.event import Event
+
+PARAMETER_PATTERN = re.compile(r'([a-z]+)[ _]([a-z]+)\[(\d+)\]',
+                               re.IGNORECASE)
+
+Gradient = List[float]
+
+
+def _triangular(value: float, low: float, high: float,
+                mode: float) -> Tuple[float, ...]:
+    if value <= mode:
+        d = value - low
+        return (1 - d / 2 * (1 / (high - low) + 1 / (mode - low))
+                if mode > low else 1.0,
+                d / (2 * (high - low)),
+                d / (2 * (mode - low)) if mode > low else 0.0)
+    d = high - value
+    return (d / (2 * (high - low)),
+            1 - d / 2 * (1 / (high - low) + 1 / (high - mode)),
+            d / (2 * (high - mode)))
+
+
+# Derivatives of a variate with respect to each parameter of its
+# distribution, given the variate, for the way the random module draws it
+# (inverse transform or location and scale); None where the variate has no
+# pathwise derivative.
+PATHWISE: Dict[str, Callable[..., Tuple[Optional[float], ...]]] = {
+    'BET': lambda x, alpha, beta: (None, None),
+    'EXP': lambda x, lambd: (-x / lambd,),
+    'GAM': lambda x, alpha, beta: (None, x / beta),
+    'LOG': lambda x, mu, sigma: (x, x * (log(x) - mu) / sigma),
+    'NOR': lambda x, mu, sigma: (1.0, (x - mu) / sigma),
+    'PAR': lambda x, alpha: (-x * log(x) / alpha,),
+    'TRI': _triangular,
+    'UNI': lambda x, a, b: ((b - x) / (b - a), (x - a) / (b - a)),
+    'WEI': lambda x, alpha, beta: (x / alpha, -x * log(x / alpha) / beta)
+}
+
+# Columns of the stats that have gradients. The waits and queue lengths
+# are left out: the priorities and the random choice of the queue served
+# next reorder the patients as the parameters move, which biases their
+# sample path derivatives (by about 30% on scenario 2).
+GRADIENT_FIELDS = ('mean_idle_time', 'mean_idle_time_by_type')
+
+
+def parse_gradient_parameter(spec: str) -> Tuple[str, int]:
+    """Parse KEY[INDEX], e.g. t_ate[1] for the first parameter of the
+    consultation time distribution, as in sweep.
+    """
+    match = PARAMETER_PATTERN.fullmatch(spec.strip())
+    if match is None:
+        raise ValueError(f'invalid parameter {spec!r}, expected KEY[INDEX]')
+    first, second, index = match.groups()
+    key = f'{first}_{second}'.lower()
+    if key not in DISTRIBUTIONS or int(index) < 1:
+        raise ValueError(f'{spec} is not a distribution parameter')
+    return key, int(index)
+
+
+def _add(a: Gradient, b: Gradient) -> Gradient:
+    return [x + y for x, y in zip(a, b)]
+
+
+def _sub(a: Gradient, b: Gradient) -> Gradient:
+    return [x - y for x, y in zip(a, b)]
+
+
+def _scale(a: Gradient, factor: float) -> Gradient:
+    return [x * factor for x in a]
+
+
+class GradientEstimator:
+    """Infinitesimal perturbation analysis of the stats of one run.
+
+    Every event time carries its derivatives with respect to the chosen
+    distribution parameters: those of the time it was scheduled at plus
+    those of its own variate. Idle times are differences of event times, so
+    their derivatives follow along the sample path. They are the exact
+    derivatives of the sample path, which estimate those of the expected
+    stats only as far as small changes of the parameters leave the order of
+    the events unchanged. The idle time of a group of workers is the run
+    length less their busy time, whichever patients they serve, so it holds
+    for them, but not for the waits (see GRADIENT_FIELDS).
+    """
+
+    def __init__(self, config: Config, parameters: Sequence[str]):
+        self.parameters = list(parameters)
+        self.size = len(self.parameters)
+        self.variates: Dict[str, List[Tuple[int, int]]] = {}
+        for position, spec in enumerate(self.parameters):
+            key, index = parse_gradient_parameter(spec)
+            distribution = getattr(config, key)
+            if index > len(distribution.params):
+                raise ValueError(f'{spec} is out of range, {key} has '
+                                 f'{len(distribution.params)} parameters')
+            if PATHWISE[distribution.name](
+                    *self._probe(distribution))[index - 1] is None:
+                raise ValueError(f'{spec} of {distribution.name} has no '
+                                 'pathwise derivative')
+            self.variates.setdefault(key, []).append((position, index - 1))
+        self.distributions = {k: getattr(config, k) for k in self.variates}
+        self.current = self.zero()
+        self.events: Dict[Event, Gradient] = {}
+        self.idle_since: Dict[Worker, Gradient] = {}
+        self.reset_totals()
+
+    @staticmethod
+    def _probe(distribution) -> Tuple[float, ...]:
+        return (distribution.moments()[0], *distribution.params)
+
+    def zero(self) -> Gradient:
+        return [0.0] * self.size
+
+    def reset_totals(self):
+        self.start = self.current
+        self.idle: Dict[str, Gradient] = {}
+
+    def schedule(self, event: Event):
+        gradient = self.current
+        variates = self.variates.get(event.distribution)
+        if variates is not None and event.init_time is not None:
+            distribution = self.distributions[event.distribution]
+            derivatives = PATHWISE[distribution.name](
+                event.time - event.init_time, *distribution.params)
+            gradient = list(gradient)
+            for position, index in variates:
+                gradient[position] += derivatives[index]
+        self.events[event] = gradient
+
+    def acquire(self, worker: Worker):
+        name = type(worker).__name__
+        idle = _sub(self.current, self.idle_since.pop(worker, self.start))
+        self.idle[name] = _add(self.idle.get(name, self.zero()), idle)
+
+    def release(self, worker: Worker):
+        self.idle_since[worker] = self.current
+
+    def report(self, simulation: Simulation,
+               stats: Stats) -> Dict[str, float]:
+        """Derivatives of the GRADIENT_FIELDS columns of the stats, which
+        must have been calculated at the current time, keyed
+        COLUMN/PARAMETER.
+        """
+        zero = self.zero()
+        elapsed = simulation.time - simulation.stats_start
+        d_elapsed = _sub(self.current, self.start)
+        gradients: Dict[str, Gradient] = {}
+
+        def ratio(value: float, d_value: Gradient,
+                  divisor: float) -> Gradient:
+            # Derivative of value / (divisor * elapsed).
+            return _sub(_scale(d_value, 1 / (divisor * elapsed)),
+                        _scale(d_elapsed, value / elapsed))
+
+        total_idle = zero
+        for name in Stats.WORKERS:
+            d_idle = self.idle.get(name, zero)
+            total_idle = _add(total_idle, d_idle)
+            if name in stats.workers_by_type:
+                gradients[f'mean_idle_time-{name}'] = ratio(
+                    stats.mean_idle_time_by_type[name], d_idle,
+                    stats.workers_by_type[name])
+        gradients['mean_idle_time'] = ratio(
+            stats.mean_idle_time, total_idle, stats.total_workers)
+
+        report = {}
+        for field in GRADIENT_FIELDS:
+            for column in Stats.expand_column(field):
+                for parameter, value in zip(self.parameters,
+                                            gradients[column]):
+                    report[f'{column}/{parameter}'] = value
+        return report
+
+
+class GradientSimulation(Simulation):
+    """Simulation estimating the derivatives of its idle times with respect
+    to distribution parameters, given as KEY[INDEX] (t_ate[1]), during the run.
+    """
+
+    report_extension = 'gradient.csv'
+
+    def __init__(self, config: Config, *args,
+                 gradients: Sequence[str] = (), **kwargs):
+        super().__init__(config, *args, **kwargs)
+        if self.profiler is not None:
+            raise ValueError('Gradients cannot be estimated while profiling')
+        self.gradients = list(gradients)
+
+    def reset(self, *args, **kwargs):
+        self.estimator = GradientEstimator(self.config, self.gradients)
+        super().reset(*args, **kwargs)
+
+    def reset_stats(self):
+        super().reset_stats()
+        self.estimator.reset_totals()
+
+    def push_event(self, event: Event):
+        self.estimator.schedule(event)
+        super().push_event(event)
+
+    def acquire_worker(self, type_: Type[Worker]) -> Worker:
+        worker = super().acquire_worker(type_)
+        if worker is not None:
+            self.estimator.acquire(worker)
+        return worker
+
+    def release_worker(self, worker: Worker):
+        super().release_worker(worker)
+        self.estimator.release(worker)
+
+    def flush_stats(self):
+        estimator = self.estimator
+        for worker in self.get_idle_workers(Worker):
+            estimator.acquire(worker)
+            estimator.release(worker)
+        super().flush_stats()
+
+    def event_hook(self, event: Event):
+        estimator = self.estimator
+        estimator.current = estimator.events.pop(event)
+
+    def report(self, stats: Stats) -> Dict[str, float]:
+        return self.estimator.report(self, stats)
+
+
+def check_gradients(parser: ArgumentParser, args: Namespace):
+    try:
+        for spec in args.gradient:
+            parse_gradient_parameter(spec)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+def gradient_options(args: Namespace) -> Dict[str, Any]:
+    return {'gradients': args.gradient} if args.gradient else {}
@@ -1,7 +0,0 @@
-from itertools import count
-
-ID_COUNT = count(1)
-
-
-def generate_id():
-    return next(ID_COUNT)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import re
+from math import ceil, exp, inf, log
+from random import Random
+from typing import Any, Dict, Tuple
+
+from simulation.config import Config
+from simulation.distribution import (BOUNDED, SCALED, BlockDistribution,
+                                     Distribution)
+from simulation.random import derive_seed
+from simulation.simulation import DISTRIBUTIONS, Simulation
+from simulation.stats import Stats
+
+# Probability that a run is not tilted at all, which bounds the likelihood
+# ratios.
+DEFAULT_DEFENSIVE = 0.1
+
+TILT_PATTERN = re.compile(r'\s*([a-z]+)[ _]([a-z]+)\s*=\s*([-+.\deE]+)\s*',
+                          re.IGNORECASE)
+
+Tilts = Dict[str, float]  # Scale factor of the variates by distribution key
+
+
+def parse_tilt(spec: str) -> Tuple[str, float]:
+    """Parse KEY=FACTOR, e.g. t_ate=1.2 for consultations 20% longer."""
+    match = TILT_PATTERN.fullmatch(spec)
+    if match is None:
+        raise ValueError(f'invalid tilt {spec!r}, expected KEY=FACTOR')
+    first, second, factor = match.groups()
+    key = f'{first}_{second}'.lower()
+    if key not in DISTRIBUTIONS:
+        raise ValueError(f'{key} is not a distribution')
+    if float(factor) <= 0:
+        raise ValueError(f'the tilt of {key} must be positive')
+    return key, float(factor)
+
+
+def check_tilts(config: Config, tilts: Tilts,
+                defensive: float = DEFAULT_DEFENSIVE):
+    for key in tilts:
+        name = getattr(config, key).name
+        if name not in SCALED:
+            raise ValueError(f'{key} is {name}, which cannot be tilted')
+        # Scaled values may fall outside the nominal support and the other
+        # way round, so only the untilted runs cover all of it.
+        if name in BOUNDED and not defensive:
+            raise ValueError(f'{key} is {name}, which can only be tilted '
+                             'with a defensive probability')
+
+
+class TiltedDistribution:
+    """Draws from the scaled distribution in the tilted window of the run
+    and from the nominal one elsewhere, adding the log ratio of their
+    densities at every value to the window it is drawn in.
+    """
+
+    def __init__(self, simulation: ImportanceSimulation, key: str,
+                 nominal: Distribution, tilted: Distribution):
+        self.simulation = simulation
+        self.key = key
+        self.nominal = nominal
+        self.tilted = tilted
+
+    def get_value(self) -> float:
+        simulation = self.simulation
+        window = simulation.window_at(simulation.time)
+        if window == simulation.tilted_window:
+            value = self.tilted.get_value()
+            variates = simulation.variates[self.key]
+            variates[0] += 1
+            variates[1] += value
+        else:
+            value = self.nominal.get_value()
+        simulation.log_ratios[window] += (self.tilted.log_density(value)
+                                          - self.nominal.log_density(value))
+        return value
+
+
+class ImportanceSimulation(Simulation):
+    """Simulation drawing some of its variates from scaled distributions,
+    with the likelihood ratio of the run under the nominal config.
+
+    The variates are drawn from a defensive mixture: with probability
+    `defensive` the run is not tilted, otherwise the variates drawn in one
+    window of `window` minutes, chosen at random, are scaled (all of them
+    without a window). Congestion then builds up in a short stretch of the
+    run, and the likelihood ratio against the mixture stays below
+    1 / defensive instead of multiplying over every variate of the run.
+
+    The product of the stats of the run, or of any function of them, by the
+    likelihood ratio estimates its expected value under the nominal config
+    without bias.
+    """
+
+    def __init__(self, config: Config, *args, tilts: Tilts = None,
+                 window: float = None, defensive: float = DEFAULT_DEFENSIVE,
+                 **kwargs):
+        super().__init__(config, *args, **kwargs)
+        if window is not None and window <= 0:
+            raise ValueError('The window must be positive')
+        if not 0 <= defensive < 1:
+            raise ValueError('The defensive probability must be in [0, 1)')
+        self.tilts = dict(tilts or {})
+        check_tilts(config, self.tilts, defensive)
+        self.window = window
+        self.defensive = defensive
+
+    def reset(self, *args, **kwargs):
+        self.window_count = (1 if self.window is None
+                             else max(ceil(self.config.t_tts / self.window),
+                                      1))
+        rng = Random(derive_seed(self.seed, self.replication, 'window'))
+        self.tilted_window = (None if rng.random() < self.defensive
+                              else rng.randrange(self.window_count))
+        # Log of the density ratio of each tilted mixture component to the
+        # nominal distribution, over the variates of its window.
+        self.log_ratios = [0.0] * self.window_count
+        # Count and sum of the tilted variates, for choosing the tilts.
+        self.variates = {k: [0, 0.0] for k in self.tilts}
+        super().reset(*args, **kwargs)
+
+    def _bind_streams(self):
+        super()._bind_streams()
+        for key, factor in self.tilts.items():
+            nominal = self.distributions[key]
+            tilted = getattr(self.config, key).scaled(factor)
+            if isinstance(nominal, BlockDistribution):
+                tilted = tilted.bind_block(nominal.generator,
+                                           nominal.block_size)
+            else:
+                tilted = tilted.bind(nominal.rng)
+            self.distributions[key] = TiltedDistribution(self, key, nominal,
+                                                         tilted)
+
+    def window_at(self, time: float) -> int:
+        if self.window is None:
+            return 0
+        return min(int(time // self.window), self.window_count - 1)
+
+    @property
+    def log_likelihood_ratio(self) -> float:
+        top = max(self.log_ratios)
+        if top == inf:
+            # Drawn outside of the nominal support, which only the tilted
+            # distribution of a bounded family can do.
+            return -inf
+        if top == -inf:
+            return -log(self.defensive)
+        mixture = (self.defensive * exp(-top) + (1 - self.defensive)
+                   * sum(exp(r - top) for r in self.log_ratios)
+                   / self.window_count)
+        return -top - log(mixture)
+
+    def report(self, stats: Stats) -> Dict[str, Any]:
+        return {'log_likelihood_ratio': self.log_likelihood_ratio,
+                'variates': self.variates}
+
+
+def format_tilts(tilts: Tilts) -> str:
+    return ' '.join(f'{k}={v:.4f}' for k, v in tilts.items())
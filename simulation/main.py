@@ -1,33 +1,169 @@
+import json
 import sys
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from collections import deque
+from typing import List
 
-from simulation.config import INSTANCE as CONFIG
-from simulation.simulation import INSTANCE as SIMULATION
+from simulation.adaptive import add_adaptive_command
+from simulation.analytic import add_analyze_command
+from simulation.batch import add_batch_command
+from simulation.benchmark import add_bench_command
+from simulation.cache import add_cache_command
+from simulation.cli import add_command, add_engine_arguments, engine_options
+from simulation.columnar import add_summary_command
+from simulation.compare import add_compare_command
+from simulation.config import Config
+from simulation.eventlog import StreamEventLog, read_event_log
+from simulation.gradient import (GradientSimulation, check_gradients,
+                                 gradient_options)
+from simulation.optimize import add_optimize_command
+from simulation.server import add_serve_command
+from simulation.simulation import Simulation
+from simulation.snapshot import (read_snapshot, run_with_checkpoints,
+                                 save_snapshot)
 from simulation.stats import Stats
+from simulation.steady import add_steady_command
+from simulation.sweep import add_sweep_command
+from simulation.tail import add_tail_command
 
 
-def main():
-    if '--header' in sys.argv:
-        print(Stats.get_csv_header())
-    else:
-        run_simulation()
+def main(argv: List[str] = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = ArgumentParser(prog='python -m simulation',
+                            description='Simulate an emergency department. '
+                            'Without a command, run a single replication.')
+    subparsers = parser.add_subparsers(metavar='COMMAND')
+    for add in COMMANDS:
+        add(subparsers)
+    if argv[:1] != ['-h'] and argv[:1] != ['--help'] and (
+            not argv or argv[0] not in subparsers.choices):
+        argv = ['run', *argv]
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+def add_run_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'run', run_simulation,
+                         'Run a single replication and print its statistics '
+                         'as a csv row (the default command).')
+    parser.add_argument('config', nargs='?', default='config.txt')
+    parser.add_argument('--header', action='store_true',
+                        help='print the csv header and exit')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed (default: random)')
+    parser.add_argument('--replication', type=int, default=0,
+                        help='replication index used to derive the streams')
+    add_engine_arguments(parser)
+    parser.add_argument('--event-log', choices=('off', 'ring', 'stream'),
+                        default='off',
+                        help='keep the last events in memory and print them '
+                        'to stderr (ring) or write every event to a binary '
+                        'file (stream)')
+    parser.add_argument('--event-log-size', type=int, default=1000,
+                        help='number of events kept by the ring buffer')
+    parser.add_argument('--event-log-file', default='events.bin',
+                        help='file written by the stream event log')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help='count and time the processed events and write '
+                        'the json report to FILE (default: stderr)')
+    parser.add_argument('--gradient', action='append', default=[],
+                        metavar='PARAM',
+                        help='estimate the derivatives of the mean idle '
+                        'times with respect to a distribution parameter, '
+                        'e.g. t_ate[1], and print them to stderr '
+                        '(repeatable; the waits and queue lengths have none, '
+                        'as their perturbation analysis is biased)')
+    parser.add_argument('--until', type=float, default=None,
+                        help='stop at this simulation time instead of at '
+                        'T TTS')
+    parser.add_argument('--resume', metavar='SNAPSHOT',
+                        help='carry on from a saved state instead of '
+                        'starting from the config (the config, seed and '
+                        'engine options are those of the snapshot)')
+    parser.add_argument('--save', metavar='SNAPSHOT',
+                        help='save the final state, e.g. to warm start '
+                        'replications with batch --warm')
+    parser.add_argument('--checkpoint', metavar='SNAPSHOT',
+                        help='save the state periodically while running')
+    parser.add_argument('--checkpoint-every', type=float, default=1440.0,
+                        metavar='MINUTES',
+                        help='simulation time between checkpoints')
 
 
-def run_simulation():
+def run_simulation(parser: ArgumentParser, args: Namespace):
+    if args.header:
+        print(Stats.get_csv_header())
+        return
+    if args.gradient and (args.profile is not None or args.resume):
+        parser.error('--gradient cannot be used with --profile or --resume')
+    check_gradients(parser, args)
+
+    event_log = None
+    if args.event_log == 'ring':
+        event_log = deque(maxlen=args.event_log_size)
+    elif args.event_log == 'stream':
+        event_log = StreamEventLog(open(args.event_log_file, 'wb'))
     try:
-        filename = sys.argv[1]
-    except IndexError:
-        filename = 'config.txt'
-    with open(filename, 'r') as file:
-        CONFIG.parse(file)
-
-    from simulation.event import ArrivalEndEvent
-
-    SIMULATION.reset(lambda: ArrivalEndEvent(patient=SIMULATION.new_patient()))
-    SIMULATION.run()
-    # print('\n'.join(map(str, SIMULATION.event_log)))
-    stats = Stats.calculate(SIMULATION)
+        if args.resume:
+            simulation = read_snapshot(args.resume)
+            simulation.event_log = event_log
+        else:
+            config = Config()
+            with open(args.config, 'r') as file:
+                config.parse(file)
+            type_ = GradientSimulation if args.gradient else Simulation
+            simulation = type_(config, args.seed, args.replication,
+                               event_log=event_log,
+                               profile=args.profile is not None,
+                               **gradient_options(args),
+                               **engine_options(args))
+            simulation.reset()
+        if args.checkpoint:
+            run_with_checkpoints(simulation, args.checkpoint,
+                                 args.checkpoint_every, args.until)
+        else:
+            simulation.run(args.until)
+        if args.save:
+            save_snapshot(simulation, args.save)
+        stats = Stats.calculate(simulation)
+    finally:
+        if isinstance(event_log, StreamEventLog):
+            event_log.close()
+    if args.event_log == 'ring':
+        print('\n'.join(map(str, event_log)), file=sys.stderr)
     # print(stats)
     print(stats.get_csv())
+    if args.gradient:
+        for column, value in simulation.report(stats).items():
+            print(f'{column}\t{value:.6g}', file=sys.stderr)
+    if args.profile is not None and simulation.profiler is not None:
+        report = simulation.profiler.report(simulation)
+        if args.profile == '-':
+            json.dump(report, sys.stderr, indent=2)
+        else:
+            with open(args.profile, 'w') as file:
+                json.dump(report, file, indent=2)
+
+
+def add_events_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'events', print_events,
+                         'Print the records of a streamed event log.')
+    parser.add_argument('file')
+
+
+def print_events(parser: ArgumentParser, args: Namespace):
+    with open(args.file, 'rb') as file:
+        for record in read_event_log(file):
+            print(record)
+
+
+# Adders of the commands, each defined next to the feature it runs.
+COMMANDS = (add_run_command, add_events_command, add_batch_command,
+            add_bench_command, add_sweep_command, add_cache_command,
+            add_adaptive_command, add_compare_command, add_steady_command,
+            add_serve_command, add_summary_command, add_analyze_command,
+            add_optimize_command, add_tail_command)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,403 @@
+import re
+import sys
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from math import ceil
+from multiprocessing.pool import Pool
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from simulation.adaptive import DEFAULT_CONFIDENCE, metric_columns
+from simulation.analytic import analyze, max_utilization
+from simulation.batch import run_tasks
+from simulation.cache import ResultCache, add_cache_arguments, open_cache
+from simulation.cli import (add_command, add_engine_arguments,
+                            engine_options, write_table)
+from simulation.confidence import RunningStat
+from simulation.config import Config
+from simulation.random import new_seed
+from simulation.simulation import Simulation
+from simulation.stats import DEFAULT_CSV_SEPARATOR
+
+STAFF_KEYS = ('q_med', 'q_enf', 'q_atd')
+DEFAULT_FIRST_BATCH = 10
+DEFAULT_REPLICATION_LIMIT = 200
+DEFAULT_MAX_STAFF = 50
+
+CONSTRAINT_PATTERN = re.compile(r'\s*([\w-]+)\s*<=?\s*([-+.\deE]+)\s*')
+
+Staffing = Tuple[int, int, int]  # In the order of STAFF_KEYS
+
+
+class Constraint(NamedTuple):
+    column: str
+    limit: float  # Upper bound on the expected value of the column
+
+
+def parse_constraints(spec: str) -> List[Constraint]:
+    """Parse METRIC<=LIMIT, where a stats field stands for all its columns
+    (max_waiting_time_by_priority<=60).
+    """
+    match = CONSTRAINT_PATTERN.fullmatch(spec)
+    if match is None:
+        raise ValueError(f'invalid constraint {spec!r}, expected '
+                         'METRIC<=LIMIT')
+    metric, limit = match.groups()
+    return [Constraint(c, float(limit)) for c in metric_columns([metric])]
+
+
+class Evaluation:
+    """Replications of one staffing and the feasibility decided from them.
+
+    The staffing is feasible once the upper confidence limit of every
+    constraint column is within its limit, and infeasible once the lower
+    limit of some column is above it. The limits are checked after every
+    batch, so their confidence must cover all the looks. Staffings still
+    undecided after the maximum number of replications, or unstable by the
+    analytic estimate, are taken as infeasible.
+    """
+
+    def __init__(self, staffing: Staffing, cost: float,
+                 constraints: Sequence[Constraint]):
+        self.staffing = staffing
+        self.cost = cost
+        self.constraints = constraints
+        self.stats = {c.column: RunningStat() for c in constraints}
+        self.feasible: Optional[bool] = None
+        self.screened = False
+
+    @property
+    def replications(self) -> int:
+        return next(iter(self.stats.values())).count
+
+    def add(self, row: Dict[str, float]):
+        for column, stat in self.stats.items():
+            stat.add(row[column])
+
+    def decide(self, confidence: float, max_replications: int):
+        bounds = [(c.limit, *self.interval(c.column, confidence))
+                  for c in self.constraints]
+        if any(lower > limit for limit, lower, _ in bounds):
+            self.feasible = False
+        elif all(upper <= limit for limit, _, upper in bounds):
+            self.feasible = True
+        elif self.replications >= max_replications:
+            self.feasible = False
+
+    def interval(self, column: str,
+                 confidence: float) -> Tuple[float, float]:
+        stat = self.stats[column]
+        half_width = stat.half_width(confidence)
+        return stat.mean - half_width, stat.mean + half_width
+
+    def slack(self) -> float:
+        """Largest ratio of a constraint mean to its limit."""
+        return max(self.stats[c.column].mean / c.limit if c.limit else
+                   float('inf') for c in self.constraints)
+
+
+class Optimization(NamedTuple):
+    best: Optional[Evaluation]  # None when no feasible staffing was found
+    evaluations: List[Evaluation]  # In the order they were first visited
+    confidence: float  # Per staffing, for all its constraints and looks
+    interval_confidence: float  # Of each confidence interval checked
+
+    @property
+    def replications(self) -> int:
+        return sum(e.replications for e in self.evaluations)
+
+
+class _Optimizer:
+    def __init__(self, base_data: Dict[str, List[str]],
+                 constraints: Sequence[Constraint], costs: Dict[str, float],
+                 bounds: Dict[str, Tuple[int, int]], confidence: float,
+                 min_replications: int, max_replications: int,
+                 batch_size: int, seed: int, options: Dict[str, Any],
+                 processes: Optional[int], cache: Optional[ResultCache],
+                 pool: Optional[Pool]):
+        self.base_data = base_data
+        self.constraints = constraints
+        self.costs = costs
+        self.bounds = bounds
+        # Bonferroni split of the error among the constraints and the
+        # looks at each of them, one per batch of replications.
+        looks = 1 + max(ceil((max_replications - min_replications)
+                             / batch_size), 0)
+        self.confidence = 1 - (1 - confidence) / (len(constraints) * looks)
+        self.min_replications = min_replications
+        self.max_replications = max_replications
+        self.batch_size = batch_size
+        self.seed = seed
+        self.options = options
+        self.processes = processes
+        self.cache = cache
+        self.pool = pool
+        self.evaluations: Dict[Staffing, Evaluation] = {}
+
+    def data(self, staffing: Staffing) -> Dict[str, List[str]]:
+        data = {key: list(values) for key, values in self.base_data.items()}
+        for key, value in zip(STAFF_KEYS, staffing):
+            data[key] = [str(value)]
+        return data
+
+    def cost(self, staffing: Staffing) -> float:
+        return sum(self.costs[k] * v for k, v in zip(STAFF_KEYS, staffing))
+
+    def evaluate(self, candidates: Sequence[Staffing]) -> List[Evaluation]:
+        """Run replications of the undecided candidates, one batch each per
+        round on the shared pool, until all are decided.
+        """
+        evaluations = []
+        for staffing in candidates:
+            if staffing not in self.evaluations:
+                evaluation = Evaluation(staffing, self.cost(staffing),
+                                        self.constraints)
+                config = Config()
+                config.load(self.data(staffing))
+                if max_utilization(analyze(config)) >= 1:
+                    evaluation.screened = True
+                    evaluation.feasible = False
+                self.evaluations[staffing] = evaluation
+            evaluations.append(self.evaluations[staffing])
+
+        while True:
+            pending = [e for e in evaluations if e.feasible is None]
+            if not pending:
+                return evaluations
+            tasks = []
+            for index, evaluation in enumerate(pending):
+                first = evaluation.replications
+                size = (self.min_replications if not first
+                        else self.batch_size)
+                size = min(size, self.max_replications - first)
+                tasks.extend((index, self.data(evaluation.staffing),
+                              self.seed, r, self.options, Simulation)
+                             for r in range(first, first + size))
+            for index, stats, _ in run_tasks(tasks, self.processes,
+                                             self.cache, self.pool):
+                pending[index].add(stats.get_row())
+            for evaluation in pending:
+                evaluation.decide(self.confidence, self.max_replications)
+
+    def neighbors(self, staffing: Staffing,
+                  moves: Sequence[Tuple[int, ...]]) -> List[Staffing]:
+        result = []
+        for move in moves:
+            candidate = tuple(v + d for v, d in zip(staffing, move))
+            if all(self.bounds[k][0] <= v <= self.bounds[k][1]
+                   for k, v in zip(STAFF_KEYS, candidate)):
+                result.append(candidate)
+        return result
+
+    def search(self, start: Staffing) -> Optional[Evaluation]:
+        size = len(STAFF_KEYS)
+        unit = [tuple(int(i == j) for j in range(size)) for i in range(size)]
+        increases = unit
+        decreases = [tuple(-d for d in move) for move in unit]
+        swaps = [tuple(a - b for a, b in zip(up, down))
+                 for up in unit for down in unit if up != down]
+
+        current = self.evaluate([start])[0]
+        # Add staff until feasible, where it relieves the constraints most.
+        while not current.feasible:
+            candidates = self.evaluate(self.neighbors(current.staffing,
+                                                      increases))
+            if not candidates:
+                return None
+            feasible = [e for e in candidates if e.feasible]
+            if feasible:
+                current = min(feasible, key=lambda e: (e.cost, e.slack()))
+            else:
+                current = min(candidates, key=lambda e: (e.screened,
+                                                         e.slack()))
+        # Then take the cheapest feasible neighbor while it lowers the cost.
+        while True:
+            candidates = [
+                s for s in self.neighbors(current.staffing,
+                                          decreases + swaps)
+                if self.cost(s) < current.cost]
+            feasible = [e for e in self.evaluate(candidates) if e.feasible]
+            if not feasible:
+                return current
+            current = min(feasible, key=lambda e: (e.cost, e.slack()))
+
+
+def run_optimizer(base_data: Dict[str, List[str]],
+                  constraints: Sequence[Constraint],
+                  costs: Dict[str, float] = None,
+                  bounds: Dict[str, Tuple[int, int]] = None,
+                  confidence: float = DEFAULT_CONFIDENCE,
+                  min_replications: int = DEFAULT_FIRST_BATCH,
+                  max_replications: int = DEFAULT_REPLICATION_LIMIT,
+                  batch_size: int = None, seed: int = None,
+                  options: Dict[str, Any] = None, processes: int = None,
+                  cache: ResultCache = None) -> Optimization:
+    """Search the staffing of the base config for a cheap one whose
+    expected constraint columns are all within their limits.
+
+    The search adds staff from the base staffing until it is feasible and
+    then moves to cheaper feasible neighbors (one less worker, or one
+    worker traded for a cheaper one) until none is left, so the result is
+    only the cheapest in its neighborhood. Staffings are compared under
+    common random numbers and the unstable ones are screened out
+    analytically. The decision on each staffing is wrong with probability
+    at most 1 - `confidence`, over all its constraints and looks; the
+    staffings visited are not covered together.
+    """
+    if not constraints:
+        raise ValueError('At least one constraint is required')
+    if seed is None:
+        seed = new_seed()
+    if options is None:
+        options = {}
+    if batch_size is None:
+        batch_size = min_replications
+    costs = {k: 1.0 for k in STAFF_KEYS} if costs is None else {
+        k: costs.get(k, 1.0) for k in STAFF_KEYS}
+    bounds = {k: (bounds or {}).get(k, (1, DEFAULT_MAX_STAFF))
+              for k in STAFF_KEYS}
+    config = Config()
+    config.load(base_data)
+    start = tuple(min(max(getattr(config, k), bounds[k][0]), bounds[k][1])
+                  for k in STAFF_KEYS)
+
+    pool = None if processes == 1 else Pool(processes)
+    try:
+        optimizer = _Optimizer(base_data, constraints, costs, bounds,
+                               confidence, min_replications,
+                               max_replications, batch_size, seed, options,
+                               processes, cache, pool)
+        best = optimizer.search(start)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return Optimization(best, list(optimizer.evaluations.values()),
+                        confidence, optimizer.confidence)
+
+
+def get_optimization_csv(optimization: Optimization,
+                         separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+    """One row per staffing visited, with the mean and the upper confidence
+    limit of each constraint column; the chosen one is marked.
+    """
+    evaluations = optimization.evaluations
+    if not evaluations:
+        return ''
+    columns = [c.column for c in evaluations[0].constraints]
+    confidence = optimization.interval_confidence
+    lines = [separator.join((*STAFF_KEYS, 'cost', 'replications', 'status',
+                             *(f'{c}{s}' for c in columns
+                               for s in ('', ':upper')), 'chosen'))]
+    for evaluation in evaluations:
+        if evaluation.screened:
+            status = 'unstable'
+        else:
+            status = 'feasible' if evaluation.feasible else 'infeasible'
+        values = []
+        for column in columns:
+            if evaluation.replications:
+                values.append(format(evaluation.stats[column].mean, '.4f'))
+                values.append(format(
+                    evaluation.interval(column, confidence)[1], '.4f'))
+            else:
+                values.extend(('', ''))
+        lines.append(separator.join((
+            *map(str, evaluation.staffing), format(evaluation.cost, 'g'),
+            str(evaluation.replications), status, *values,
+            str(int(evaluation is optimization.best)))))
+    return '\n'.join(lines)
+
+
+def add_optimize_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'optimize', optimize_command,
+                         'Search for the cheapest staffing whose expected '
+                         'metrics are within limits, running replications '
+                         'of each staffing visited until its feasibility is '
+                         'decided.')
+    parser.add_argument('base', nargs='?', default='config.txt')
+    parser.add_argument('-c', '--constraint', action='append', required=True,
+                        metavar='METRIC<=LIMIT',
+                        help='limit on the mean of a csv column or of all '
+                        'the columns of a stats field, e.g. '
+                        'max_waiting_time-5<=30')
+    parser.add_argument('--cost', action='append', default=[],
+                        metavar='KEY=COST',
+                        help='cost of one worker of a staff key (default 1)')
+    parser.add_argument('--min', action='append', default=[],
+                        metavar='KEY=N', help='least staff of a key')
+    parser.add_argument('--max', action='append', default=[],
+                        metavar='KEY=N', help='most staff of a key')
+    parser.add_argument('--confidence', type=float,
+                        default=DEFAULT_CONFIDENCE,
+                        help='probability that the decision on each '
+                        'staffing is right for all the constraints')
+    parser.add_argument('--min-replications', type=int,
+                        default=DEFAULT_FIRST_BATCH,
+                        help='first batch of replications of each staffing')
+    parser.add_argument('--max-replications', type=int,
+                        default=DEFAULT_REPLICATION_LIMIT,
+                        help='replications after which an undecided '
+                        'staffing is taken as infeasible')
+    parser.add_argument('--batch', type=int, default=None,
+                        dest='batch_size',
+                        help='replications added per round to each '
+                        'undecided staffing (default: --min-replications)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='file the table of visited staffings is also '
+                        'written to')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed shared by every staffing '
+                        '(default: random)')
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+
+
+def optimize_command(parser: ArgumentParser, args: Namespace):
+    try:
+        constraints = [c for spec in args.constraint
+                       for c in parse_constraints(spec)]
+        costs = {k: float(v) for k, v in _staff_values(args.cost)}
+        bounds = {k: [1, DEFAULT_MAX_STAFF] for k in STAFF_KEYS}
+        for k, v in _staff_values(args.min):
+            bounds[k][0] = int(v)
+        for k, v in _staff_values(args.max):
+            bounds[k][1] = int(v)
+    except ValueError as e:
+        parser.error(str(e))
+    with open(args.base, 'r') as file:
+        base_data = Config.read(file)
+    result_cache = open_cache(args)
+    try:
+        optimization = run_optimizer(
+            base_data, constraints, costs,
+            {k: tuple(b) for k, b in bounds.items()}, args.confidence,
+            args.min_replications, args.max_replications, args.batch_size,
+            args.seed,
+            engine_options(args), args.processes, result_cache)
+    finally:
+        if result_cache is not None:
+            result_cache.close()
+    write_table(get_optimization_csv(optimization), args.output)
+    best = optimization.best
+    if best is None:
+        print('No feasible staffing found', file=sys.stderr)
+        sys.exit(1)
+    staffing = ' '.join(f'{k}={v}'
+                        for k, v in zip(STAFF_KEYS, best.staffing))
+    print(f'Cheapest staffing found {staffing} (cost {best.cost:g}), '
+          f'feasible with confidence {optimization.confidence:g}; '
+          f'{optimization.replications} replications over '
+          f'{len(optimization.evaluations)} staffings (local search, '
+          'cheaper staffings may exist)', file=sys.stderr)
+
+
+def _staff_values(specs: List[str]) -> List[Tuple[str, str]]:
+    values = []
+    for spec in specs:
+        key, _, value = spec.partition('=')
+        key = key.strip().lower().replace(' ', '_')
+        if key not in STAFF_KEYS or not value:
+            raise ValueError(f'invalid staff value {spec!r}, expected KEY=N '
+                             f'with KEY in {", ".join(STAFF_KEYS)}')
+        values.append((key, value))
+    return values
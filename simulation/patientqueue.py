@@ -1,21 +1,43 @@
 from itertools import chain
-from typing import Iterator
+from random import Random
+from typing import Iterator, Sequence
 
-from simulation.config import INSTANCE as CONFIG
-from simulation.patient import Patient, Priority
-from simulation.random import roulette
+from simulation.patient import Patient
+from simulation.random import AliasTable
+
+
+class QueueSelector:
+    """Alias tables for every set of non-empty priority sub-queues.
+
+    The table for a set of sub-queues is indexed by a bit mask with the bit
+    `i` set when sub-queue `i` is not empty.
+    """
+
+    def __init__(self, weights: Sequence[float]):
+        self.weights = tuple(weights)
+        self.tables = [None]
+        for mask in range(1, 1 << len(self.weights)):
+            indexes = [i for i in range(len(self.weights)) if mask >> i & 1]
+            subset = [self.weights[i] for i in indexes]
+            if not sum(subset):
+                subset = [1.0] + [0.0] * (len(subset) - 1)
+            self.tables.append(AliasTable(subset, indexes))
 
 
 class PatientQueue:
-    def __init__(self):
+    def __init__(self, selector: QueueSelector, rng: Random):
+        self.selector = selector
+        self.rng = rng
+        self._mask = 0
         self._count = 0
         self._len = 0
         self._max_len = 0
         self._len_time = 0.0
-        self._entered = {}
+        self._last_time = 0.0
+        self._start_time = 0.0
         self._max_waiting_time = 0.0
         self._total_waiting_time = 0.0
-        self.queues = tuple([] for _ in CONFIG.p_que)
+        self.queues = tuple([] for _ in selector.weights)
 
     @property
     def total_patient_count(self) -> int:
@@ -34,50 +56,74 @@ class PatientQueue:
         return self._max_len
 
     def push(self, patient: Patient, time: float):
-        patient.current_event = None
-        self.queues[patient.priority.value - 1].append(patient)
+        if patient.current_event is not None:
+            patient.last_event = patient.current_event
+            patient.current_event = None
+        self._update_len_time(time)
+        index = patient.priority.value - 1
+        self.queues[index].append(patient)
+        self._mask |= 1 << index
         self._count += 1
         self._len += 1
         self._max_len = max(self._len, self._max_len)
-        self._entered[patient] = time
+        patient.queued_since = time
 
     def skip(self):
         self._count += 1
 
     def pop(self, time: float) -> Patient:
-        weights = [p for p, q in zip(CONFIG.p_que, self.queues) if q]
-        values = [p for p, q in zip(Priority, self.queues) if q]
-        if not weights:
+        if not self._mask:
             raise Exception('Empty queue')
-        patient = None
-        while patient is None:
-            selected = roulette(weights, values).value - 1
-            if self.queues[selected]:
-                self._len -= 1
-                patient = self.queues[selected].pop()
-        waiting = time - self._entered[patient]
+        selected = self.selector.tables[self._mask].sample(self.rng)
+        queue = self.queues[selected]
+        patient = queue.pop()
+        if not queue:
+            self._mask &= ~(1 << selected)
+        self._update_len_time(time)
+        self._len -= 1
+        waiting = time - patient.queued_since
         if self._max_waiting_time < waiting:
             self._max_waiting_time = waiting
         self._total_waiting_time += waiting
+        patient.total_waiting_time += waiting
         if patient.max_waiting_time < waiting:
             patient.max_waiting_time = waiting
-        del self._entered[patient]
+        patient.queued_since = None
         return patient
 
     def peek_all(self) -> Iterator[Patient]:
         yield from chain.from_iterable(self.queues)
 
-    def update_stats(self, delta: float):
-        self._len_time += self._len * delta
+    def flush(self, time: float):
+        self._update_len_time(time)
         for patient in self.peek_all():
-            patient.total_waiting_time += delta
+            patient.total_waiting_time += time - patient.queued_since
+            patient.queued_since = time
+
+    def reset_stats(self, time: float):
+        """Discard the statistics gathered before `time`."""
+        self._count = 0
+        self._max_len = self._len
+        self._len_time = 0.0
+        self._last_time = time
+        self._start_time = time
+        self._max_waiting_time = 0.0
+        self._total_waiting_time = 0.0
+
+    def len_time(self, time: float) -> float:
+        """Integral of the queue length over time, up to `time`."""
+        return self._len_time + self._len * (time - self._last_time)
 
     def mean_len(self, total_time: float) -> float:
-        return self._len_time / total_time
+        return self.len_time(total_time) / (total_time - self._start_time)
 
     def mean_waiting_time(self) -> float:
         return self._total_waiting_time / self._count
 
+    def _update_len_time(self, time: float):
+        self._len_time += self._len * (time - self._last_time)
+        self._last_time = time
+
     def __len__(self):
         return self._len
 
@@ -58,6 +58,9 @@ class PQueue(Generic[T]):
         """Return the number of elements of the priority queue."""
         return len(self._dict)
 
+    def __len__(self):
+        return len(self._dict)
+
     def __iter__(self):
         return self
 
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from time import perf_counter
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Tuple,
+                    TYPE_CHECKING)
+
+if TYPE_CHECKING:
+    from simulation.event import Event
+    from simulation.simulation import Simulation
+
+DEFAULT_SAMPLE_INTERVAL = 60.0
+
+
+class Profiler:
+    """Counters and timings collected by Simulation.run in profile mode,
+    which pops and processes the events through the timed wrappers below.
+
+    Event processing times exclude the event list operations done while
+    processing, which are accounted in the event list times instead.
+    """
+
+    def __init__(self, sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.process_times: Dict[str, float] = defaultdict(float)
+        self.push_count = 0
+        self.push_time = 0.0
+        self.pop_count = 0
+        self.pop_time = 0.0
+        self.stats_time = 0.0
+        self.run_time = 0.0
+        self.peak_pending = 0
+        self.samples: List[List[float]] = []
+        self._next_sample = 0.0
+
+    def record(self, event: Event, elapsed: float):
+        name = type(event).__name__
+        self.counts[name] += 1
+        self.process_times[name] += elapsed
+
+    def sample(self, simulation: Simulation):
+        while simulation.time >= self._next_sample:
+            self.samples.append([self._next_sample,
+                                 len(simulation.event_queue)]
+                                + [len(q) for q in simulation.queues])
+            self._next_sample += self.sample_interval
+
+    def timed_push(self, simulation: Simulation):
+        push = simulation.event_queue.push
+
+        def push_event(event: Event):
+            start = perf_counter()
+            push(event, event.time)
+            self.push_time += perf_counter() - start
+            self.push_count += 1
+            if len(simulation.event_queue) > self.peak_pending:
+                self.peak_pending = len(simulation.event_queue)
+        return push_event
+
+    def timed_pops(self, events: Iterable[Tuple[Event, float]]
+                   ) -> Iterator[Tuple[Event, float]]:
+        iterator = iter(events)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.pop_time += perf_counter() - start
+            self.pop_count += 1
+            yield item
+
+    def timed_process(self, simulation: Simulation
+                      ) -> Callable[[Event], None]:
+        def process(event: Event):
+            self.sample(simulation)
+            push_time = self.push_time
+            start = perf_counter()
+            event.process()
+            self.record(event, perf_counter() - start
+                        - (self.push_time - push_time))
+        return process
+
+    def report(self, simulation: Simulation) -> Dict[str, Any]:
+        return {
+            'run_time': self.run_time,
+            'processed_events': simulation.processed_events,
+            'events': {
+                name: {'count': count,
+                       'total_time': self.process_times[name],
+                       'mean_time': self.process_times[name] / count}
+                for name, count in sorted(self.counts.items())},
+            'event_list': {'backend': simulation.event_list,
+                           'push_count': self.push_count,
+                           'push_time': self.push_time,
+                           'pop_count': self.pop_count,
+                           'pop_time': self.pop_time},
+            'stats_time': self.stats_time,
+            'peak_pending_events': self.peak_pending,
+            'queue_lengths': {
+                'interval': self.sample_interval,
+                'columns': ['time', 'pending_events'] + [
+                    n for n, _ in simulation.named_queues],
+                'samples': self.samples}
+        }
@@ -1,13 +1,84 @@
-from itertools import accumulate
-from random import random
-from typing import Iterable, TypeVar
+from hashlib import sha256
+from random import Random, SystemRandom
+from typing import Dict, Generic, Iterable, Sequence, TypeVar
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 T = TypeVar('T')
 
+STREAMS = ('t_che', 't_cad', 't_tri', 't_ate', 't_exa',
+           'p_pri', 'p_pro', 'p_que')
+
+
+def new_seed() -> int:
+    return SystemRandom().getrandbits(32)
+
+
+def derive_seed(seed: int, replication: int, stream: str) -> int:
+    digest = sha256(f'{seed}:{replication}:{stream}'.encode()).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class AntitheticRandom(Random):
+    """Random returning 1 - u for each uniform u of the plain generator.
+
+    A replication run on these streams is the antithetic twin of the one
+    run on the plain streams with the same seed.
+    """
+
+    def random(self) -> float:
+        return 1.0 - super().random()
+
+
+def make_streams(seed: int, replication: int,
+                 antithetic: bool = False) -> Dict[str, Random]:
+    type_ = AntitheticRandom if antithetic else Random
+    return {s: type_(derive_seed(seed, replication, s)) for s in STREAMS}
+
+
+def make_generators(
+        seed: int, replication: int,
+        streams: Iterable[str]) -> Dict[str, 'numpy.random.Generator']:
+    if numpy is None:
+        raise RuntimeError('numpy is required for block sampling')
+    return {s: numpy.random.default_rng(derive_seed(seed, replication, s))
+            for s in streams}
+
+
+class AliasTable(Generic[T]):
+    """Walker's alias method for sampling values with fixed weights.
+
+    The table is built once in O(n) and each sample costs a single random
+    number and at most two lookups.
+    """
+
+    def __init__(self, weights: Sequence[float], values: Sequence[T]):
+        size = len(weights)
+        total = sum(weights)
+        if size != len(values) or total <= 0:
+            raise ValueError('Invalid weights')
+        scaled = [w * size / total for w in weights]
+        prob = [1.0] * size
+        alias = list(range(size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        self._size = size
+        self._prob = prob
+        self._alias = [values[i] for i in alias]
+        self._values = list(values)
 
-def roulette(weights: Iterable[float], values: Iterable[T]) -> T:
-    result = random() * sum(weights)
-    for weight, value in zip(accumulate(weights), values):
-        if result <= weight:
-            return value
-    raise ValueError('Invalid weights')
+    def sample(self, rng: Random) -> T:
+        value = rng.random() * self._size
+        index = int(value)
+        if value - index < self._prob[index]:
+            return self._values[index]
+        return self._alias[index]
@@ -0,0 +1,198 @@
+import io
+import json
+import os
+import socketserver
+import sys
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from multiprocessing.pool import Pool
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO
+
+from simulation.batch import run_tasks
+from simulation.cache import DEFAULT_MAX_SIZE, ResultCache, add_cache_arguments
+from simulation.cli import add_command
+from simulation.config import Config
+from simulation.random import new_seed
+from simulation.simulation import Simulation
+from simulation.sweep import apply, parse_parameter, validate
+
+# Simulation options a request may set.
+REQUEST_OPTIONS = ('sampling', 'block_size', 'event_list', 'synchronize',
+                   'antithetic')
+
+Response = Dict[str, Any]
+
+
+def request_data(request: Dict[str, Any],
+                 base_data: Dict[str, List[str]] = None
+                 ) -> Dict[str, List[str]]:
+    """Config data of a request: the text of a scenario file, config fields
+    or the base config of the server, with single parameter values applied.
+    """
+    if 'scenario' in request:
+        data = Config.read(request['scenario'].splitlines())
+    elif 'config' in request:
+        data = {key.lower().replace(' ', '_'):
+                [str(v) for v in (values if isinstance(values, list)
+                                  else [values])]
+                for key, values in request['config'].items()}
+    elif base_data is not None:
+        data = base_data
+    else:
+        raise ValueError('the request has no scenario or config and the '
+                         'server has no base config')
+    parameters = [parse_parameter(f'{key}={value}') for key, value in
+                  request.get('parameters', {}).items()]
+    for parameter in parameters:
+        if len(parameter.values) != 1:
+            raise ValueError(f'{parameter.name} must have a single value')
+    validate(parameters, data)
+    data = apply(data, parameters, [p.values[0] for p in parameters])
+    Config().load(data)
+    return data
+
+
+def request_options(request: Dict[str, Any]) -> Dict[str, Any]:
+    options = request.get('options', {})
+    for option in options:
+        if option not in REQUEST_OPTIONS:
+            raise ValueError(f'unknown option {option}')
+    return dict(options)
+
+
+class SimulationServer:
+    """Runs the replications asked for by JSON requests on a pool of worker
+    processes kept alive between requests.
+
+    A request is an object with the config (`scenario`, the text of a
+    scenario file, or `config`, its fields by key), optional `parameters`
+    overriding single fields (`{"q_med": 3, "t_ate[1]": 25}`), `seed`,
+    `replications`, `first_replication`, engine `options` and an `id`
+    echoed in the responses. Each replication is answered with its stats
+    as it finishes, in order, followed by a `done` response; a failed
+    request gets an `error` response instead.
+    """
+
+    def __init__(self, base_data: Dict[str, List[str]] = None,
+                 processes: int = None, cache_path: str = None,
+                 cache_size: int = DEFAULT_MAX_SIZE):
+        self.base_data = base_data
+        self.processes = processes
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.pool = None if processes == 1 else Pool(processes)
+
+    def open_cache(self) -> Optional[ResultCache]:
+        # SQLite connections are per thread, so each client opens its own.
+        if self.cache_path is None:
+            return None
+        return ResultCache(self.cache_path, self.cache_size)
+
+    def handle(self, request: Dict[str, Any],
+               cache: ResultCache = None) -> Iterator[Response]:
+        id_ = request.get('id')
+        try:
+            data = request_data(request, self.base_data)
+            options = request_options(request)
+            seed = request.get('seed')
+            if seed is None:
+                seed = new_seed()
+            first = int(request.get('first_replication', 0))
+            replications = int(request.get('replications', 1))
+            tasks = ((0, data, seed, r, options, Simulation)
+                     for r in range(first, first + replications))
+            for _, stats, _ in run_tasks(tasks, self.processes, cache,
+                                         self.pool):
+                yield {'id': id_, 'replication': stats.replication,
+                       'stats': stats.to_dict()}
+        except Exception as e:
+            yield {'id': id_, 'error': f'{type(e).__name__}: {e}'}
+            return
+        yield {'id': id_, 'done': True, 'seed': seed,
+               'replications': replications}
+
+    def serve_lines(self, input: TextIO, output: TextIO):
+        """Answer the requests read one per line until the end of input."""
+        cache = self.open_cache()
+        try:
+            for line in input:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('a request must be a json object')
+                except ValueError as e:
+                    responses = iter(({'id': None, 'error': str(e)},))
+                else:
+                    responses = self.handle(request, cache)
+                for response in responses:
+                    output.write(json.dumps(response) + '\n')
+                    output.flush()
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def serve_socket(self, path: str):
+        """Accept clients on a Unix socket, each served by its own thread on
+        the shared pool, until interrupted.
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(
+                path, _handler(self.serve_lines)) as server:
+            server.daemon_threads = True
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(path)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+def _handler(serve: Callable[[TextIO, TextIO], None]):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve(io.TextIOWrapper(self.rfile, encoding='utf-8'),
+                  io.TextIOWrapper(self.wfile, encoding='utf-8',
+                                   write_through=True))
+
+    return Handler
+
+
+def add_serve_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'serve', serve_command,
+                         'Keep the engine and a pool of worker processes '
+                         'loaded and answer json lines requests for '
+                         'replications, streaming back the stats of each '
+                         'one.')
+    parser.add_argument('--socket', metavar='PATH',
+                        help='listen on a Unix socket instead of reading '
+                        'requests from stdin')
+    parser.add_argument('--base', metavar='CONFIG',
+                        help='config used by requests without a scenario '
+                        'or config of their own')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+    add_cache_arguments(parser)
+
+
+def serve_command(parser: ArgumentParser, args: Namespace):
+    base_data = None
+    if args.base:
+        with open(args.base, 'r') as file:
+            base_data = Config.read(file)
+    server = SimulationServer(base_data, args.processes,
+                              None if args.no_cache else args.cache,
+                              int(args.cache_size * 2 ** 20))
+    try:
+        if args.socket:
+            server.serve_socket(args.socket)
+        else:
+            server.serve_lines(sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
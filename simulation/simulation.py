@@ -1,28 +1,110 @@
 from __future__ import annotations
 
-from typing import Callable, Iterator, List, Set, Tuple, Type, TYPE_CHECKING
+from itertools import chain
+from operator import methodcaller
+from random import Random
+from time import perf_counter
+from typing import (Any, Callable, Deque, Dict, Iterator, List, Optional,
+                    Set, Tuple, Type, TYPE_CHECKING, Union)
 
-from simulation.config import INSTANCE as CONFIG
-from simulation.patient import Patient
-from simulation.patientqueue import PatientQueue
+from simulation.collector import PatientCollector
+from simulation.config import Config
+from simulation.distribution import Distribution
+from simulation.event import ArrivalEndEvent, Event
+from simulation.eventlist import EVENT_LISTS, CalendarQueue, HeapEventList
+from simulation.eventlog import StreamEventLog
+from simulation.patient import Patient, Priority, get_random_need_exams
+from simulation.patientqueue import PatientQueue, QueueSelector
 from simulation.pqueue import PQueue
+from simulation.profiler import Profiler
+from simulation.random import (AliasTable, make_generators, make_streams,
+                               new_seed)
 from simulation.worker import Attendant, Doctor, Nurse, Worker
 
 if TYPE_CHECKING:
-    from simulation.event import Event
+    from simulation.stats import Stats
+
+
+# Bumped whenever a change alters the results of a seeded replication, which
+# invalidates the cached results of older versions.
+ENGINE_VERSION = 1
+DISTRIBUTIONS = ('t_che', 't_cad', 't_tri', 't_ate', 't_exa')
+SAMPLING_MODES = ('scalar', 'block')
+DEFAULT_BLOCK_SIZE = 1024
+
+_process = methodcaller('process')
+
+
+def first_arrival(simulation: Simulation) -> Event:
+    return ArrivalEndEvent(simulation, simulation.new_patient())
 
 
 class Simulation:
-    event_queue: PQueue[Event]
-    event_log: List[Event]
-    initial_event_factory: Callable[[], Event]
+    config: Config
+    seed: int
+    replication: int
+    sampling: str
+    block_size: int
+    event_list: str
+    profiler: Optional[Profiler]
+    synchronize: bool
+    antithetic: bool
+    streams: Dict[str, Random]
+    priorities: AliasTable[Priority]
+    queue_selector: QueueSelector
+    distributions: Dict[str, Distribution]
+    event_queue: Union[HeapEventList[Event], CalendarQueue[Event],
+                       PQueue[Event]]
+    event_log: Optional[Union[Deque[Event], StreamEventLog]]
+    initial_event_factory: Callable[[Simulation], Event]
+    # Called with each event before it is processed, by subclasses that
+    # follow the events.
+    event_hook: Optional[Callable[[Event], None]] = None
+    # File extension batch writes the reports of the replications to, as
+    # csv rows, for subclasses whose report is a flat dict of numbers.
+    report_extension: Optional[str] = None
     register_queue: PatientQueue
     screening_queue: PatientQueue
     consultation_queue: PatientQueue
     exams_queue: PatientQueue
     patients: Set[Patient]
-    workers: Set[Worker]
-    _time: float
+    patient_stats: PatientCollector
+    workers: List[Worker]
+    idle_workers: Dict[Type[Worker], List[Worker]]
+    time: float
+    stats_start: float
+    processed_events: int
+    # Ids given to the next event, patient and worker created.
+    next_event_id: int
+    next_patient_id: int
+    next_worker_id: int
+
+    def __init__(self, config: Config, seed: int = None,
+                 replication: int = 0,
+                 event_log: Union[Deque[Event], StreamEventLog] = None,
+                 sampling: str = 'scalar',
+                 block_size: int = DEFAULT_BLOCK_SIZE,
+                 event_list: str = 'heap', profile: bool = False,
+                 synchronize: bool = False, antithetic: bool = False):
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f'Invalid sampling mode: {sampling}')
+        if event_list not in EVENT_LISTS:
+            raise ValueError(f'Invalid event list: {event_list}')
+        if antithetic and sampling != 'scalar':
+            raise ValueError('Antithetic variates need scalar sampling')
+        self.config = config
+        self.seed = new_seed() if seed is None else seed
+        self.replication = replication
+        self.event_log = event_log
+        self.sampling = sampling
+        self.block_size = block_size
+        self.event_list = event_list
+        self.profiler = Profiler() if profile else None
+        # Draw every activity time of a patient on arrival, so that runs of
+        # different configs with the same seed give each patient the same
+        # times whatever the order in which the activities start.
+        self.synchronize = synchronize
+        self.antithetic = antithetic
 
     @property
     def queues(self) -> Tuple[PatientQueue]:
@@ -36,64 +118,198 @@ class Simulation:
             'consultation_queue', 'exams_queue'))
 
     @property
-    def time(self) -> float:
-        return self._time
+    def end_time(self) -> float:
+        """Time at which the run ends, T TTS after statistics started."""
+        return self.stats_start + self.config.t_tts
 
-    def reset(self, initial_event_factory: Callable[[], Event]):
+    def reset(self, initial_event_factory: Callable[[Simulation], Event]
+              = first_arrival):
         self.initial_event_factory = initial_event_factory
 
-        self._time = 0.0
-        self.register_queue = PatientQueue()
-        self.screening_queue = PatientQueue()
-        self.consultation_queue = PatientQueue()
-        self.exams_queue = PatientQueue()
+        self._bind_streams()
+
+        self.priorities = AliasTable(self.config.p_pri, tuple(Priority))
+        self.queue_selector = QueueSelector(self.config.p_que)
+
+        self.time = 0.0
+        self.stats_start = 0.0
+        self.processed_events = 0
+        self.next_event_id = 1
+        self.next_patient_id = 1
+        self.next_worker_id = 1
+        self.register_queue = self._create_queue()
+        self.screening_queue = self._create_queue()
+        self.consultation_queue = self._create_queue()
+        self.exams_queue = self._create_queue()
 
         self.patients = set()
-        self.workers = set()
+        self.patient_stats = PatientCollector()
+        self.workers = []
+        self.idle_workers = {}
         self._create_workers()
 
-        self.event_log = []
-        self.event_queue = PQueue()
-        self.push_event(self.initial_event_factory())
+        self.event_queue = EVENT_LISTS[self.event_list]()
+        self._next_event = None
+        if self.profiler is not None:
+            self.push_event = self.profiler.timed_push(self)
+        self.push_event(self.initial_event_factory(self))
+
+    def _bind_streams(self):
+        self.streams = make_streams(self.seed, self.replication,
+                                    self.antithetic)
+        if self.sampling == 'block':
+            generators = make_generators(self.seed, self.replication,
+                                         DISTRIBUTIONS)
+            self.distributions = {
+                k: getattr(self.config, k).bind_block(generators[k],
+                                                      self.block_size)
+                for k in DISTRIBUTIONS}
+        else:
+            self.distributions = {
+                k: getattr(self.config, k).bind(self.streams[k])
+                for k in DISTRIBUTIONS}
+
+    def reseed(self, seed: int, replication: int = 0):
+        """Draw the rest of the run from the streams of another seed and
+        replication, keeping the current state.
+        """
+        self.seed = seed
+        self.replication = replication
+        self._bind_streams()
+        for queue in self.queues:
+            queue.rng = self.streams['p_que']
+
+    def reset_stats(self):
+        """Discard the statistics gathered so far, e.g. after a warm-up, and
+        move the end time to T TTS from now.
+
+        Patients still in the system are counted when they leave, with only
+        the time they wait from now on.
+        """
+        self.flush_stats()
+        for patient in self.patients:
+            patient.total_waiting_time = 0.0
+            patient.max_waiting_time = 0.0
+        self.stats_start = self.time
+        self.patient_stats = PatientCollector()
+        for queue in self.queues:
+            queue.reset_stats(self.time)
+        for worker in self.workers:
+            worker.total_idle_time = 0.0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The event log may hold an open file and the profiled push_event
+        # is a closure, neither of which can be pickled.
+        state['event_log'] = None
+        state.pop('push_event', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.profiler is not None:
+            self.push_event = self.profiler.timed_push(self)
 
     def push_event(self, event: Event):
         self.event_queue.push(event, event.time)
 
     def get_idle_workers(self, type_: Type[Worker]) -> Iterator[Worker]:
-        yield from filter(lambda w: isinstance(w, type_) and w.free,
-                          self.workers)
+        for worker_type, workers in self.idle_workers.items():
+            if issubclass(worker_type, type_):
+                yield from workers
+
+    def acquire_worker(self, type_: Type[Worker]) -> Worker:
+        idle = self.idle_workers[type_]
+        if not idle:
+            return None
+        worker = idle.pop()
+        worker.total_idle_time += self.time - worker.idle_since
+        return worker
 
-    def get_idle_worker(self, type_: Type[Worker]) -> Worker:
-        return next(self.get_idle_workers(type_), None)
+    def release_worker(self, worker: Worker):
+        worker.current_event = None
+        worker.idle_since = self.time
+        self.idle_workers[type(worker)].append(worker)
 
-    def run(self):
-        for event, time in self.event_queue:
-            if time > CONFIG.t_tts:
+    def run(self, until: float = None):
+        """Process the events up to `until`, or to the end time. A later call
+        carries on from there.
+        """
+        horizon = self.end_time
+        if until is not None and until < horizon:
+            horizon = until
+        run_start = perf_counter()
+        profiler = self.profiler
+        event_log = self.event_log
+        event_hook = self.event_hook
+        processed = 0
+        events = self.event_queue
+        process = _process
+        if profiler is not None:
+            events = profiler.timed_pops(events)
+            process = profiler.timed_process(self)
+        if self._next_event is not None:
+            events = chain((self._next_event,), events)
+            self._next_event = None
+        for event, time in events:
+            if time > horizon:
+                self._next_event = event, time
                 break
-            delta = time - self._time
-            self._time = time
-            self._update_stats(delta)
-            event.process()
-            self.event_log.append(event)
+            self.time = time
+            if event_hook is not None:
+                event_hook(event)
+            process(event)
+            processed += 1
+            if event_log is not None:
+                event_log.append(event)
+        self.processed_events += processed
+        if profiler is not None:
+            profiler.run_time += perf_counter() - run_start
+
+    def report(self, stats: Stats) -> Optional[Dict[str, Any]]:
+        """Results of the run beside its stats, which must have been
+        calculated at the current time, from subclasses estimating more.
+        """
+        return None
 
     def new_patient(self) -> Patient:
-        patient = Patient()
+        times = None
+        if self.synchronize:
+            times = {k: d.get_value() for k, d in self.distributions.items()}
+        patient = Patient(
+            self.next_patient_id,
+            self.priorities.sample(self.streams['p_pri']),
+            get_random_need_exams(self.config.p_pro, self.streams['p_pro']),
+            times)
+        self.next_patient_id += 1
         self.patients.add(patient)
         return patient
 
+    def release_patient(self, patient: Patient):
+        patient.last_event = patient.current_event
+        patient.current_event = None
+        self.patients.remove(patient)
+        self.patient_stats.add(patient)
+
+    def _create_queue(self) -> PatientQueue:
+        return PatientQueue(self.queue_selector, self.streams['p_que'])
+
     def _create_workers(self):
-        for _ in range(CONFIG.q_atd):
-            self.workers.add(Attendant())
-        for _ in range(CONFIG.q_enf):
-            self.workers.add(Nurse())
-        for _ in range(CONFIG.q_med):
-            self.workers.add(Doctor())
-
-    def _update_stats(self, delta: float):
+        for type_, quantity in ((Attendant, self.config.q_atd),
+                                (Nurse, self.config.q_enf),
+                                (Doctor, self.config.q_med)):
+            workers = [type_(self.next_worker_id + i)
+                       for i in range(quantity)]
+            self.next_worker_id += quantity
+            self.workers.extend(workers)
+            self.idle_workers[type_] = list(reversed(workers))
+
+    def flush_stats(self):
+        start = perf_counter()
         for queue in self.queues:
-            queue.update_stats(delta)
+            queue.flush(self.time)
         for worker in self.get_idle_workers(Worker):
-            worker.total_idle_time += delta
-
-
-INSTANCE = Simulation()
+            worker.total_idle_time += self.time - worker.idle_since
+            worker.idle_since = self.time
+        if self.profiler is not None:
+            self.profiler.stats_time += perf_counter() - start
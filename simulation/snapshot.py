@@ -0,0 +1,68 @@
+import os
+import pickle
+from typing import BinaryIO
+
+from simulation.simulation import ENGINE_VERSION, Simulation
+
+SNAPSHOT_FORMAT = 2
+
+
+def dump_snapshot(simulation: Simulation, file: BinaryIO):
+    """Write the full state of a simulation: clock, pending events, queues,
+    workers, statistics and random streams. The event log is not kept.
+    """
+    pickle.dump({'format': SNAPSHOT_FORMAT, 'engine': ENGINE_VERSION,
+                 'simulation': simulation}, file, pickle.HIGHEST_PROTOCOL)
+
+
+def load_snapshot(file: BinaryIO) -> Simulation:
+    data = pickle.load(file)
+    if data.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f'Unsupported snapshot format: {data.get("format")}')
+    if data.get('engine') != ENGINE_VERSION:
+        raise ValueError(f'Snapshot of engine version {data.get("engine")} '
+                         f'cannot be resumed by version {ENGINE_VERSION}')
+    return data['simulation']
+
+
+def save_snapshot(simulation: Simulation, path: str):
+    """Write a snapshot atomically, so an interrupted checkpoint never
+    replaces the previous one with a truncated file.
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        dump_snapshot(simulation, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def read_snapshot(path: str) -> Simulation:
+    with open(path, 'rb') as file:
+        return load_snapshot(file)
+
+
+def warm_start(path: str, seed: int, replication: int = 0) -> Simulation:
+    """Restore a warmed-up simulation, discard its statistics and draw the
+    rest of the run from the streams of the given seed and replication.
+    """
+    simulation = read_snapshot(path)
+    simulation.reseed(seed, replication)
+    simulation.reset_stats()
+    return simulation
+
+
+def run_with_checkpoints(simulation: Simulation, path: str, interval: float,
+                         until: float = None):
+    """Run like Simulation.run, saving a snapshot to `path` every `interval`
+    units of simulation time.
+    """
+    horizon = simulation.end_time
+    if until is not None and until < horizon:
+        horizon = until
+    checkpoint = simulation.time + interval
+    while checkpoint < horizon:
+        simulation.run(checkpoint)
+        save_snapshot(simulation, path)
+        checkpoint += interval
+    simulation.run(horizon)
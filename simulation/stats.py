@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import ClassVar, Dict, TYPE_CHECKING
+from dataclasses import asdict, dataclass
+from operator import attrgetter
+from typing import Any, ClassVar, Dict, List, TYPE_CHECKING, Union
 
 from simulation.patient import Priority
 
@@ -31,40 +32,47 @@ class Stats:
     max_queue_len_by_queue: Dict[str, int]
     mean_queue_len: float
     mean_queue_len_by_queue: Dict[str, float]
+    waiting_time_by_percentile: Dict[int, float]
+    seed: int
+    replication: int
 
     CSV_COLUMNS: ClassVar = (
         'mean_idle_time', 'mean_idle_time_by_type', 'mean_waiting_time',
         'mean_waiting_time_by_priority', 'mean_waiting_time_by_queue',
         'mean_queue_len', 'mean_queue_len_by_queue', 'max_waiting_time',
         'max_waiting_time_by_priority', 'max_waiting_time_by_queue',
-        'max_queue_len', 'max_queue_len_by_queue')
+        'max_queue_len', 'max_queue_len_by_queue',
+        'waiting_time_by_percentile', 'seed', 'replication')
     PRIORITIES: ClassVar = (1, 2, 3, 4, 5)
+    PERCENTILES: ClassVar = (50, 90, 99)
     QUEUES: ClassVar = ('register_queue', 'screening_queue',
                         'consultation_queue', 'exams_queue')
     WORKERS: ClassVar = ('Attendant', 'Nurse', 'Doctor')
     ORDER: ClassVar = (None, WORKERS, None, PRIORITIES, QUEUES, None, QUEUES,
-                       None, PRIORITIES, QUEUES, None, QUEUES)
+                       None, PRIORITIES, QUEUES, None, QUEUES, PERCENTILES,
+                       None, None)
 
     @staticmethod
     def calculate(simulation: Simulation) -> Stats:
+        simulation.flush_stats()
         total_simulation_time = simulation.time
-        total_patients = len(simulation.patients)
-        patients_by_priority = defaultdict(int)
-        max_waiting_time_by_priority = defaultdict(float)
-        mean_waiting_time = 0.0
+        patient_stats = simulation.patient_stats.copy()
+        # In id order, so the sums do not depend on the set's hash order.
+        for patient in sorted(simulation.patients, key=attrgetter('id')):
+            patient_stats.add(patient)
+        total_patients = patient_stats.total_count
+        patients_by_priority = patient_stats.count
+        max_waiting_time_by_priority = patient_stats.max_waiting_time
+        mean_waiting_time = (sum(patient_stats.total_waiting_time.values()) /
+                             total_patients)
         mean_waiting_time_by_priority = defaultdict(float)
-        for patient in simulation.patients:
-            patients_by_priority[patient.priority.value] += 1
-            max_waiting_time_by_priority[patient.priority.value] = \
-                max(max_waiting_time_by_priority[patient.priority.value],
-                    patient.max_waiting_time)
-            mean_waiting_time += patient.total_waiting_time
-            mean_waiting_time_by_priority[patient.priority.value] += \
-                patient.total_waiting_time
-        mean_waiting_time /= total_patients
         for priority in Priority:
-            mean_waiting_time_by_priority[priority.value] /= \
+            mean_waiting_time_by_priority[priority.value] = \
+                patient_stats.total_waiting_time[priority.value] / \
                 patients_by_priority[priority.value]
+        waiting_time_by_percentile = {
+            p: patient_stats.waiting_time.quantile(p / 100)
+            for p in Stats.PERCENTILES}
 
         total_workers = len(simulation.workers)
         workers_by_type = defaultdict(int)
@@ -75,10 +83,11 @@ class Stats:
             mean_idle_time += worker.total_idle_time
             mean_idle_time_by_type[type(worker).__name__] += \
                 worker.total_idle_time
-        mean_idle_time /= total_workers * simulation.time
+        elapsed_time = simulation.time - simulation.stats_start
+        mean_idle_time /= total_workers * elapsed_time
         for type_ in mean_idle_time_by_type.keys():
             mean_idle_time_by_type[type_] /= \
-                workers_by_type[type_] * simulation.time
+                workers_by_type[type_] * elapsed_time
 
         max_queue_len_by_queue = {}
         mean_queue_len_by_queue = {}
@@ -97,28 +106,63 @@ class Stats:
         return Stats(total_simulation_time, total_patients,
                      dict(patients_by_priority), total_workers,
                      dict(workers_by_type), max_waiting_time,
-                     max_waiting_time_by_priority, max_waiting_time_by_queue,
+                     dict(max_waiting_time_by_priority),
+                     max_waiting_time_by_queue,
                      mean_waiting_time, dict(mean_waiting_time_by_priority),
                      mean_waiting_time_by_queue, mean_idle_time,
                      dict(mean_idle_time_by_type), max_queue_len,
                      max_queue_len_by_queue, mean_queue_len,
-                     mean_queue_len_by_queue)
+                     mean_queue_len_by_queue, waiting_time_by_percentile,
+                     simulation.seed, simulation.replication)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Stats:
+        """Rebuild the stats from to_dict, restoring the integer keys of the
+        priority and percentile dicts that json turns into strings.
+        """
+        data = dict(data)
+        for key, value in data.items():
+            if key.endswith(('_by_priority', '_by_percentile')):
+                data[key] = {int(k): v for k, v in value.items()}
+        return Stats(**data)
+
+    @classmethod
+    def expand_column(cls, value: str) -> List[str]:
+        if value.endswith('_by_priority'):
+            return [value.replace('_by_priority', f'-{p}')
+                    for p in cls.PRIORITIES]
+        if value.endswith('_by_queue'):
+            return [value.replace('_by_queue', f'-{q}') for q in cls.QUEUES]
+        if value.endswith('_by_percentile'):
+            return [value.replace('_by_percentile', f'-p{p}')
+                    for p in cls.PERCENTILES]
+        if value.endswith('_by_type'):
+            return [value.replace('_by_type', f'-{w}') for w in cls.WORKERS]
+        return [value]
+
+    @classmethod
+    def get_columns(cls) -> List[str]:
+        return [c for v in cls.CSV_COLUMNS for c in cls.expand_column(v)]
+
+    def get_values(self) -> List[Union[int, float]]:
+        values = []
+        for value, order in zip(Stats.CSV_COLUMNS, Stats.ORDER):
+            value = self.__dict__[value]
+            if order is None:
+                values.append(value)
+            else:
+                values.extend(value[o] for o in order)
+        return values
+
+    def get_row(self) -> Dict[str, Union[int, float]]:
+        return dict(zip(self.get_columns(), self.get_values()))
 
     @classmethod
     def get_csv_header(cls, separator=DEFAULT_CSV_SEPARATOR) -> str:
-        def expand(value: str) -> str:
-            if value.endswith('_by_priority'):
-                return separator.join(value.replace('_by_priority', f'-{p}')
-                                      for p in cls.PRIORITIES)
-            if value.endswith('_by_queue'):
-                return separator.join(value.replace('_by_queue', f'-{q}')
-                                      for q in cls.QUEUES)
-            if value.endswith('_by_type'):
-                return separator.join(value.replace('_by_type', f'-{w}')
-                                      for w in cls.WORKERS)
-            return str(value)
-
-        return separator.join(expand(c) for c in cls.CSV_COLUMNS)
+        return separator.join(cls.get_columns())
 
     def get_csv(self, separator=DEFAULT_CSV_SEPARATOR) -> str:
         def format_(value) -> str:
@@ -126,13 +170,7 @@ class Stats:
                 return str(value)
             return format(value, '.2f')
 
-        def expand(value, order) -> str:
-            if order is None:
-                return format_(value)
-            return separator.join(format_(value[o]) for o in order)
-
-        return separator.join(expand(self.__dict__[v], o)
-                              for v, o in zip(Stats.CSV_COLUMNS, Stats.ORDER))
+        return separator.join(format_(v) for v in self.get_values())
 
     def __str__(self):
         def format_(value):
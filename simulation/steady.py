@@ -0,0 +1,246 @@
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from simulation.adaptive import DEFAULT_CONFIDENCE, metric_columns
+from simulation.cli import (add_command, add_engine_arguments,
+                            engine_options, write_table)
+from simulation.confidence import RunningStat
+from simulation.config import Config
+from simulation.simulation import Simulation
+from simulation.stats import DEFAULT_CSV_SEPARATOR, Stats
+
+# Observations of a run whose interval is not given, enough for MSER-5 to
+# delete up to half of them and leave several per batch.
+DEFAULT_INTERVALS = 200
+DEFAULT_BATCHES = 20
+MSER_BATCH = 5
+STEADY_COLUMNS = ('metric', 'warmup', 'batches', 'batch_time', 'mean',
+                  'half_width', 'lower', 'upper', 'lag1')
+
+# Running (sum, weight) pairs of a ratio metric; its value over an interval
+# is the ratio of the increments of both.
+Ratio = Tuple[float, float]
+
+
+def cumulative_means(simulation: Simulation) -> Dict[str, Ratio]:
+    """Totals behind every mean_* column of the stats at the current time.
+
+    Waiting times are those of the patients that already left, unlike
+    Stats.calculate, which also counts the patients still inside.
+    """
+    time = simulation.time
+    elapsed = time - simulation.stats_start
+    ratios: Dict[str, Ratio] = {}
+
+    idle: Dict[str, Ratio] = {}
+    for worker in simulation.workers:
+        name = type(worker).__name__
+        total = worker.total_idle_time
+        if worker.current_event is None:
+            total += time - worker.idle_since
+        value, weight = idle.get(name, (0.0, 0.0))
+        idle[name] = value + total, weight + elapsed
+    ratios['mean_idle_time'] = _sum(idle.values())
+    for name in Stats.WORKERS:
+        ratios[f'mean_idle_time-{name}'] = idle.get(name, (0.0, 0.0))
+
+    stats = simulation.patient_stats
+    for priority in Stats.PRIORITIES:
+        ratios[f'mean_waiting_time-{priority}'] = (
+            stats.total_waiting_time[priority], stats.count[priority])
+    ratios['mean_waiting_time'] = _sum(
+        ratios[f'mean_waiting_time-{p}'] for p in Stats.PRIORITIES)
+
+    for name, queue in simulation.named_queues:
+        ratios[f'mean_waiting_time-{name}'] = (queue.total_waiting_time,
+                                               queue.total_patient_count)
+        ratios[f'mean_queue_len-{name}'] = (queue.len_time(time), elapsed)
+    ratios['mean_queue_len'] = (
+        sum(ratios[f'mean_queue_len-{n}'][0] for n in Stats.QUEUES)
+        / len(Stats.QUEUES), elapsed)
+    return ratios
+
+
+def _sum(ratios) -> Ratio:
+    value, weight = 0.0, 0.0
+    for v, w in ratios:
+        value += v
+        weight += w
+    return value, weight
+
+
+def mean_columns(metrics: Sequence[str]) -> List[str]:
+    columns = metric_columns(metrics)
+    for column in columns:
+        if not column.startswith('mean_'):
+            raise ValueError(f'{column} is not a mean, only mean_* metrics '
+                             'have steady-state estimates')
+    return columns
+
+
+def mser(values: Sequence[float]) -> int:
+    """Truncation point minimizing the MSER statistic, searched over the
+    first half of the series.
+    """
+    n = len(values)
+    best, best_score = 0, float('inf')
+    total = total_squares = 0.0
+    suffix = []
+    for value in reversed(values):
+        total += value
+        total_squares += value * value
+        suffix.append((total, total_squares))
+    suffix.reverse()
+    for d in range(n // 2 + 1):
+        total, total_squares = suffix[d]
+        size = n - d
+        score = (total_squares - total * total / size) / (size * size)
+        if score < best_score:
+            best, best_score = d, score
+    return best
+
+
+def _ratios(increments: Sequence[Ratio], size: int) -> List[float]:
+    values = []
+    last = 0.0
+    for start in range(0, len(increments) - size + 1, size):
+        value, weight = _sum(increments[start:start + size])
+        # Intervals without observations keep the previous value.
+        last = value / weight if weight else last
+        values.append(last)
+    return values
+
+
+class SteadyState(NamedTuple):
+    warmup: float  # Simulation time deleted at the start
+    batch_time: float
+    batches: RunningStat
+    lag1: float  # Lag 1 autocorrelation of the batch means
+
+
+def warmup_length(increments: Sequence[Ratio]) -> int:
+    """Number of intervals to delete, by MSER-5."""
+    return mser(_ratios(increments, MSER_BATCH)) * MSER_BATCH
+
+
+def batch_means(increments: Sequence[Ratio], interval: float, batches: int,
+                warmup: int) -> SteadyState:
+    """Split the intervals after the warm-up into `batches` non-overlapping
+    batches, deleting a few more intervals if they do not divide evenly.
+    """
+    size = max((len(increments) - warmup) // batches, 1)
+    start = max(len(increments) - size * batches, 0)
+    means = _ratios(increments[start:], size)
+    stat = RunningStat()
+    for mean in means:
+        stat.add(mean)
+    return SteadyState(start * interval, size * interval, stat, _lag1(means))
+
+
+def _lag1(values: Sequence[float]) -> float:
+    n = len(values)
+    if n < 3:
+        return float('nan')
+    mean = sum(values) / n
+    denominator = sum((v - mean) ** 2 for v in values)
+    if not denominator:
+        return 0.0
+    return sum((a - mean) * (b - mean)
+               for a, b in zip(values, values[1:])) / denominator
+
+
+def run_steady_state(
+        simulation: Simulation, metrics: Sequence[str],
+        interval: float = None,
+        batches: int = DEFAULT_BATCHES) -> Dict[str, SteadyState]:
+    """Run a reset simulation to its end time, recording the metric totals
+    every `interval` (by default, DEFAULT_INTERVALS times over the run),
+    and estimate the steady-state mean of each metric.
+
+    The warm-up deleted is the longest one found among the metrics, so all
+    estimates cover the same part of the run.
+    """
+    columns = mean_columns(metrics)
+    if interval is None:
+        intervals = DEFAULT_INTERVALS
+        interval = simulation.config.t_tts / intervals
+    else:
+        intervals = int(simulation.config.t_tts // interval)
+    if intervals < 2 * batches:
+        raise ValueError('The run is too short for the number of batches')
+    increments: Dict[str, List[Ratio]] = {c: [] for c in columns}
+    last = {c: (0.0, 0.0) for c in columns}
+    for k in range(1, intervals + 1):
+        until = simulation.stats_start + k * interval
+        simulation.run(until)
+        simulation.time = until
+        ratios = cumulative_means(simulation)
+        for column in columns:
+            value, weight = ratios[column]
+            increments[column].append((value - last[column][0],
+                                       weight - last[column][1]))
+            last[column] = ratios[column]
+
+    warmup = max(warmup_length(i) for i in increments.values())
+    return {c: batch_means(increments[c], interval, batches, warmup)
+            for c in columns}
+
+
+def get_steady_state_csv(results: Dict[str, SteadyState],
+                         confidence: float = DEFAULT_CONFIDENCE,
+                         separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+    lines = [separator.join(STEADY_COLUMNS)]
+    for column, result in results.items():
+        batches = result.batches
+        half_width = batches.half_width(confidence)
+        lines.append(separator.join((
+            column, format(result.warmup, '.2f'), str(batches.count),
+            format(result.batch_time, '.2f'),
+            *(format(v, '.4f') for v in (
+                batches.mean, half_width, batches.mean - half_width,
+                batches.mean + half_width, result.lag1)))))
+    return '\n'.join(lines)
+
+
+def add_steady_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'steady', steady_command,
+                         'Estimate steady-state means from one long run, '
+                         'deleting the warm-up found by MSER-5 and using '
+                         'non-overlapping batch means.')
+    parser.add_argument('config', nargs='?', default='config.txt')
+    parser.add_argument('-m', '--metric', action='append', required=True,
+                        help='mean_* csv column or stats field, e.g. '
+                        'mean_queue_len_by_queue')
+    parser.add_argument('--horizon', type=float, default=None,
+                        metavar='MINUTES',
+                        help='length of the run (default: T TTS)')
+    parser.add_argument('--interval', type=float, default=None,
+                        metavar='MINUTES',
+                        help='simulation time between observations '
+                        f'(default: the horizon over {DEFAULT_INTERVALS})')
+    parser.add_argument('--batches', type=int, default=DEFAULT_BATCHES)
+    parser.add_argument('--confidence', type=float,
+                        default=DEFAULT_CONFIDENCE)
+    parser.add_argument('-o', '--output', default=None,
+                        help='file the estimates are also written to')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed (default: random)')
+    parser.add_argument('--replication', type=int, default=0)
+    add_engine_arguments(parser)
+
+
+def steady_command(parser: ArgumentParser, args: Namespace):
+    config = Config()
+    with open(args.config, 'r') as file:
+        config.parse(file)
+    if args.horizon is not None:
+        config.t_tts = args.horizon
+    simulation = Simulation(config, args.seed, args.replication,
+                            **engine_options(args))
+    simulation.reset()
+    try:
+        results = run_steady_state(simulation, args.metric, args.interval,
+                                   args.batches)
+    except ValueError as e:
+        parser.error(str(e))
+    write_table(get_steady_state_csv(results, args.confidence), args.output)
@@ -0,0 +1,232 @@
+import re
+import sys
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from itertools import product
+from math import floor
+from random import Random
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from simulation.analytic import analyze, max_utilization
+from simulation.batch import run_tasks
+from simulation.cache import ResultCache, add_cache_arguments, open_cache
+from simulation.cli import add_command, add_engine_arguments, engine_options
+from simulation.config import Config
+from simulation.random import new_seed
+from simulation.simulation import Simulation
+from simulation.stats import DEFAULT_CSV_SEPARATOR, Stats
+
+INTEGER_KEYS = ('q_med', 'q_enf', 'q_atd')
+
+PARAMETER_PATTERN = re.compile(r'([a-z]+)[ _]([a-z]+)(?:\[(\d+)\])?\s*=(.*)',
+                               re.IGNORECASE)
+
+Point = Tuple[str, ...]
+
+
+class Parameter(NamedTuple):
+    key: str  # Config key, e.g. 't_ate'
+    index: int  # Position of the swept value in the key's fields
+    values: Tuple[str, ...]  # Grid values
+    bounds: Optional[Tuple[float, float]]  # Range sampled by lhs
+
+    @property
+    def name(self) -> str:
+        return f'{self.key}[{self.index}]' if self.index else self.key
+
+
+def parse_parameter(spec: str) -> Parameter:
+    """Parse KEY[INDEX]=VALUES, where VALUES is a comma separated list or
+    an inclusive START:STOP[:STEP] range.
+
+    INDEX selects the field of the key, so `t_ate[1]=5:10` sweeps the first
+    parameter of the consultation time distribution and `t_ate=NOR,EXP`
+    its name.
+    """
+    match = PARAMETER_PATTERN.fullmatch(spec.strip())
+    if match is None:
+        raise ValueError(f'invalid parameter {spec!r}, expected '
+                         'KEY[INDEX]=VALUES')
+    first, second, index, values = match.groups()
+    key = f'{first}_{second}'.lower()
+    index = int(index) if index else 0
+    values = values.strip()
+    if ':' not in values:
+        return Parameter(key, index, tuple(v.strip() for v in
+                                           values.split(',')), None)
+
+    try:
+        fields = [float(v) for v in values.split(':')]
+    except ValueError:
+        fields = []
+    if len(fields) not in (2, 3) or (len(fields) == 3 and fields[2] <= 0):
+        raise ValueError(f'invalid range {values!r} for {key}, expected '
+                         'START:STOP[:STEP] with a positive STEP')
+    start, stop, step = fields if len(fields) == 3 else fields + [1.0]
+    if stop < start:
+        raise ValueError(f'empty range {values!r} for {key}')
+    integral = start.is_integer() and step.is_integer()
+    size = floor((stop - start) / step + 1e-9) + 1
+    return Parameter(key, index,
+                     tuple(_format(start + i * step, integral)
+                           for i in range(size)), (start, stop))
+
+
+def _format(value: float, integral: bool) -> str:
+    if integral:
+        return str(round(value))
+    return format(value, '.6g')
+
+
+def validate(parameters: Sequence[Parameter],
+             base_data: Dict[str, List[str]]):
+    for parameter in parameters:
+        if parameter.key not in base_data:
+            raise ValueError(f'unknown config key {parameter.key}')
+        if parameter.index >= len(base_data[parameter.key]):
+            raise ValueError(f'{parameter.name} is out of range, '
+                             f'{parameter.key} has '
+                             f'{len(base_data[parameter.key])} fields')
+
+
+def grid(parameters: Sequence[Parameter]) -> List[Point]:
+    return list(product(*(p.values for p in parameters)))
+
+
+def latin_hypercube(parameters: Sequence[Parameter], size: int,
+                    rng: Random) -> List[Point]:
+    """Sample `size` points so that each parameter has exactly one value in
+    each of `size` equal strata of its range (or of its list of values, or
+    of the integers of the range of a staff key).
+    """
+    columns = []
+    for parameter in parameters:
+        strata = list(range(size))
+        rng.shuffle(strata)
+        column = []
+        for stratum in strata:
+            u = (stratum + rng.random()) / size
+            if parameter.bounds is None:
+                column.append(
+                    parameter.values[floor(u * len(parameter.values))])
+            elif parameter.key in INTEGER_KEYS:
+                # Equal strata over the integers of the range, so that the
+                # end values are not drawn half as often.
+                low, high = (round(b) for b in parameter.bounds)
+                column.append(str(low + floor(u * (high - low + 1))))
+            else:
+                low, high = parameter.bounds
+                column.append(_format(low + u * (high - low), False))
+        columns.append(column)
+    return list(zip(*columns))
+
+
+def apply(base_data: Dict[str, List[str]], parameters: Sequence[Parameter],
+          point: Point) -> Dict[str, List[str]]:
+    data = {key: list(values) for key, values in base_data.items()}
+    for parameter, value in zip(parameters, point):
+        data[parameter.key][parameter.index] = value
+    return data
+
+
+def get_csv_header(parameters: Sequence[Parameter],
+                   separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+    return separator.join([p.name for p in parameters] + ['point']
+                          + [Stats.get_csv_header(separator)])
+
+
+def run_sweep(base_data: Dict[str, List[str]],
+              parameters: Sequence[Parameter], points: Sequence[Point],
+              replications: int, output: str, processes: int = None,
+              seed: int = None, options: Dict[str, Any] = None,
+              cache: ResultCache = None,
+              screen: float = None) -> List[int]:
+    """Run every point of the sweep and write one csv row per replication,
+    prefixed by the parameter values of its point.
+
+    All points share the master seed, so they are compared under the same
+    random number streams. With `screen`, the points whose analytic
+    utilization of some group of workers reaches it are not simulated;
+    their indexes are returned.
+    """
+    if seed is None:
+        seed = new_seed()
+    if options is None:
+        options = {}
+    validate(parameters, base_data)
+    data = [apply(base_data, parameters, point) for point in points]
+    pruned = []
+    for index, (point, point_data) in enumerate(zip(points, data)):
+        config = Config()
+        try:
+            config.load(point_data)
+        except (ValueError, KeyError) as e:
+            raise ValueError(f'invalid point {point}: {e}') from e
+        if screen is not None and max_utilization(analyze(config)) >= screen:
+            pruned.append(index)
+
+    skipped = set(pruned)
+    tasks = ((i, d, seed, r, options, Simulation) for i, d in enumerate(data)
+             if i not in skipped for r in range(replications))
+    with open(output, 'w') as out:
+        out.write(get_csv_header(parameters) + '\n')
+        for index, stats, _ in run_tasks(tasks, processes, cache):
+            out.write(DEFAULT_CSV_SEPARATOR.join(
+                points[index] + (str(index), stats.get_csv())) + '\n')
+            out.flush()
+    return pruned
+
+
+def add_sweep_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'sweep', sweep_command,
+                         'Run replications of a base config over a grid or '
+                         'a Latin hypercube sample of parameter values and '
+                         'write one combined table.')
+    parser.add_argument('base', nargs='?', default='config.txt')
+    parser.add_argument('-p', '--param', action='append', required=True,
+                        metavar='KEY[INDEX]=VALUES',
+                        help='values of a config key as a list (q_med=2,3,4) '
+                        'or an inclusive range (t_che[1]=0.05:0.2:0.05); '
+                        'INDEX selects a distribution parameter')
+    parser.add_argument('--lhs', type=int, metavar='N',
+                        help='run N Latin hypercube points sampled from the '
+                        'ranges instead of the full grid')
+    parser.add_argument('-n', '--replications', type=int, default=10)
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', default='sweep.csv')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed shared by every point '
+                        '(default: random)')
+    parser.add_argument('--screen', type=float, metavar='UTILIZATION',
+                        help='skip the points whose analytic utilization '
+                        'of some group of workers reaches this value, e.g. '
+                        '1 for the unstable ones')
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+
+
+def sweep_command(parser: ArgumentParser, args: Namespace):
+    try:
+        parameters = [parse_parameter(p) for p in args.param]
+    except ValueError as e:
+        parser.error(str(e))
+    seed = new_seed() if args.seed is None else args.seed
+    if args.lhs:
+        points = latin_hypercube(parameters, args.lhs, Random(seed))
+    else:
+        points = grid(parameters)
+    with open(args.base, 'r') as file:
+        base_data = Config.read(file)
+    result_cache = open_cache(args)
+    try:
+        pruned = run_sweep(base_data, parameters, points, args.replications,
+                           args.output, args.processes, seed,
+                           engine_options(args), result_cache, args.screen)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if result_cache is not None:
+            result_cache.close()
+    if pruned:
+        print(f'Screened out {len(pruned)} of {len(points)} points: '
+              f'{", ".join(map(str, pruned))}', file=sys.stderr)
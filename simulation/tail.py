@@ -0,0 +1,255 @@
+import sys
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from math import exp
+from multiprocessing.pool import Pool
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from simulation.analytic import analyze
+from simulation.batch import run_tasks
+from simulation.cli import (add_command, add_engine_arguments,
+                            engine_options, write_table)
+from simulation.confidence import RunningStat
+from simulation.config import Config
+from simulation.distribution import SCALED
+from simulation.importance import (DEFAULT_DEFENSIVE, ImportanceSimulation,
+                                   Tilts, check_tilts, format_tilts,
+                                   parse_tilt)
+from simulation.random import new_seed
+from simulation.stats import DEFAULT_CSV_SEPARATOR, Stats
+
+# Service times of each type of workers, tilted along with the arrivals when
+# they are the bottleneck.
+SERVICES = {'Attendant': ('t_cad',), 'Nurse': ('t_tri', 't_exa'),
+            'Doctor': ('t_ate',)}
+DEFAULT_WINDOW = 120.0
+DEFAULT_PRIORITIES = (4, 5)  # VERY_URGENT and EMERGENCY
+DEFAULT_STAGES = 5
+DEFAULT_PILOT = 100
+DEFAULT_ELITE = 0.1
+TAIL_COLUMNS = ('priority', 'threshold', 'probability', 'relative_error',
+                'hits', 'replications', 'efficiency')
+
+
+class TailEstimate(NamedTuple):
+    priority: int
+    threshold: float
+    probability: float  # Of max_waiting_time_by_priority above threshold
+    relative_error: float  # Standard error over the probability
+    hits: int  # Replications above the threshold
+    replications: int
+    # Plain replications needed for the same error per tilted one.
+    efficiency: float
+
+
+class TailEstimation(NamedTuple):
+    estimates: List[TailEstimate]
+    tilts: Tilts
+    pilot_replications: int
+
+
+def _run(data: Dict[str, List[str]], tilts: Tilts, seed: int,
+         replications: range, options: Dict[str, Any], processes: int,
+         pool: Pool) -> List[Tuple[Stats, float, Dict[str, List[float]]]]:
+    options = dict(options, tilts=tilts)
+    tasks = ((0, data, seed, r, options, ImportanceSimulation)
+             for r in replications)
+    return [(stats, exp(report['log_likelihood_ratio']), report['variates'])
+            for _, stats, report in run_tasks(tasks, processes, None, pool)]
+
+
+def _level(stats: Stats, priorities: Sequence[int]) -> float:
+    return max(stats.max_waiting_time_by_priority.get(p, 0.0)
+               for p in priorities)
+
+
+def default_tilts(config: Config) -> Tilts:
+    """Starting tilts: the arrivals sped up until the most utilized workers
+    are fully loaded, and their service times, which the pilot stages also
+    tilt, left as they are.
+    """
+    estimates = analyze(config)
+    bottleneck = max(estimates.values(), key=lambda e: e.utilization)
+    tilts = {'t_che': min(bottleneck.utilization, 1.0)}
+    tilts.update((k, 1.0) for k in SERVICES[bottleneck.workers])
+    return {k: v for k, v in tilts.items()
+            if getattr(config, k).name in SCALED}
+
+
+def run_importance(data: Dict[str, List[str]], thresholds: Sequence[float],
+                   priorities: Sequence[int] = DEFAULT_PRIORITIES,
+                   replications: int = 100, tilts: Tilts = None,
+                   window: Optional[float] = DEFAULT_WINDOW,
+                   defensive: float = DEFAULT_DEFENSIVE,
+                   stages: int = DEFAULT_STAGES, pilot: int = DEFAULT_PILOT,
+                   elite: float = DEFAULT_ELITE, seed: int = None,
+                   options: Dict[str, Any] = None,
+                   processes: int = None) -> TailEstimation:
+    """Estimate P(max_waiting_time_by_priority > threshold) for each
+    priority and threshold by importance sampling, with the runs tilted in
+    windows of `window` minutes as in ImportanceSimulation.
+
+    Without tilts, the arrivals and the service times of the workers the
+    analytic estimate finds most utilized are tilted, with factors fitted by
+    the cross-entropy method. Each pilot stage keeps the replications whose
+    longest wait of the priorities reaches the highest threshold, or the
+    top `elite` fraction while there are fewer, and scales every tilted
+    distribution to the mean of their tilted variates weighted by the
+    likelihood ratio. That is the cross-entropy optimum for exponential
+    times and matches the means of the others. The estimates come from
+    replications run after the pilot stages, so they are unbiased whatever
+    tilts were chosen.
+    """
+    if not thresholds:
+        raise ValueError('At least one threshold is required')
+    if seed is None:
+        seed = new_seed()
+    options = dict(options or {}, window=window, defensive=defensive)
+    config = Config()
+    config.load(data)
+    target = max(thresholds)
+
+    pool = None if processes == 1 else Pool(processes)
+    try:
+        first = 0
+        if tilts is None:
+            tilts = default_tilts(config)
+            if not tilts:
+                raise ValueError('None of the arrival and bottleneck service '
+                                 'times can be tilted')
+            check_tilts(config, tilts, defensive)
+            for _ in range(stages):
+                results = _run(data, tilts, seed, range(first, first + pilot),
+                               options, processes, pool)
+                first += pilot
+                levels = sorted(_level(s, priorities) for s, _, _ in results)
+                level = min(target, levels[min(
+                    int((1 - elite) * len(levels)), len(levels) - 1)])
+                tilts = _update(config, tilts, [
+                    (ratio, variates) for stats, ratio, variates in results
+                    if _level(stats, priorities) >= level])
+                if level >= target:
+                    break
+        else:
+            check_tilts(config, tilts, defensive)
+        results = _run(data, tilts, seed, range(first, first + replications),
+                       options, processes, pool)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    estimates = []
+    for priority in priorities:
+        for threshold in sorted(thresholds):
+            stat = RunningStat()
+            hits = 0
+            for stats, ratio, _ in results:
+                hit = stats.max_waiting_time_by_priority.get(
+                    priority, 0.0) > threshold
+                hits += hit
+                stat.add(ratio if hit else 0.0)
+            estimates.append(_estimate(priority, threshold, stat, hits))
+    return TailEstimation(estimates, tilts, first)
+
+
+def _update(config: Config, tilts: Tilts,
+            elites: Sequence[Tuple[float, Dict[str, List[float]]]]
+            ) -> Tilts:
+    updated = {}
+    for key, factor in tilts.items():
+        count = sum(ratio * variates[key][0] for ratio, variates in elites)
+        total = sum(ratio * variates[key][1] for ratio, variates in elites)
+        mean = getattr(config, key).moments()[0]
+        updated[key] = total / count / mean if count and mean else factor
+        if updated[key] <= 0:
+            updated[key] = factor
+    return updated
+
+
+def _estimate(priority: int, threshold: float, stat: RunningStat,
+              hits: int) -> TailEstimate:
+    probability = stat.mean
+    if stat.count < 2 or not probability:
+        return TailEstimate(priority, threshold, probability, float('inf'),
+                            hits, stat.count, float('nan'))
+    error = (stat.variance / stat.count) ** 0.5
+    return TailEstimate(
+        priority, threshold, probability, error / probability, hits,
+        stat.count,
+        probability * (1 - probability) / stat.variance
+        if stat.variance else float('inf'))
+
+
+def get_tail_csv(estimation: TailEstimation,
+                 separator: str = DEFAULT_CSV_SEPARATOR) -> str:
+    lines = [separator.join(TAIL_COLUMNS)]
+    for estimate in estimation.estimates:
+        lines.append(separator.join((
+            str(estimate.priority), format(estimate.threshold, 'g'),
+            format(estimate.probability, '.6g'),
+            format(estimate.relative_error, '.4f'), str(estimate.hits),
+            str(estimate.replications), format(estimate.efficiency, '.4g'))))
+    return '\n'.join(lines)
+
+
+def add_tail_command(subparsers: _SubParsersAction):
+    parser = add_command(subparsers, 'tail', tail_command,
+                         'Estimate the probabilities that the longest wait '
+                         'of a priority exceeds thresholds by importance '
+                         'sampling, with the arrival and service times '
+                         'tilted toward congestion in a window of each run.')
+    parser.add_argument('config', nargs='?', default='config.txt')
+    parser.add_argument('-x', '--threshold', type=float, action='append',
+                        required=True, metavar='MINUTES',
+                        help='waiting time whose excess is estimated '
+                        '(repeatable)')
+    parser.add_argument('-p', '--priority', type=int, action='append',
+                        choices=range(1, 6), metavar='PRIORITY',
+                        help='priority whose longest wait is compared to the '
+                        'thresholds (repeatable, default: 4 and 5)')
+    parser.add_argument('-n', '--replications', type=int, default=100,
+                        help='tilted replications of the estimates')
+    parser.add_argument('--tilt', action='append', default=[],
+                        metavar='KEY=FACTOR',
+                        help='scale of the variates of a distribution, e.g. '
+                        't_ate=1.2 (repeatable; default: chosen by '
+                        'cross-entropy pilot stages)')
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW,
+                        metavar='MINUTES',
+                        help='stretch of each run whose variates are tilted, '
+                        'or 0 for the whole run')
+    parser.add_argument('--defensive', type=float, default=DEFAULT_DEFENSIVE,
+                        help='fraction of the runs left untilted, which '
+                        'bounds the likelihood ratios')
+    parser.add_argument('--stages', type=int, default=DEFAULT_STAGES,
+                        help='most pilot stages choosing the tilts')
+    parser.add_argument('--pilot', type=int, default=DEFAULT_PILOT,
+                        help='replications per pilot stage')
+    parser.add_argument('--elite', type=float, default=DEFAULT_ELITE,
+                        help='fraction of the pilot replications the tilts '
+                        'are fitted to')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='file the table is also written to')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed of the replications '
+                        '(default: random)')
+    add_engine_arguments(parser)
+
+
+def tail_command(parser: ArgumentParser, args: Namespace):
+    with open(args.config, 'r') as file:
+        data = Config.read(file)
+    try:
+        tilts = dict(parse_tilt(spec) for spec in args.tilt) or None
+        estimation = run_importance(
+            data, args.threshold, args.priority or DEFAULT_PRIORITIES,
+            args.replications, tilts, args.window or None, args.defensive,
+            args.stages, args.pilot, args.elite, args.seed,
+            engine_options(args), args.processes)
+    except ValueError as e:
+        parser.error(str(e))
+    write_table(get_tail_csv(estimation), args.output)
+    print(f'Tilts {format_tilts(estimation.tilts)} after '
+          f'{estimation.pilot_replications} pilot replications',
+          file=sys.stderr)
@@ -0,0 +1,479 @@
+from math import inf
+from typing import Callable, List, Sequence, Tuple
+
+from simulation.collector import QuantileSketch
+from simulation.config import Config
+from simulation.distribution import BLOCK_FUNCTIONS, numpy
+from simulation.patient import Priority
+from simulation.random import derive_seed, new_seed
+from simulation.simulation import DISTRIBUTIONS
+from simulation.stats import Stats
+
+DEFAULT_LANES = 1024
+SAMPLE_BLOCK = 4096
+INITIAL_CAPACITY = 256
+# Waiting time sketch buckets are kept in a dense array, shifted by this
+# offset; with the default accuracy it spans values from 1e-9 to 8e8.
+SKETCH_OFFSET = 1024
+SCREENING, EXAMS = 0, 1
+EMERGENCY = Priority.EMERGENCY.value
+
+
+class _Sampler:
+    """Variates handed out in slices of numpy blocks."""
+
+    def __init__(self, draw: Callable[[int], 'numpy.ndarray']):
+        self._draw = draw
+        self._block = numpy.empty(0)
+        self._position = 0
+
+    def take(self, n: int) -> 'numpy.ndarray':
+        if self._position + n > len(self._block):
+            self._block = numpy.concatenate((
+                self._block[self._position:],
+                self._draw(max(SAMPLE_BLOCK, n))))
+            self._position = 0
+        values = self._block[self._position:self._position + n]
+        self._position += n
+        return values
+
+
+class _Queues:
+    """One patient queue in every lane, as LIFO stacks by priority."""
+
+    def __init__(self, lanes: int, weights: Sequence[float]):
+        self.weights = numpy.array(weights)
+        self.stack = numpy.zeros((lanes, len(weights), 16), dtype=numpy.int64)
+        self.top = numpy.zeros((lanes, len(weights)), dtype=numpy.int64)
+        self.len = numpy.zeros(lanes, dtype=numpy.int64)
+        self.count = numpy.zeros(lanes, dtype=numpy.int64)
+        self.max_len = numpy.zeros(lanes, dtype=numpy.int64)
+        self.len_time = numpy.zeros(lanes)
+        self.last_time = numpy.zeros(lanes)
+        self.total_waiting_time = numpy.zeros(lanes)
+        self.max_waiting_time = numpy.zeros(lanes)
+
+    def update_len_time(self, lanes: 'numpy.ndarray', time: 'numpy.ndarray'):
+        self.len_time[lanes] += self.len[lanes] * (time
+                                                   - self.last_time[lanes])
+        self.last_time[lanes] = time
+
+    def grow(self):
+        self.stack = numpy.concatenate(
+            (self.stack, numpy.zeros_like(self.stack)), axis=2)
+
+
+class VectorSimulation:
+    """K replications of one config advanced in lockstep.
+
+    The state of every replication (a lane) lives in numpy arrays with one
+    row per lane, and each step processes the next event of all lanes at
+    once. The model is that of Simulation, but the variates come from one
+    numpy generator shared by the lanes, so the lanes are not the
+    replications of the same index run by Simulation; they agree with them
+    in distribution only.
+    """
+
+    def __init__(self, config: Config, lanes: int = DEFAULT_LANES,
+                 seed: int = None, first_replication: int = 0):
+        if numpy is None:
+            raise RuntimeError('numpy is required for the vector engine')
+        self.config = config
+        self.lanes = lanes
+        self.seed = new_seed() if seed is None else seed
+        self.first_replication = first_replication
+
+    def reset(self):
+        config = self.config
+        lanes = self.lanes
+        generator = numpy.random.default_rng(
+            derive_seed(self.seed, self.first_replication, 'vector'))
+        self.samplers = {
+            key: self._block_sampler(generator, getattr(config, key))
+            for key in DISTRIBUTIONS}
+        self.uniform = _Sampler(generator.random)
+        self.priority_cdf = numpy.cumsum(config.p_pri)
+
+        # Column 0 holds the next arrival, the others the end of the
+        # activity of each worker, or inf while the worker is idle.
+        self.attendants = slice(1, 1 + config.q_atd)
+        self.nurses = slice(self.attendants.stop,
+                            self.attendants.stop + config.q_enf)
+        self.doctors = slice(self.nurses.stop,
+                             self.nurses.stop + config.q_med)
+        columns = self.doctors.stop
+        self.pending = numpy.full((lanes, columns), inf)
+        self.serving = numpy.zeros((lanes, columns), dtype=numpy.int64)
+        self.task = numpy.zeros((lanes, columns), dtype=numpy.int8)
+        self.idle_since = numpy.zeros((lanes, columns))
+        self.idle_time = numpy.zeros((lanes, columns))
+        self.time = numpy.zeros(lanes)
+        self.processed_events = numpy.zeros(lanes, dtype=numpy.int64)
+
+        self.patient_count = numpy.zeros(lanes, dtype=numpy.int64)
+        self.priority = numpy.zeros((lanes, INITIAL_CAPACITY),
+                                    dtype=numpy.int8)
+        self.need_exams = numpy.zeros((lanes, INITIAL_CAPACITY), dtype=bool)
+        self.departed = numpy.zeros((lanes, INITIAL_CAPACITY), dtype=bool)
+        self.queued_since = numpy.zeros((lanes, INITIAL_CAPACITY))
+        self.waiting_time = numpy.zeros((lanes, INITIAL_CAPACITY))
+        self.max_waiting_time = numpy.zeros((lanes, INITIAL_CAPACITY))
+
+        self.register_queue = _Queues(lanes, config.p_que)
+        self.screening_queue = _Queues(lanes, config.p_que)
+        self.consultation_queue = _Queues(lanes, config.p_que)
+        self.exams_queue = _Queues(lanes, config.p_que)
+
+        # Aggregates of the patients that left, like PatientCollector.
+        priorities = len(Stats.PRIORITIES)
+        self.sketch = QuantileSketch()
+        self.departed_count = numpy.zeros((lanes, priorities),
+                                          dtype=numpy.int64)
+        self.departed_waiting_time = numpy.zeros((lanes, priorities))
+        self.departed_max_waiting_time = numpy.zeros((lanes, priorities))
+        self.zero_count = numpy.zeros(lanes, dtype=numpy.int64)
+        self.buckets = numpy.zeros((lanes, 2 * SKETCH_OFFSET + 1),
+                                   dtype=numpy.int64)
+
+        every = numpy.arange(lanes)
+        self.next_patient = self._new_patients(every)
+        self.pending[:, 0] = self.samplers['t_che'].take(lanes)
+
+    @staticmethod
+    def _block_sampler(generator: 'numpy.random.Generator',
+                       distribution) -> _Sampler:
+        function = BLOCK_FUNCTIONS[distribution.name]
+        params = distribution.params
+        return _Sampler(lambda n: function(generator, n, *params))
+
+    @property
+    def queues(self) -> Tuple[_Queues, ...]:
+        return (self.register_queue, self.screening_queue,
+                self.consultation_queue, self.exams_queue)
+
+    def run(self):
+        """Process the events of every lane up to the simulation time."""
+        t_tts = self.config.t_tts
+        pending = self.pending
+        active = numpy.arange(self.lanes)
+        nurses, doctors = self.nurses, self.doctors
+        while len(active):
+            columns = pending[active].argmin(1)
+            times = pending[active, columns]
+            finished = times > t_tts
+            if finished.any():
+                active = active[~finished]
+                columns = columns[~finished]
+                times = times[~finished]
+                if not len(active):
+                    break
+            self.time[active] = times
+            self.processed_events[active] += 1
+
+            arrival = columns == 0
+            if arrival.any():
+                self._arrival_end(active[arrival])
+            attendant = ~arrival & (columns < nurses.start)
+            if attendant.any():
+                self._register_end(active[attendant], columns[attendant])
+            nurse = (columns >= nurses.start) & (columns < doctors.start)
+            if nurse.any():
+                lanes, nurse_columns = active[nurse], columns[nurse]
+                exams = self.task[lanes, nurse_columns] == EXAMS
+                if exams.any():
+                    self._exams_end(lanes[exams], nurse_columns[exams])
+                if not exams.all():
+                    self._screening_end(lanes[~exams], nurse_columns[~exams])
+            doctor = columns >= doctors.start
+            if doctor.any():
+                self._consultation_end(active[doctor], columns[doctor])
+
+    def _arrival_end(self, lanes: 'numpy.ndarray'):
+        patients = self.next_patient[lanes]
+        self._start_or_push(lanes, patients, self.attendants, 't_cad',
+                            self.register_queue)
+        self.next_patient[lanes] = self._new_patients(lanes)
+        self.pending[lanes, 0] = (self.time[lanes]
+                                  + self.samplers['t_che'].take(len(lanes)))
+
+    def _register_end(self, lanes: 'numpy.ndarray',
+                      columns: 'numpy.ndarray'):
+        patients = self.serving[lanes, columns]
+        self._next_activity(lanes, columns,
+                            ((self.register_queue, 't_cad', SCREENING),))
+        emergency = self.priority[lanes, patients] == EMERGENCY
+        if emergency.any():
+            self._start_or_push(lanes[emergency], patients[emergency],
+                                self.doctors, 't_ate',
+                                self.consultation_queue)
+        if not emergency.all():
+            self._start_or_push(lanes[~emergency], patients[~emergency],
+                                self.nurses, 't_tri', self.screening_queue,
+                                SCREENING)
+
+    def _screening_end(self, lanes: 'numpy.ndarray',
+                       columns: 'numpy.ndarray'):
+        patients = self.serving[lanes, columns]
+        self._next_activity(lanes, columns,
+                            ((self.screening_queue, 't_tri', SCREENING),
+                             (self.exams_queue, 't_exa', EXAMS)))
+        self._start_or_push(lanes, patients, self.doctors, 't_ate',
+                            self.consultation_queue)
+
+    def _consultation_end(self, lanes: 'numpy.ndarray',
+                          columns: 'numpy.ndarray'):
+        patients = self.serving[lanes, columns]
+        self._next_activity(lanes, columns,
+                            ((self.consultation_queue, 't_ate', SCREENING),))
+        exams = self.need_exams[lanes, patients]
+        if exams.any():
+            self._start_or_push(lanes[exams], patients[exams], self.nurses,
+                                't_exa', self.exams_queue, EXAMS)
+        if not exams.all():
+            self._depart(lanes[~exams], patients[~exams])
+
+    def _exams_end(self, lanes: 'numpy.ndarray', columns: 'numpy.ndarray'):
+        patients = self.serving[lanes, columns]
+        self._next_activity(lanes, columns,
+                            ((self.exams_queue, 't_exa', EXAMS),
+                             (self.screening_queue, 't_tri', SCREENING)))
+        self._depart(lanes, patients)
+
+    def _new_patients(self, lanes: 'numpy.ndarray') -> 'numpy.ndarray':
+        patients = self.patient_count[lanes]
+        self.patient_count[lanes] += 1
+        if patients.max() >= self.priority.shape[1]:
+            self._grow_patients()
+        n = len(lanes)
+        priority = numpy.searchsorted(self.priority_cdf, self.uniform.take(n),
+                                      side='right')
+        self.priority[lanes, patients] = numpy.minimum(priority, 4) + 1
+        self.need_exams[lanes, patients] = (self.uniform.take(n)
+                                            < self.config.p_pro)
+        return patients
+
+    def _grow_patients(self):
+        for name in ('priority', 'need_exams', 'departed', 'queued_since',
+                     'waiting_time', 'max_waiting_time'):
+            array = getattr(self, name)
+            setattr(self, name, numpy.concatenate(
+                (array, numpy.zeros_like(array)), axis=1))
+
+    def _start_or_push(self, lanes: 'numpy.ndarray',
+                       patients: 'numpy.ndarray', workers: slice,
+                       distribution: str, queue: _Queues,
+                       task: int = SCREENING):
+        """Start the activity with an idle worker of the range, in the lanes
+        that have one, and queue the patient in the others.
+        """
+        idle = numpy.isinf(self.pending[lanes, workers])
+        started = idle.any(1)
+        if started.any():
+            started_lanes = lanes[started]
+            columns = idle[started].argmax(1) + workers.start
+            time = self.time[started_lanes]
+            self.idle_time[started_lanes, columns] += (
+                time - self.idle_since[started_lanes, columns])
+            self._assign(started_lanes, columns, patients[started],
+                         distribution, task)
+            queue.count[started_lanes] += 1
+        if not started.all():
+            self._push(queue, lanes[~started], patients[~started])
+
+    def _assign(self, lanes: 'numpy.ndarray', columns: 'numpy.ndarray',
+                patients: 'numpy.ndarray', distribution: str, task: int):
+        self.pending[lanes, columns] = (
+            self.time[lanes] + self.samplers[distribution].take(len(lanes)))
+        self.serving[lanes, columns] = patients
+        self.task[lanes, columns] = task
+
+    def _next_activity(self, lanes: 'numpy.ndarray',
+                       columns: 'numpy.ndarray',
+                       choices: Sequence[Tuple[_Queues, str, int]]):
+        """Give the workers the first patient found in the queues, in order,
+        or release them.
+        """
+        remaining = numpy.ones(len(lanes), dtype=bool)
+        for queue, distribution, task in choices:
+            selected = remaining & (queue.len[lanes] > 0)
+            if selected.any():
+                patients = self._pop(queue, lanes[selected])
+                self._assign(lanes[selected], columns[selected], patients,
+                             distribution, task)
+                remaining &= ~selected
+        if remaining.any():
+            lanes, columns = lanes[remaining], columns[remaining]
+            self.pending[lanes, columns] = inf
+            self.idle_since[lanes, columns] = self.time[lanes]
+
+    def _push(self, queue: _Queues, lanes: 'numpy.ndarray',
+              patients: 'numpy.ndarray'):
+        time = self.time[lanes]
+        queue.update_len_time(lanes, time)
+        index = self.priority[lanes, patients] - 1
+        top = queue.top[lanes, index]
+        if top.max() >= queue.stack.shape[2]:
+            queue.grow()
+        queue.stack[lanes, index, top] = patients
+        queue.top[lanes, index] = top + 1
+        queue.len[lanes] += 1
+        queue.count[lanes] += 1
+        queue.max_len[lanes] = numpy.maximum(queue.max_len[lanes],
+                                             queue.len[lanes])
+        self.queued_since[lanes, patients] = time
+
+    def _pop(self, queue: _Queues, lanes: 'numpy.ndarray') -> 'numpy.ndarray':
+        """Pop a patient in each lane, picking the sub-queue by the queue
+        weights of the non-empty ones, like QueueSelector.
+        """
+        time = self.time[lanes]
+        non_empty = queue.top[lanes] > 0
+        weights = numpy.where(non_empty, queue.weights, 0.0).cumsum(1)
+        unweighted = weights[:, -1] == 0
+        if unweighted.any():
+            # Only sub-queues without weight left: take the first of them.
+            weights[unweighted] = (non_empty[unweighted].cumsum(1) > 0)
+        threshold = self.uniform.take(len(lanes)) * weights[:, -1]
+        index = (weights <= threshold[:, None]).sum(1)
+        top = queue.top[lanes, index] - 1
+        queue.top[lanes, index] = top
+        patients = queue.stack[lanes, index, top]
+
+        queue.update_len_time(lanes, time)
+        queue.len[lanes] -= 1
+        waiting = time - self.queued_since[lanes, patients]
+        queue.total_waiting_time[lanes] += waiting
+        queue.max_waiting_time[lanes] = numpy.maximum(
+            queue.max_waiting_time[lanes], waiting)
+        self.waiting_time[lanes, patients] += waiting
+        self.max_waiting_time[lanes, patients] = numpy.maximum(
+            self.max_waiting_time[lanes, patients], waiting)
+        return patients
+
+    def _depart(self, lanes: 'numpy.ndarray', patients: 'numpy.ndarray'):
+        self.departed[lanes, patients] = True
+        self._collect(lanes, patients)
+
+    def _collect(self, lanes: 'numpy.ndarray', patients: 'numpy.ndarray'):
+        index = self.priority[lanes, patients] - 1
+        waiting = self.waiting_time[lanes, patients]
+        numpy.add.at(self.departed_count, (lanes, index), 1)
+        numpy.add.at(self.departed_waiting_time, (lanes, index), waiting)
+        numpy.maximum.at(self.departed_max_waiting_time, (lanes, index),
+                         self.max_waiting_time[lanes, patients])
+        zero = waiting <= self.sketch.min_value
+        numpy.add.at(self.zero_count, lanes[zero], 1)
+        buckets = numpy.ceil(numpy.log(waiting[~zero])
+                             / self.sketch.log_gamma).astype(numpy.int64)
+        numpy.add.at(self.buckets, (lanes[~zero], numpy.clip(
+            buckets + SKETCH_OFFSET, 0, 2 * SKETCH_OFFSET)), 1)
+
+    def flush_stats(self):
+        """Bring the time integrals and the waiting times of the patients
+        still queued up to the clock of each lane.
+        """
+        every = numpy.arange(self.lanes)
+        time = self.time
+        for queue in self.queues:
+            queue.update_len_time(every, time)
+            slots = numpy.arange(queue.stack.shape[2])
+            lanes, index, slot = numpy.nonzero(
+                slots < queue.top[:, :, None])
+            patients = queue.stack[lanes, index, slot]
+            self.waiting_time[lanes, patients] += (
+                time[lanes] - self.queued_since[lanes, patients])
+            self.queued_since[lanes, patients] = time[lanes]
+        idle = numpy.isinf(self.pending)
+        self.idle_time[idle] += (time[:, None] - self.idle_since)[idle]
+        self.idle_since[idle] = numpy.broadcast_to(
+            time[:, None], idle.shape)[idle]
+
+    def stats(self) -> List[Stats]:
+        """Statistics of every lane, computed as Stats.calculate does; ratios
+        without observations are nan.
+        """
+        self.flush_stats()
+        # Count the patients still inside without marking them as departed.
+        saved = [array.copy() for array in (
+            self.departed_count, self.departed_waiting_time,
+            self.departed_max_waiting_time, self.zero_count, self.buckets)]
+        slots = numpy.arange(self.priority.shape[1])
+        lanes, patients = numpy.nonzero(
+            (slots < self.patient_count[:, None]) & ~self.departed)
+        self._collect(lanes, patients)
+        try:
+            return [self._lane_stats(lane) for lane in range(self.lanes)]
+        finally:
+            (self.departed_count, self.departed_waiting_time,
+             self.departed_max_waiting_time, self.zero_count,
+             self.buckets) = saved
+
+    def _lane_stats(self, lane: int) -> Stats:
+        config = self.config
+        time = float(self.time[lane])
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            count = self.departed_count[lane]
+            waiting = self.departed_waiting_time[lane]
+            total_patients = int(count.sum())
+            mean_waiting_time = float(waiting.sum() / total_patients)
+            mean_by_priority = waiting / count
+
+            sketch = QuantileSketch()
+            buckets = numpy.nonzero(self.buckets[lane])[0]
+            sketch.add_counts(int(self.zero_count[lane]), {
+                int(i) - SKETCH_OFFSET: int(self.buckets[lane, i])
+                for i in buckets})
+
+            idle_time = self.idle_time[lane]
+            workers_by_type = {}
+            mean_idle_time_by_type = {}
+            for name, workers in (('Attendant', self.attendants),
+                                  ('Nurse', self.nurses),
+                                  ('Doctor', self.doctors)):
+                quantity = workers.stop - workers.start
+                if quantity:
+                    workers_by_type[name] = quantity
+                    mean_idle_time_by_type[name] = float(
+                        idle_time[workers].sum() / (quantity * time))
+            total_workers = config.q_atd + config.q_enf + config.q_med
+            mean_idle_time = float(idle_time[1:].sum()
+                                   / (total_workers * time))
+
+            names = Stats.QUEUES
+            max_queue_len_by_queue = {
+                n: int(q.max_len[lane]) for n, q in zip(names, self.queues)}
+            mean_queue_len_by_queue = {
+                n: float(q.len_time[lane] / time)
+                for n, q in zip(names, self.queues)}
+            max_waiting_time_by_queue = {
+                n: float(q.max_waiting_time[lane])
+                for n, q in zip(names, self.queues)}
+            mean_waiting_time_by_queue = {
+                n: float(q.total_waiting_time[lane] / q.count[lane])
+                for n, q in zip(names, self.queues)}
+
+        priorities = Stats.PRIORITIES
+        return Stats(
+            time, total_patients,
+            {p: int(c) for p, c in zip(priorities, count)},
+            total_workers, workers_by_type,
+            max(max_waiting_time_by_queue.values()),
+            {p: float(m) for p, m in zip(
+                priorities, self.departed_max_waiting_time[lane])},
+            max_waiting_time_by_queue, mean_waiting_time,
+            {p: float(m) for p, m in zip(priorities, mean_by_priority)},
+            mean_waiting_time_by_queue, mean_idle_time,
+            mean_idle_time_by_type, max(max_queue_len_by_queue.values()),
+            max_queue_len_by_queue,
+            sum(mean_queue_len_by_queue.values()) / len(names),
+            mean_queue_len_by_queue,
+            {p: sketch.quantile(p / 100) for p in Stats.PERCENTILES},
+            self.seed, self.first_replication + lane)
+
+
+def run_vector_replications(config: Config, lanes: int, seed: int = None,
+                            first_replication: int = 0) -> List[Stats]:
+    simulation = VectorSimulation(config, lanes, seed, first_replication)
+    simulation.reset()
+    simulation.run()
+    return simulation.stats()
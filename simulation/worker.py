@@ -1,21 +1,27 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 
-from simulation.id import generate_id
-
 if TYPE_CHECKING:
     from simulation.event import Event
 
 
-@dataclass(eq=False)
 class Worker:
-
-    id: int = field(default_factory=generate_id)
-    total_idle_time: float = 0.0
-    current_event: Event = None
-    last_event: Event = None
+    __slots__ = ('id', 'total_idle_time', 'idle_since', 'current_event',
+                 'last_event')
+
+    id: int
+    total_idle_time: float
+    idle_since: float
+    current_event: Event
+    last_event: Event
+
+    def __init__(self, id: int):
+        self.id = id
+        self.total_idle_time = 0.0
+        self.idle_since = 0.0
+        self.current_event = None
+        self.last_event = None
 
     @property
     def free(self):
@@ -26,12 +32,12 @@ class Worker:
 
 
 class Attendant(Worker):
-    pass
+    __slots__ = ()
 
 
 class Nurse(Worker):
-    pass
+    __slots__ = ()
 
 
 class Doctor(Worker):
-    pass
+    __slots__ = ()
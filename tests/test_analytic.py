@@ -0,0 +1,43 @@
+import pytest
+
+from simulation.analytic import Station, analyze
+from tests.util import load_config
+
+
+@pytest.mark.parametrize('servers, arrival_rate, wait_probability, mean_wait',
+                         [(1, 0.8, 0.8, 4.0),
+                          (2, 1.0, 1 / 3, 1 / 3),
+                          (3, 2.0, 4 / 9, 4 / 9)])
+def test_mmc(servers, arrival_rate, wait_probability, mean_wait):
+    """Erlang C and the M/M/c mean wait, with unit mean services."""
+    station = Station(servers, arrival_rate, 1.0, 1.0, 1.0)
+    assert station.utilization == pytest.approx(arrival_rate / servers)
+    assert station.wait_probability() == pytest.approx(wait_probability)
+    assert station.mean_wait() == pytest.approx(mean_wait)
+
+
+def test_deterministic_services_halve_the_wait():
+    """Allen-Cunneen is exact for M/D/1: half the M/M/1 wait."""
+    station = Station(1, 0.8, 1.0, 0.0, 1.0)
+    assert station.mean_wait() == pytest.approx(2.0)
+
+
+def test_overloaded_station():
+    station = Station(1, 2.0, 1.0, 1.0, 1.0)
+    assert station.wait_probability() == 1.0
+    assert station.mean_wait() == float('inf')
+
+
+def test_poisson_departures_stay_poisson():
+    assert Station(3, 2.0, 1.0, 1.0, 1.0).departure_scv() == \
+        pytest.approx(1.0)
+
+
+def test_analyze_routes_the_arrivals():
+    config = load_config('config.txt')
+    estimates = analyze(config)
+    rate = 1 / config.t_che.moments()[0]
+    assert estimates['register_queue'].arrival_rate == pytest.approx(rate)
+    assert estimates['consultation_queue'].arrival_rate == pytest.approx(rate)
+    assert estimates['exams_queue'].arrival_rate == \
+        pytest.approx(rate * config.p_pro)
@@ -0,0 +1,47 @@
+import simulation.cache
+from simulation.batch import run_replication
+from simulation.cache import ResultCache, cache_key
+from tests.util import load_config, read_data
+
+
+def test_key_is_stable():
+    data = read_data('config.txt')
+    assert cache_key(data, 1, 0, {}) == cache_key(read_data('config.txt'),
+                                                  1, 0, {})
+
+
+def test_key_changes_with_config_seed_and_replication():
+    data = read_data('config.txt')
+    key = cache_key(data, 1, 0, {})
+    other = dict(data, q_med=['3'])
+    assert cache_key(other, 1, 0, {}) != key
+    assert cache_key(data, 2, 0, {}) != key
+    assert cache_key(data, 1, 1, {}) != key
+
+
+def test_key_changes_with_result_options_only():
+    data = read_data('config.txt')
+    key = cache_key(data, 1, 0, {})
+    assert cache_key(data, 1, 0, {'sampling': 'block'}) != key
+    assert cache_key(data, 1, 0, {'synchronize': True}) != key
+    assert cache_key(data, 1, 0, {'event_list': 'calendar'}) == key
+
+
+def test_key_changes_with_engine_version(monkeypatch):
+    data = read_data('config.txt')
+    key = cache_key(data, 1, 0, {})
+    monkeypatch.setattr(simulation.cache, 'ENGINE_VERSION',
+                        simulation.cache.ENGINE_VERSION + 1)
+    assert cache_key(data, 1, 0, {}) != key
+
+
+def test_round_trip(tmp_path):
+    stats = run_replication(load_config('config.txt'), 1)
+    cache = ResultCache(str(tmp_path / 'results.sqlite3'))
+    try:
+        assert cache.get('key') is None
+        cache.put('key', stats)
+        assert cache.get('key') == stats
+        assert cache.info()['entries'] == 1
+    finally:
+        cache.close()
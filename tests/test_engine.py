@@ -0,0 +1,128 @@
+import csv
+import os
+from collections import defaultdict
+from typing import List
+
+import pytest
+
+from simulation.batch import run_replication
+from simulation.eventlist import EVENT_LISTS
+from simulation.patientqueue import QueueSelector
+from simulation.random import AliasTable
+from simulation.simulation import Simulation
+from tests.util import DATA, load_config
+
+
+def read_reference() -> List[List[str]]:
+    with open(os.path.join(DATA, 'reference.tsv'), 'r') as file:
+        rows = csv.reader((line for line in file if not line.startswith('#')),
+                          delimiter='\t')
+        return list(rows)[1:]
+
+
+@pytest.mark.parametrize('row', read_reference(),
+                         ids=lambda row: f'{row[0]}-{row[1]}')
+def test_matches_reference(row: List[str]):
+    """The stats of seed 11 are those of the engine before the event list
+    (user-009) and the slotted classes (user-010), to the last digit.
+    """
+    scenario, replication, *expected = row
+    stats = run_replication(load_config(scenario), 11, int(replication))
+    assert list(map(repr, stats.get_values())) == expected
+
+
+@pytest.mark.parametrize('event_list', [e for e in EVENT_LISTS
+                                        if e != 'heap'])
+def test_event_lists_agree(event_list: str):
+    config = load_config('scenarios/2.txt')
+    expected = run_replication(config, 11, 1)
+    assert run_replication(config, 11, 1, event_list=event_list) == expected
+
+
+def test_queue_accounting_matches_scanning_the_queues():
+    """The running lengths and waits of the queues (user-003) against
+    summing over the queued patients at every event, as the engine did
+    before.
+    """
+    simulation = Simulation(load_config('scenarios/2.txt'), 11)
+    simulation.reset()
+    queues = simulation.queues
+    len_times = [0.0] * len(queues)
+    last_time = 0.0
+
+    def scan(event):
+        nonlocal last_time
+        for index, queue in enumerate(queues):
+            queued = list(queue.peek_all())
+            assert len(queue) == len(queued)
+            len_times[index] += len(queued) * (simulation.time - last_time)
+        last_time = simulation.time
+
+    simulation.event_hook = scan
+    simulation.run()
+    scan(None)
+    for queue, len_time in zip(queues, len_times):
+        assert queue.len_time(simulation.time) == pytest.approx(len_time)
+        waiting = sum(simulation.time - p.queued_since
+                      for p in queue.peek_all())
+        assert queue.total_waiting_time + waiting == pytest.approx(len_time)
+
+
+def test_idle_workers_match_scanning_the_workers():
+    """The idle worker lists (user-004) hold exactly the free workers of
+    their type, and the idle times add up to the time they spent free.
+    """
+    simulation = Simulation(load_config('scenarios/3.txt'), 11)
+    simulation.reset()
+    idle_times = defaultdict(float)
+    last_time = 0.0
+
+    def scan(event):
+        nonlocal last_time
+        for type_, idle in simulation.idle_workers.items():
+            free = [w for w in simulation.workers
+                    if type(w) is type_ and w.free]
+            assert sorted(w.id for w in idle) == sorted(w.id for w in free)
+            idle_times[type_] += len(free) * (simulation.time - last_time)
+        last_time = simulation.time
+
+    simulation.event_hook = scan
+    simulation.run()
+    scan(None)
+    simulation.flush_stats()
+    for type_, idle_time in idle_times.items():
+        total = sum(w.total_idle_time for w in simulation.workers
+                    if type(w) is type_)
+        assert total == pytest.approx(idle_time)
+
+
+def alias_probabilities(table: AliasTable) -> dict:
+    """Exact probability of each value of an alias table."""
+    probabilities = defaultdict(float)
+    for value, alias, prob in zip(table._values, table._alias, table._prob):
+        probabilities[value] += prob / table._size
+        probabilities[alias] += (1 - prob) / table._size
+    return probabilities
+
+
+@pytest.mark.parametrize('weights', [(10, 25, 30, 15, 20), (1, 2, 4, 8, 16),
+                                     (0, 0, 1, 0, 3), (5,)])
+def test_alias_table_keeps_the_weights(weights):
+    """Alias sampling (user-008) draws differently from the roulette it
+    replaced, so the distribution is checked instead of the draws.
+    """
+    values = [f'v{i}' for i in range(len(weights))]
+    probabilities = alias_probabilities(AliasTable(weights, values))
+    for value, weight in zip(values, weights):
+        assert probabilities[value] == pytest.approx(weight / sum(weights))
+
+
+def test_queue_selector_renormalises_over_non_empty_queues():
+    weights = (1, 2, 4, 8, 16)
+    selector = QueueSelector(weights)
+    for mask in range(1, 1 << len(weights)):
+        indexes = [i for i in range(len(weights)) if mask >> i & 1]
+        total = sum(weights[i] for i in indexes)
+        probabilities = alias_probabilities(selector.tables[mask])
+        for i in indexes:
+            assert probabilities[i] == pytest.approx(weights[i] / total)
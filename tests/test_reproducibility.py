@@ -0,0 +1,24 @@
+from simulation.batch import run_replication, run_tasks
+from simulation.simulation import Simulation
+from tests.util import load_config, read_data
+
+
+def test_same_seed_same_stats():
+    config = load_config('config.txt')
+    assert run_replication(config, 7, 3) == run_replication(config, 7, 3)
+
+
+def test_replications_are_independent():
+    config = load_config('config.txt')
+    first = run_replication(config, 7, 0)
+    assert run_replication(config, 7, 1) != first
+    assert run_replication(config, 8, 0) != first
+
+
+def test_pool_matches_in_process_run():
+    """Seeded replications do not depend on the process running them."""
+    data = read_data('scenarios/1.txt')
+    tasks = [(0, data, 5, r, {}, Simulation) for r in range(4)]
+    in_process = [s for _, s, _ in run_tasks(tasks, processes=1)]
+    pooled = [s for _, s, _ in run_tasks(tasks, processes=2)]
+    assert pooled == in_process
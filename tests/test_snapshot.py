@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import pytest
+
+import simulation.snapshot
+from simulation.batch import run_replication
+from simulation.simulation import Simulation
+from simulation.snapshot import (dump_snapshot, load_snapshot,
+                                 read_snapshot, run_with_checkpoints)
+from simulation.stats import Stats
+from tests.util import load_config
+
+
+def test_restored_run_matches_uninterrupted_run():
+    config = load_config('config.txt')
+    first = Simulation(config, 3, 1)
+    first.reset()
+    first.run(500)
+    file = BytesIO()
+    dump_snapshot(first, file)
+    file.seek(0)
+    restored = load_snapshot(file)
+    restored.run()
+    assert Stats.calculate(restored) == run_replication(config, 3, 1)
+
+
+def test_checkpoints_do_not_change_the_run(tmp_path):
+    config = load_config('config.txt')
+    path = str(tmp_path / 'checkpoint')
+    checkpointed = Simulation(config, 3, 1)
+    checkpointed.reset()
+    run_with_checkpoints(checkpointed, path, 300)
+    expected = run_replication(config, 3, 1)
+    assert Stats.calculate(checkpointed) == expected
+
+    last = read_snapshot(path)
+    assert 900 < last.time <= 1200
+    last.run()
+    assert Stats.calculate(last) == expected
+
+
+def test_other_engine_version_is_rejected(monkeypatch):
+    first = Simulation(load_config('config.txt'), 3)
+    first.reset()
+    first.run(100)
+    file = BytesIO()
+    dump_snapshot(first, file)
+    file.seek(0)
+    monkeypatch.setattr(simulation.snapshot, 'ENGINE_VERSION',
+                        simulation.snapshot.ENGINE_VERSION + 1)
+    with pytest.raises(ValueError):
+        load_snapshot(file)
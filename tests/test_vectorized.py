@@ -0,0 +1,38 @@
+from math import sqrt
+from statistics import mean, stdev
+
+import pytest
+
+from simulation.batch import run_replication
+from tests.util import load_config
+
+pytest.importorskip('numpy')
+
+from simulation.vectorized import run_vector_replications  # noqa: E402
+
+REPLICATIONS = 200
+COLUMNS = ('total_patients', 'mean_waiting_time', 'mean_idle_time',
+           'mean_queue_len', 'max_queue_len')
+
+
+def test_lanes_agree_with_object_engine():
+    """The lanes draw other variates than the replications of Simulation,
+    so only the means of the stats are compared, within four standard
+    errors of their difference.
+    """
+    config = load_config('config.txt')
+    lanes = run_vector_replications(config, REPLICATIONS, 11)
+    objects = [run_replication(config, 11, r) for r in range(REPLICATIONS)]
+    for column in COLUMNS:
+        vector = [getattr(s, column) for s in lanes]
+        object_ = [getattr(s, column) for s in objects]
+        error = sqrt((stdev(vector) ** 2 + stdev(object_) ** 2)
+                     / REPLICATIONS)
+        assert abs(mean(vector) - mean(object_)) < 4 * error, column
+
+
+def test_lanes_are_seeded():
+    config = load_config('config.txt')
+    first = run_vector_replications(config, 4, 11)
+    assert run_vector_replications(config, 4, 11) == first
+    assert [s.replication for s in first] == [0, 1, 2, 3]
@@ -0,0 +1,24 @@
+import os
+from typing import Dict, List
+
+from simulation.config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def scenario_path(name: str) -> str:
+    """Path of a config of the repository: config.txt or scenarios/N.txt."""
+    return os.path.join(ROOT, name)
+
+
+def read_data(name: str) -> Dict[str, List[str]]:
+    with open(scenario_path(name), 'r') as file:
+        return Config.read(file)
+
+
+def load_config(name: str, **overrides) -> Config:
+    config = Config()
+    config.load(read_data(name))
+    config.__dict__.update(overrides)
+    return config